@@ -1,6 +1,44 @@
 from django.contrib import admin
-from .models import Room,Player
+from .models import Room,Player,MatchmakingJob,Match,MatchParticipant,PairStat
+
+
+class RoomAdmin(admin.ModelAdmin):
+    list_display = ('name', 'open_time', 'close_time')
+
+
+class PlayerAdmin(admin.ModelAdmin):
+    list_display = ('name', 'room', 'skill', 'number_of_matches', 'join_time')
+    list_filter = ('skill',)
+    # แสดงชื่อห้องในรายการโดยไม่ query ทีละแถว
+    list_select_related = ('room',)
+
+
+class MatchmakingJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'room', 'engine', 'kind', 'status', 'created_at')
+    list_filter = ('status', 'engine', 'kind')
+    list_select_related = ('room',)
+
+
+class MatchParticipantInline(admin.TabularInline):
+    model = MatchParticipant
+    extra = 0
+    raw_id_fields = ('player',)
+
+
+class MatchAdmin(admin.ModelAdmin):
+    list_display = ('id', 'room', 'shuttlecocks', 'played_at')
+    list_select_related = ('room',)
+    inlines = [MatchParticipantInline]
+
+
+class PairStatAdmin(admin.ModelAdmin):
+    list_display = ('room', 'player_low', 'player_high', 'partnered', 'opposed')
+    list_select_related = ('room', 'player_low', 'player_high')
+
 
 # Register your models here.
-admin.site.register(Room)
-admin.site.register(Player)
\ No newline at end of file
+admin.site.register(Room, RoomAdmin)
+admin.site.register(Player, PlayerAdmin)
+admin.site.register(MatchmakingJob, MatchmakingJobAdmin)
+admin.site.register(Match, MatchAdmin)
+admin.site.register(PairStat, PairStatAdmin)
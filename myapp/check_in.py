@@ -0,0 +1,166 @@
+import codecs
+import csv
+import json
+import re
+
+from django.db import transaction
+
+from .models import Player, Room
+from .serializers import PlayerCheckInSerializer
+from .signals import room_players_changed
+
+MAX_CHECK_IN_ROWS = 500
+CHUNK_SIZE = 8192
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# สิ่งที่ iter_json_rows รอถัดไปใน array
+_OPEN, _FIRST, _ROW, _SEPARATOR, _END = range(5)
+
+
+class CheckInParseError(ValueError):
+    pass
+
+
+def iter_text(stream):
+    """
+    อ่าน body ทีละ chunk และ decode UTF-8 แบบต่อเนื่อง (ตัวอักษรไทยที่ถูกตัดกลาง chunk ยังถูกต้อง)
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    while True:
+        data = stream.read(CHUNK_SIZE)
+        try:
+            text = decoder.decode(data, final=not data)
+        except UnicodeDecodeError:
+            raise CheckInParseError("Request body must be UTF-8")
+        if text:
+            yield text
+        if not data:
+            return
+
+
+def iter_json_rows(stream):
+    """
+    อ่าน JSON array จาก request body ทีละ chunk และคืนทีละแถวทันทีที่ค่าของแถวนั้นครบ
+    ใช้ json.JSONDecoder.raw_decode จึงรับเฉพาะ JSON มาตรฐาน ไม่ซ่อมให้เหมือนข้อความจากโมเดล
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter_text(stream)
+    buffer = ''
+    expect = _OPEN
+    index = 0
+    final = False
+
+    while not final:
+        chunk = next(chunks, None)
+        if chunk is None:
+            final = True
+        else:
+            buffer += chunk
+
+        pos = 0
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos == len(buffer):
+                break
+            char = buffer[pos]
+
+            if expect == _OPEN:
+                if char != '[':
+                    raise CheckInParseError("JSON body must be an array of players")
+                expect = _FIRST
+                pos += 1
+            elif expect == _SEPARATOR:
+                if char not in ',]':
+                    raise CheckInParseError(f"Expected ',' or ']' after row {index}")
+                expect = _ROW if char == ',' else _END
+                pos += 1
+            elif expect == _END:
+                raise CheckInParseError("Unexpected data after the JSON array")
+            elif char == ']':
+                if expect == _ROW:
+                    raise CheckInParseError(f"Trailing comma after row {index}")
+                expect = _END
+                pos += 1
+            else:
+                try:
+                    row, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if final:
+                        raise CheckInParseError(f"Row {index + 1} is not valid JSON")
+                    # ค่าของแถวอาจยังมาไม่ครบ รอ chunk ถัดไป
+                    break
+                if end == len(buffer) and not final:
+                    # ตัวเลขที่อยู่ท้าย chunk อาจยังมีหลักต่อใน chunk ถัดไป
+                    break
+                index += 1
+                yield row
+                pos = end
+                expect = _SEPARATOR
+
+        buffer = buffer[pos:]
+
+    if expect == _OPEN:
+        raise CheckInParseError("JSON body must be an array of players")
+    if expect != _END:
+        raise CheckInParseError("JSON body must be a complete array of players")
+
+
+def iter_lines(stream):
+    # แยกเฉพาะ \n (\r\n ยังอยู่ครบในบรรทัด) เพราะ splitlines จะตัดตัวคั่นอื่นที่อาจอยู่ในชื่อผู้เล่นด้วย
+    pending = ''
+    for chunk in iter_text(stream):
+        lines = (pending + chunk).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    if pending:
+        yield pending
+
+
+def iter_csv_rows(stream):
+    """
+    อ่าน CSV (บรรทัดแรกเป็น header เช่น name,skill) ทีละบรรทัด ช่องว่างถือว่าไม่ได้ส่งค่า
+    """
+    try:
+        for row in csv.DictReader(iter_lines(stream)):
+            yield {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+    except csv.Error as e:
+        raise CheckInParseError(f"Invalid CSV: {e}")
+
+
+def check_in_players(room_id, rows):
+    """
+    ตรวจทุกแถวก่อน แล้วสร้างผู้เล่นทั้งหมดด้วย bulk_create ใน transaction เดียว
+    ถ้ามีแถวที่ไม่ผ่านจะไม่สร้างเลยและคืน error ของแต่ละแถว: (players, errors)
+    """
+    players = []
+    errors = []
+
+    for number, row in enumerate(rows, start=1):
+        if number > MAX_CHECK_IN_ROWS:
+            raise CheckInParseError(f"At most {MAX_CHECK_IN_ROWS} players per request")
+        if not isinstance(row, dict):
+            errors.append({"row": number, "errors": {"non_field_errors": ["Expected an object"]}})
+            continue
+
+        serializer = PlayerCheckInSerializer(data=row)
+        if serializer.is_valid():
+            players.append(Player(room_id=room_id, **serializer.validated_data))
+        else:
+            errors.append({"row": number, "errors": serializer.errors})
+
+    if errors:
+        return [], errors
+    if not players:
+        raise CheckInParseError("No players in request body")
+
+    with transaction.atomic():
+        created = Player.objects.bulk_create(players)
+        Room.objects.filter(pk=room_id).bump_version()
+        # bulk_create ไม่ส่ง post_save จึงต้องแจ้งเองหลัง commit
+        player_ids = [player.id for player in created]
+        transaction.on_commit(
+            lambda: room_players_changed.send(sender=Room, room_id=room_id, player_ids=player_ids)
+        )
+
+    return created, []
@@ -0,0 +1,41 @@
+import hashlib
+
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def room_etag(room_id, version, *parts):
+    """
+    strong ETag จาก version ของห้อง ซึ่งเพิ่มขึ้นทุกครั้งที่ห้องหรือผู้เล่นในห้องเปลี่ยน
+    parts แยก resource ต่างๆ ที่อิงห้องเดียวกัน (เช่น ผู้เล่นแต่ละคน หรือ query string ของรายการ)
+    """
+    return quote_etag("-".join([f"room-{room_id}", f"v{version}", *parts]))
+
+
+def query_variant(request):
+    # รายการที่กรอง/เรียง/แบ่งหน้าต่างกันได้ข้อมูลต่างกัน จึงต้องได้ ETag ต่างกันด้วย
+    query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.lists()))
+    return hashlib.sha1(query.encode()).hexdigest()[:12]
+
+
+def not_modified(request, etag):
+    """
+    คืน 304 ถ้า If-None-Match ตรงกับ etag (เทียบแบบ weak ตาม RFC 9110) ไม่เช่นนั้นคืน None
+    """
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return None
+    tags = {tag.removeprefix('W/') for tag in parse_etags(header)}
+    if '*' in tags or etag in tags:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return None
+
+
+def with_etag(response, etag):
+    if response.status_code == status.HTTP_200_OK:
+        response['ETag'] = etag
+        # ให้ client ถามกลับด้วย If-None-Match ทุกครั้งแทนการใช้ cache ที่อาจล้าสมัย
+        patch_cache_control(response, no_cache=True)
+    return response
@@ -0,0 +1,42 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+
+class PlayerFilterBackend(BaseFilterBackend):
+    """
+    กรองผู้เล่นใน SQL: ?room=<id>, ?skill=S,P- และช่วงจำนวนแมชต์ ?min_matches= / ?max_matches=
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+
+        if 'room' in params:
+            queryset = queryset.filter(room_id=self.integer(params, 'room'))
+        if 'skill' in params:
+            queryset = queryset.filter(skill__in=[s for s in params['skill'].split(',') if s])
+        if 'min_matches' in params:
+            queryset = queryset.filter(number_of_matches__gte=self.integer(params, 'min_matches'))
+        if 'max_matches' in params:
+            queryset = queryset.filter(number_of_matches__lte=self.integer(params, 'max_matches'))
+
+        return queryset
+
+    def integer(self, params, name):
+        try:
+            return int(params[name])
+        except ValueError:
+            raise ValidationError({"error": f"{name} must be an integer"})
+
+
+class StableOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter ที่ต่อท้ายด้วย id เสมอ ลำดับจึงไม่กำกวมเมื่อค่าซ้ำกัน (เช่น number_of_matches)
+    KeysetPagination เก็บค่าทุกคอลัมน์ในลำดับนี้ (รวม id) ลง cursor
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering or any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            return ordering
+        tiebreak = '-id' if ordering[0].startswith('-') else 'id'
+        return [*ordering, tiebreak]
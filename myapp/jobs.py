@@ -0,0 +1,133 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import fast_read, match_results, matchmaking_cache, realtime
+from .models import MatchmakingJob, Player, Room
+from .serializers import RoomSerializer
+from .services.candidates import trim_room_data
+from .services.engines import preferred_provider, provider_registry
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    worker pool ของโปรเซสนี้ จำนวน thread จำกัดตาม MATCHMAKING_JOB_WORKERS
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.MATCHMAKING_JOB_WORKERS,
+                thread_name_prefix='matchmaking-job'
+            )
+        return _executor
+
+
+def submit_job(job_id):
+    # รอให้ transaction ที่สร้าง job commit ก่อน worker จึงจะเห็นแถวในตาราง
+    transaction.on_commit(lambda: get_executor().submit(run_job, job_id))
+
+
+def claimable_jobs():
+    """
+    job ที่รอรัน: queued และ running ที่ค้างนานเกิน MATCHMAKING_JOB_STALE_SECONDS
+    (worker ตายระหว่างรัน job จึงไม่มีใครเปลี่ยนสถานะให้)
+    """
+    stale = timezone.now() - timedelta(seconds=settings.MATCHMAKING_JOB_STALE_SECONDS)
+    return MatchmakingJob.objects.filter(
+        Q(status=MatchmakingJob.STATUS_QUEUED) | Q(status=MatchmakingJob.STATUS_RUNNING, started_at__lt=stale)
+    )
+
+
+def pending_job_ids():
+    # job ที่รอรันเรียงตามเวลาที่สร้าง ใช้รัน job ที่ค้างอยู่หลังรีสตาร์ตเซิร์ฟเวอร์
+    return list(claimable_jobs().order_by('created_at').values_list('id', flat=True))
+
+
+def run_job(job_id):
+    """
+    รัน job หนึ่งรายการ ใช้ตาราง MatchmakingJob เป็นคิว จึงไม่ต้องมี broker ภายนอก
+    """
+    try:
+        # จอง job แบบ atomic เพื่อไม่ให้ worker สองตัวรัน job เดียวกัน
+        # (job ที่ค้าง running ถูกจองใหม่ได้ และ started_at ใหม่ทำให้ worker อื่นจองซ้ำไม่ได้)
+        claimed = claimable_jobs().filter(pk=job_id).update(
+            status=MatchmakingJob.STATUS_RUNNING, started_at=timezone.now()
+        )
+        if not claimed:
+            return
+
+        job = MatchmakingJob.objects.get(pk=job_id)
+        generate = _generate_analysis if job.kind == MatchmakingJob.KIND_ANALYSIS else _generate
+        try:
+            result = generate(job)
+        except Exception as e:
+            result = {"error": str(e)}
+
+        if "error" in result:
+            job.status = MatchmakingJob.STATUS_FAILED
+            job.error = result["error"]
+        else:
+            job.status = MatchmakingJob.STATUS_SUCCEEDED
+        job.result = result
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'result', 'finished_at'])
+
+        if job.kind == MatchmakingJob.KIND_ANALYSIS:
+            realtime.broadcaster.publish_on_commit(job.room_id, lambda: realtime.analysis_event(job))
+
+    except Exception:
+        logger.exception(f"Matchmaking job {job_id} crashed")
+    finally:
+        close_old_connections()
+
+
+def _generate(job):
+    room = Room.objects.with_players().get(pk=job.room_id)
+    room_data = match_results.attach_pair_history(RoomSerializer(room).data)
+
+    if len(room_data['players']) < 4:
+        return {"error": "Need at least 4 players for matchmaking"}
+
+    candidates = trim_room_data(room_data, settings.MATCHMAKING_PROMPT_TOP_K)
+    cache_key = matchmaking_cache.cache_key(room.id, job.engine, candidates['players'])
+    result = matchmaking_cache.get_result(cache_key)
+    if result is None:
+        result = provider_registry.generate_matchmaking(candidates, preferred=preferred_provider(job.engine))
+        if "error" not in result and matchmaking_cache.should_cache(job.engine, result["engine"]):
+            matchmaking_cache.set_result(cache_key, result)
+    return result
+
+
+def _generate_analysis(job):
+    """
+    phase ที่สองของการจับคู่แบบสองขั้น: สร้างคำวิเคราะห์ของทีมใน job.result ด้วย provider เดิม
+    ส่งเฉพาะผู้เล่น 4 คนที่ถูกเลือก (ถ้าผู้เล่นออกจากห้องไปแล้วใช้ข้อมูลในทีมแทน)
+    """
+    teams = job.result
+    selected = [player for team in teams['teams'] for player in team['players']]
+    rows = {
+        row['id']: row for row in
+        fast_read.players_data(fast_read.player_values(Player.objects.filter(id__in=[p['id'] for p in selected])))
+    }
+    players = [rows.get(player['id'], player) for player in selected]
+
+    try:
+        analysis = provider_registry.providers[job.engine].generate_analysis(players, teams)
+    except Exception as e:
+        analysis = {"error": str(e)}
+    if "error" in analysis:
+        # เก็บทีมไว้ใน result ด้วย แม้คำวิเคราะห์จะล้มเหลว
+        return {**teams, "error": analysis["error"]}
+    return {**teams, "analysis": analysis["analysis"]}
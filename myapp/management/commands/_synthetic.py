@@ -0,0 +1,38 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+from myapp.services.local_matchmaking_service import SKILL_ORDER
+
+THAI_NAMES = ['สมชาย', 'สมหญิง', 'สมศรี', 'สมปอง', 'วิชัย', 'มานี', 'ปิติ', 'ชูใจ', 'วีระ', 'นภา']
+
+
+def synthetic_players(size, seed=0):
+    """
+    ผู้เล่นจำลองในรูปแบบเดียวกับ PlayerSerializer สำหรับใช้ใน benchmark
+    """
+    rng = random.Random(seed)
+    # เวลาเข้าร่วมย้อนหลังจากตอนนี้ไม่เกิน 2 ชั่วโมง เหมือน session จริง
+    started = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(minutes=120)
+    players = []
+    for index in range(1, size + 1):
+        joined = started + timedelta(minutes=rng.randint(0, 120))
+        players.append({
+            'id': index,
+            'room': 1,
+            'name': f"{rng.choice(THAI_NAMES)} {index}",
+            'skill': rng.choice(SKILL_ORDER),
+            'join_time': joined.isoformat().replace('+00:00', 'Z'),
+            'number_of_matches': rng.randint(0, 6),
+            'number_of_shuttlecock': rng.randint(0, 6),
+        })
+    return players
+
+
+def synthetic_room_data(size, seed=0):
+    return {
+        'id': 1,
+        'name': f"Synthetic room ({size} players)",
+        'open_time': '18:00:00',
+        'close_time': '22:00:00',
+        'players': synthetic_players(size, seed),
+    }
@@ -0,0 +1,101 @@
+import os
+import tempfile
+import threading
+import time
+from datetime import time as clock
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+from django.db.models import F
+
+from myapp.models import Player, Room
+
+CONFIGS = {
+    # ค่าเดิมของ Django: rollback journal, transaction แบบ DEFERRED และ timeout 5 วินาทีของ sqlite3
+    "default": {},
+    "tuned": settings.SQLITE_OPTIONS,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent record-match style write transactions against temporary SQLite databases "
+        "with Django's default options and with SQLITE_OPTIONS, and report lock errors and throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8, help="Concurrent courts writing results")
+        parser.add_argument("--writes", type=int, default=50, help="Transactions per thread")
+        parser.add_argument("--players", type=int, default=80)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'config':<8} {'ok':>6} {'locked':>7} {'lost':>5} {'elapsed':>9} {'tx/s':>8}")
+        with tempfile.TemporaryDirectory() as directory:
+            for name, sqlite_options in CONFIGS.items():
+                alias = f"bench_{name}"
+                connections.settings[alias] = {
+                    **connections.settings["default"],
+                    "ENGINE": "django.db.backends.sqlite3",
+                    "NAME": os.path.join(directory, f"{name}.sqlite3"),
+                    "CONN_MAX_AGE": 0,
+                    "OPTIONS": sqlite_options,
+                }
+                try:
+                    self.run(alias, name, options)
+                finally:
+                    connections[alias].close()
+                    del connections.settings[alias]
+
+    def run(self, alias, name, options):
+        with connections[alias].schema_editor() as editor:
+            editor.create_model(Room)
+            editor.create_model(Player)
+
+        room = Room.objects.using(alias).create(name="bench", open_time=clock(18), close_time=clock(22))
+        Player.objects.using(alias).bulk_create([
+            Player(room=room, name=f"p{n}", skill="S") for n in range(options["players"])
+        ])
+
+        counts = {"ok": 0, "locked": 0}
+        lock = threading.Lock()
+        barrier = threading.Barrier(options["threads"])
+
+        def court(index):
+            barrier.wait()
+            for _ in range(options["writes"]):
+                try:
+                    self.record_match(alias, room.id)
+                    outcome = "ok"
+                except OperationalError:
+                    outcome = "locked"
+                with lock:
+                    counts[outcome] += 1
+            connections[alias].close()
+
+        threads = [threading.Thread(target=court, args=(i,)) for i in range(options["threads"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        # ทุก transaction ที่สำเร็จต้องเพิ่มจำนวนแมชต์ 4 ครั้ง ถ้าไม่ตรงแปลว่ามี update หาย
+        recorded = sum(Player.objects.using(alias).values_list("number_of_matches", flat=True))
+        lost = counts["ok"] * 4 - recorded
+        self.stdout.write(
+            f"{name:<8} {counts['ok']:>6} {counts['locked']:>7} {lost:>5} "
+            f"{elapsed:>8.2f}s {counts['ok'] / elapsed:>8.1f}"
+        )
+
+    def record_match(self, alias, room_id):
+        # อ่านคิวก่อนแล้วค่อยเขียน เหมือนการจับคู่แล้วบันทึกผล: transaction แบบ DEFERRED
+        # จะต้องยกระดับจาก read lock เป็น write lock ซึ่ง SQLite ตอบ "database is locked" ทันทีถ้ามีคนเขียนอยู่
+        with transaction.atomic(using=alias):
+            queue = Player.objects.using(alias).filter(room_id=room_id).in_queue_order()
+            player_ids = list(queue.values_list("id", flat=True)[:4])
+            Player.objects.using(alias).filter(id__in=player_ids).update(
+                number_of_matches=F("number_of_matches") + 1,
+                number_of_shuttlecock=F("number_of_shuttlecock") + 1,
+            )
@@ -0,0 +1,67 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.management.base import BaseCommand
+
+from myapp.services import http_transport
+
+
+class StubProviderHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 เพื่อให้ client ใช้ keep-alive ได้ และปิด Nagle เพื่อไม่ให้ header กับ body ติด delayed ACK
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    body = json.dumps({"response": "{}", "done": True}).encode("utf-8")
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = "Compare per-call overhead of bare requests.post against the pooled provider transport using a local stub server."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--calls", type=int, default=500)
+
+    def handle(self, *args, **options):
+        calls = options["calls"]
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubProviderHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/api/generate"
+        payload = {"model": "stub", "prompt": "x" * 2000, "stream": False}
+
+        try:
+            results = {
+                "requests.post": self.measure(lambda: requests.post(url, json=payload), calls),
+                "http_transport.post": self.measure(lambda: http_transport.post(url, json=payload), calls),
+            }
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        for name, per_call in results.items():
+            self.stdout.write(f"{name:<22} {per_call * 1000:8.3f} ms/call")
+
+        saved = results["requests.post"] - results["http_transport.post"]
+        self.stdout.write(self.style.SUCCESS(
+            f"pooled transport saves {saved * 1000:.3f} ms per call "
+            f"({saved / results['requests.post'] * 100:.1f}%) over {calls} calls"
+        ))
+
+    def measure(self, call, calls):
+        # เรียกหนึ่งครั้งก่อนเพื่อไม่นับเวลาเปิด pool ครั้งแรก
+        call().raise_for_status()
+        started = time.perf_counter()
+        for _ in range(calls):
+            call().raise_for_status()
+        return (time.perf_counter() - started) / calls
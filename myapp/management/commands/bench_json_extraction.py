@@ -0,0 +1,107 @@
+import json
+import re
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.services.json_scanner import JsonScanner, extract_json
+
+
+def legacy_load_json(text):
+    """
+    ขั้นตอนแบบ regex หลายรอบเดิมของ clean_json_text/fix_json เก็บไว้เป็น baseline ในการวัดเท่านั้น
+    """
+    json_text = text.strip()
+    if "```json" in text:
+        match = re.search(r"```json\s*([\s\S]*?)\s*```", text)
+        if match:
+            json_text = match.group(1).strip()
+    elif "```" in text:
+        match = re.search(r"```\s*([\s\S]*?)\s*```", text)
+        if match:
+            json_text = match.group(1).strip()
+    else:
+        match = re.search(r"(\{[\s\S]*\})", text)
+        if match:
+            json_text = match.group(1).strip()
+
+    try:
+        return json.loads(json_text)
+    except json.JSONDecodeError:
+        fixed = re.sub(r"'([^']*)':\s*", r'"\1": ', json_text)
+        fixed = re.sub(r":\s*'([^']*)'", r': "\1"', fixed)
+        fixed = re.sub(r",\s*}", "}", fixed)
+        fixed = re.sub(r",\s*\]", "]", fixed)
+        fixed = re.sub(r"//.*?\n", "\n", fixed)
+        fixed = fixed.replace('\n', '').replace('\r', '')
+        try:
+            return json.loads(fixed)
+        except json.JSONDecodeError:
+            alt_json = re.findall(r'\{.*\}', fixed, re.DOTALL)
+            if alt_json:
+                return json.loads(alt_json[0])
+            raise
+
+
+def scanner_load_json(text):
+    return json.loads(extract_json(text) or text)
+
+
+def adversarial_outputs(size):
+    """
+    ข้อความตอบกลับที่ทำให้ regex แบบ greedy ทำงานหนัก ขนาดประมาณ size ตัวอักษร
+    """
+    result = {
+        "teams": [{"team_id": 1, "players": [1, 2]}, {"team_id": 2, "players": [3, 4]}],
+        "match": {"team1": 1, "team2": 2},
+        "analysis": "ทีมสมดุลกัน {ระดับ S} " * (size // 20),
+    }
+    body = json.dumps(result, ensure_ascii=False, indent=2)
+    return {
+        "clean": body,
+        "fenced+comments": "```json\n" + body.replace('"match"', '// คู่แข่งขัน\n  "match"').replace("]\n  }", "],\n  }") + "\n```",
+        "prose-braces-after": body + "\nหมายเหตุ: ใช้รูปแบบ {team} " * (size // 30),
+        "truncated-in-analysis": '{"teams": [1, 2], "analysis": "' + "ใช้ {ระดับ " * (size // 10),
+        "single-quotes": body.replace('"', "'"),
+        "truncated": body[: len(body) * 3 // 4],
+    }
+
+
+class Command(BaseCommand):
+    help = "Microbenchmark JSON extraction from model output: legacy regex cleanup vs the single-pass json_scanner."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=4000, help="Approximate size of each adversarial output in characters")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--chunk", type=int, default=16, help="Chunk size for the incremental scanner run")
+
+    def handle(self, *args, **options):
+        repeat = options["repeat"]
+        self.stdout.write(f"{'case':<24} {'chars':>7} {'legacy':>18} {'scanner':>12} {'stream':>12}")
+
+        for name, text in adversarial_outputs(options["size"]).items():
+            legacy = self.measure(legacy_load_json, text, repeat)
+            scanner = self.measure(scanner_load_json, text, repeat)
+            stream = self.measure(lambda t: self.stream_load_json(t, options["chunk"]), text, repeat)
+            self.stdout.write(f"{name:<24} {len(text):>7} {legacy:>18} {scanner:>12} {stream:>12}")
+
+    def stream_load_json(self, text, chunk):
+        scanner = JsonScanner()
+        for i in range(0, len(text), chunk):
+            for _, _, value in scanner.feed(text[i:i + chunk]):
+                return json.loads(value)
+        # ข้อความที่ถูกตัดกลางทางจะ raise TruncatedJsonError (เป็น JSONDecodeError) ที่นี่
+        scanner.finish()
+        raise json.JSONDecodeError("No JSON object found", text, 0)
+
+    def measure(self, load, text, repeat):
+        # เวลาที่ใช้จนล้มเหลวก็นับด้วย เพราะ request ต้องรอจนกว่าจะรู้ว่า parse ไม่ได้
+        failed = False
+        started = time.perf_counter()
+        for _ in range(repeat):
+            try:
+                load(text)
+            except (json.JSONDecodeError, IndexError, TypeError):
+                failed = True
+        elapsed = f"{(time.perf_counter() - started) / repeat * 1000:.3f} ms"
+        return f"fail {elapsed}" if failed else elapsed
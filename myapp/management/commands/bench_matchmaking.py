@@ -0,0 +1,299 @@
+import json
+import os
+import subprocess
+import tempfile
+import time
+from datetime import time as clock
+
+import requests
+from anthropic.types import Message
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from requests.adapters import BaseAdapter
+
+from myapp.models import Player, Room
+from myapp.serializers import RoomSerializer
+from myapp.services.candidates import trim_room_data
+from myapp.services.claude_service import MATCHMAKING_TOOL, ClaudeService
+from myapp.services.huggingface_service import HuggingFaceService
+from myapp.services.local_matchmaking_service import LocalMatchmakingService
+from myapp.services.ollama_service import OllamaService
+
+from ._synthetic import synthetic_players
+
+ROOM_STAGES = ["orm_load", "serialize"]
+PROVIDER_STAGES = ["prompt", "provider_call", "extract", "load_validate"]
+ALIAS = "bench_matchmaking"
+
+
+class CannedAdapter(BaseAdapter):
+    """
+    transport ของ requests ที่ตอบ body เดิมทุกครั้งโดยไม่ออกเครือข่าย ใช้แทน Ollama/Hugging Face
+    """
+
+    def __init__(self, body):
+        super().__init__()
+        self.body = body
+
+    def send(self, request, **kwargs):
+        response = requests.Response()
+        response.status_code = 200
+        response.headers["Content-Type"] = "application/json"
+        response.encoding = "utf-8"
+        response._content = self.body
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+def canned_session(body):
+    session = requests.Session()
+    adapter = CannedAdapter(json.dumps(body, ensure_ascii=False).encode("utf-8"))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class FakeAnthropic:
+    """
+    แทน Anthropic client: serialize request เป็น JSON และสร้าง Message ของ SDK จาก tool input ที่เตรียมไว้
+    จึงนับเวลาแปลง request/response ของ SDK ด้วยแต่ไม่ออกเครือข่าย
+    """
+
+    def __init__(self, result, model):
+        self.message = {
+            "id": "msg_bench",
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": [{"type": "tool_use", "id": "toolu_bench", "name": MATCHMAKING_TOOL["name"], "input": result}],
+            "stop_reason": "tool_use",
+            "stop_sequence": None,
+            "usage": {"input_tokens": 0, "output_tokens": 0},
+        }
+        self.messages = self
+
+    def create(self, **request):
+        json.dumps(request, ensure_ascii=False)
+        return Message.model_validate(self.message)
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {
+        "median_ms": round(ordered[len(ordered) // 2] * 1000, 4),
+        "p95_ms": round(ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))] * 1000, 4),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 4),
+    }
+
+
+def current_commit():
+    try:
+        completed = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True
+        )
+    except OSError:
+        return None
+    return completed.stdout.strip() if completed.returncode == 0 else None
+
+
+class Command(BaseCommand):
+    help = (
+        "Time each stage of the matchmaking pipeline (ORM load, RoomSerializer, prompt, provider call, "
+        "JSON extraction, json.loads + schema validation) for synthetic rooms with fake Anthropic/Ollama/"
+        "Hugging Face clients. Runs offline against a temporary SQLite database; --json prints "
+        "machine-readable results for comparing commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="4,20,100,500", help="Players per room, comma separated")
+        parser.add_argument("--iterations", type=int, default=20, help="Timed runs per stage")
+        parser.add_argument(
+            "--top-k",
+            type=int,
+            default=settings.MATCHMAKING_PROMPT_TOP_K,
+            help="Players kept by trim_room_data before building the prompt (0 sends everyone)."
+        )
+        parser.add_argument("--json", action="store_true", help="Print results as JSON instead of a table")
+        parser.add_argument("--output", help="Also write the JSON results to this file")
+        parser.add_argument("--compare", help="JSON file from an earlier run to compare medians against")
+
+    def handle(self, *args, **options):
+        # ห้องสังเคราะห์อยู่ในฐานข้อมูลชั่วคราว จึงไม่ถือ write lock ของฐานข้อมูลหลักตลอดการวัด
+        with tempfile.TemporaryDirectory() as directory:
+            connections.settings[ALIAS] = {
+                **connections.settings["default"],
+                "ENGINE": "django.db.backends.sqlite3",
+                "NAME": os.path.join(directory, "matchmaking.sqlite3"),
+                "CONN_MAX_AGE": 0,
+            }
+            try:
+                self.run(options)
+            finally:
+                connections[ALIAS].close()
+                del connections.settings[ALIAS]
+
+    def run(self, options):
+        iterations = max(1, options["iterations"])
+        records = []
+
+        with connections[ALIAS].schema_editor() as editor:
+            editor.create_model(Room)
+            editor.create_model(Player)
+
+        for size in [int(size) for size in options["sizes"].split(",")]:
+            room = self.create_room(size)
+            room_data, timings = self.time_room(room.id, iterations)
+            records += self.records(size, None, timings)
+
+            candidates = trim_room_data(room_data, options["top_k"])
+            for name, pipeline in self.pipelines(candidates).items():
+                records += self.records(size, name, self.time_provider(name, pipeline, candidates, iterations))
+
+        report = {
+            "benchmark": "matchmaking_pipeline",
+            "commit": current_commit(),
+            "iterations": iterations,
+            "top_k": options["top_k"],
+            "results": records,
+        }
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+
+        baseline = self.load_baseline(options["compare"]) if options["compare"] else {}
+        if options["json"]:
+            for record in records:
+                previous = baseline.get(self.record_key(record))
+                if previous is not None:
+                    record["baseline_median_ms"] = previous["median_ms"]
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+        else:
+            self.write_table(records, baseline)
+
+    def create_room(self, size):
+        room = Room.objects.using(ALIAS).create(name=f"bench {size}", open_time=clock(18), close_time=clock(22))
+        Player.objects.using(ALIAS).bulk_create([
+            Player(
+                room=room,
+                name=player["name"],
+                skill=player["skill"],
+                number_of_matches=player["number_of_matches"],
+                number_of_shuttlecock=player["number_of_shuttlecock"],
+            )
+            for player in synthetic_players(size)
+        ], batch_size=1000)
+        return room
+
+    def time_room(self, room_id, iterations):
+        timings = {stage: [] for stage in ROOM_STAGES}
+        # รอบแรกไม่นับเวลา (import และ cache ภายในของ Django ตอนเรียกครั้งแรก)
+        for run in range(iterations + 1):
+            started = time.perf_counter()
+            room = Room.objects.using(ALIAS).with_players().get(pk=room_id)
+            loaded = time.perf_counter()
+            room_data = RoomSerializer(room).data
+            serialized = time.perf_counter()
+            if run:
+                timings["orm_load"].append(loaded - started)
+                timings["serialize"].append(serialized - loaded)
+        return room_data, timings
+
+    def pipelines(self, candidates):
+        """
+        (prompt, call, extract, load_validate) ของแต่ละ provider ตอบด้วยผลของ local engine เพื่อให้ขนาดคำตอบใกล้ของจริง
+        extract คือการแยก/ซ่อม JSON จากข้อความ ส่วน load_validate คือ json.loads และตรวจ schema
+        """
+        result = LocalMatchmakingService().generate_matchmaking(candidates)
+        result = {key: result[key] for key in ("teams", "match", "analysis")}
+        text = json.dumps(result, ensure_ascii=False)
+
+        claude = ClaudeService()
+        claude.client = FakeAnthropic(result, claude.model)
+
+        ollama = OllamaService()
+        ollama_session = canned_session({"model": ollama.model, "response": text, "done": True})
+
+        huggingface = HuggingFaceService()
+        # โมเดลที่ไม่ได้ใช้ grammar มักมีข้อความและ code fence รอบ JSON จึงผ่านขั้นแยก JSON ของ json_scanner ด้วย
+        huggingface_session = canned_session([{"generated_text": f"ผลการจับคู่:\n```json\n{text}\n```"}])
+
+        return {
+            claude.name: (
+                claude.build_request,
+                lambda request: claude.client.messages.create(**request),
+                # tool_use ได้ dict มาแล้ว จึงไม่มีข้อความให้แยก
+                lambda message: next(block.input for block in message.content if block.type == "tool_use"),
+                claude.to_result,
+            ),
+            ollama.name: (
+                ollama.build_payload,
+                lambda payload: ollama_session.post(ollama.api_url, json=payload).json().get("response", ""),
+                # structured output ได้ JSON ล้วน load_json จึง parse ตรงโดยไม่สแกน
+                lambda response: response,
+                lambda text: ollama.parse_generated_text(text, {}),
+            ),
+            huggingface.name: (
+                huggingface.build_payload,
+                lambda payload: huggingface_session.post(
+                    huggingface.api_url, headers=huggingface.headers, json=payload
+                ).json()[0]["generated_text"],
+                huggingface.clean_json_text,
+                lambda text: huggingface.parse_generated_text(text, {}),
+            ),
+        }
+
+    def time_provider(self, name, pipeline, candidates, iterations):
+        build, call, extract, load = pipeline
+        timings = {stage: [] for stage in PROVIDER_STAGES}
+        for run in range(iterations + 1):
+            started = time.perf_counter()
+            request = build(candidates)
+            built = time.perf_counter()
+            response = call(request)
+            called = time.perf_counter()
+            data = extract(response)
+            extracted = time.perf_counter()
+            result = load(data)
+            loaded = time.perf_counter()
+            if "error" in result:
+                self.stderr.write(f"{name} ({len(candidates['players'])} candidates): {result['error']}")
+            if run:
+                timings["prompt"].append(built - started)
+                timings["provider_call"].append(called - built)
+                timings["extract"].append(extracted - called)
+                timings["load_validate"].append(loaded - extracted)
+        return timings
+
+    def records(self, size, provider, timings):
+        return [
+            dict({"players": size, "provider": provider, "stage": stage}, **summarize(samples))
+            for stage, samples in timings.items()
+        ]
+
+    def record_key(self, record):
+        return record["players"], record["provider"], record["stage"]
+
+    def load_baseline(self, path):
+        with open(path, encoding="utf-8") as baseline:
+            return {self.record_key(record): record for record in json.load(baseline)["results"]}
+
+    def write_table(self, records, baseline):
+        self.stdout.write(
+            f"{'players':>7} {'provider':<12} {'stage':<14} {'median ms':>10} {'p95 ms':>10}"
+            + (f" {'baseline':>10} {'change':>8}" if baseline else "")
+        )
+        for record in records:
+            line = (
+                f"{record['players']:>7} {record['provider'] or '-':<12} {record['stage']:<14} "
+                f"{record['median_ms']:>10.3f} {record['p95_ms']:>10.3f}"
+            )
+            previous = baseline.get(self.record_key(record))
+            if previous is not None:
+                change = (record["median_ms"] / previous["median_ms"] - 1) * 100 if previous["median_ms"] else 0
+                line += f" {previous['median_ms']:>10.3f} {change:>+7.1f}%"
+            self.stdout.write(line)
@@ -0,0 +1,102 @@
+import os
+import random
+import tempfile
+import time
+from datetime import time as clock
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from myapp.models import Player, Room
+from myapp.services.local_matchmaking_service import SKILL_ORDER
+
+ALIAS = "bench_indexes"
+
+
+class Command(BaseCommand):
+    help = (
+        "Show query plans and timings for the matchmaking queue queries with and without the composite "
+        "Player indexes, using large synthetic rooms in a temporary SQLite database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rooms", type=int, default=50)
+        parser.add_argument("--players", type=int, default=2000, help="Players per room")
+        parser.add_argument("--repeat", type=int, default=200)
+
+    def handle(self, *args, **options):
+        # ลบ index ในฐานข้อมูลชั่วคราวเท่านั้น ฐานข้อมูลหลักไม่ถูกแตะ
+        with tempfile.TemporaryDirectory() as directory:
+            connections.settings[ALIAS] = {
+                **connections.settings["default"],
+                "ENGINE": "django.db.backends.sqlite3",
+                "NAME": os.path.join(directory, "indexes.sqlite3"),
+                "CONN_MAX_AGE": 0,
+            }
+            try:
+                self.run(options)
+            finally:
+                connections[ALIAS].close()
+                del connections.settings[ALIAS]
+
+    def run(self, options):
+        connection = connections[ALIAS]
+        with connection.schema_editor() as editor:
+            editor.create_model(Room)
+            editor.create_model(Player)
+
+        room = self.populate(options["rooms"], options["players"])
+        players = Player.objects.using(ALIAS)
+        queries = {
+            "next-up": lambda: players.filter(room_id=room.id).in_queue_order()[:8],
+            "next-up by skill": lambda: players.filter(room_id=room.id, skill='S').in_queue_order()[:4],
+        }
+
+        self.report("after (composite indexes)", queries, options["repeat"])
+        # ลบ index เพื่อดูแผนแบบเดิม (มีแค่ index ของ FK room)
+        with connection.cursor() as cursor:
+            for index in Player._meta.indexes:
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(index.name)}")
+        self.report("before (room FK index only)", queries, options["repeat"])
+
+    def populate(self, rooms, players):
+        rng = random.Random(0)
+        self.stdout.write(f"creating {rooms} rooms x {players} players ...")
+        for index in range(rooms):
+            room = Room.objects.using(ALIAS).create(
+                name=f"bench room {index}", open_time=clock(18), close_time=clock(22)
+            )
+            Player.objects.using(ALIAS).bulk_create([
+                Player(
+                    room=room,
+                    name=f"p{n}",
+                    skill=rng.choice(SKILL_ORDER),
+                    number_of_matches=rng.randint(0, 12),
+                )
+                for n in range(players)
+            ], batch_size=1000)
+        with connections[ALIAS].cursor() as cursor:
+            # ให้ query planner มีสถิติของตารางใหม่
+            cursor.execute("ANALYZE")
+        return room
+
+    def report(self, title, queries, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for name, build in queries.items():
+            plan = self.explain(build(), title)
+            started = time.perf_counter()
+            for _ in range(repeat):
+                list(build())
+            elapsed = (time.perf_counter() - started) / repeat * 1000
+
+            self.stdout.write(f"  {name}: {elapsed:.3f} ms/query")
+            for line in plan:
+                self.stdout.write(f"    {line}")
+
+    def explain(self, queryset, title):
+        # ไม่ใช้ QuerySet.explain() เพราะ sqlite3 cache statement ที่ SQL เหมือนกันไว้และคืนแผนเดิม
+        # แม้ index จะถูกลบไปแล้ว จึงต่อ comment ตามช่วงการวัดให้ SQL ไม่ซ้ำกัน
+        sql, params = queryset.query.sql_with_params()
+        with connections[ALIAS].cursor() as cursor:
+            cursor.execute(f"{connections[ALIAS].ops.explain_query_prefix()} {sql} /* {title} */", params)
+            return [" ".join(str(column) for column in row) for row in cursor.fetchall()]
@@ -0,0 +1,100 @@
+import time
+from datetime import time as clock
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework import viewsets
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from myapp.filters import PlayerFilterBackend, StableOrderingFilter
+from myapp.models import Player, Room
+from myapp.pagination import KeysetPagination
+from myapp.serializers import PlayerSerializer, RoomSerializer
+from myapp.services.local_matchmaking_service import SKILL_ORDER
+from myapp.views import PlayerViewSet, RoomViewSet
+
+
+class SerializerRoomViewSet(viewsets.ReadOnlyModelViewSet):
+    # วิธีเดิม: RoomSerializer พร้อม PlayerSerializer ซ้อน และ JSONRenderer ของ DRF
+    queryset = Room.objects.with_players()
+    serializer_class = RoomSerializer
+    renderer_classes = [JSONRenderer]
+
+
+class SerializerPlayerViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Player.objects.all()
+    serializer_class = PlayerSerializer
+    pagination_class = KeysetPagination
+    filter_backends = [PlayerFilterBackend, StableOrderingFilter]
+    ordering = ['id']
+    renderer_classes = [JSONRenderer]
+
+
+VIEWS = {
+    "room detail": (
+        SerializerRoomViewSet.as_view({'get': 'retrieve'}),
+        RoomViewSet.as_view({'get': 'retrieve'}),
+        lambda room: (f"/rooms/{room.id}/", {}, {'pk': room.id}),
+    ),
+    "player list": (
+        SerializerPlayerViewSet.as_view({'get': 'list'}),
+        PlayerViewSet.as_view({'get': 'list'}),
+        lambda room: ("/players/", {'room': room.id, 'page_size': 200}, {}),
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests per second of room detail and player list between the DRF serializers and "
+        "the values()-based read path for rooms of 10/100/1000 players. Runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="10,100,1000", help="Players per room, comma separated")
+        parser.add_argument("--seconds", type=float, default=1.0, help="Time to run each endpoint")
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        sizes = [int(size) for size in options["sizes"].split(",")]
+        self.stdout.write(f"{'players':>7} {'endpoint':<12} {'serializers':>12} {'fast path':>10} {'speedup':>8}")
+
+        with transaction.atomic():
+            for size in sizes:
+                room = self.create_room(size)
+                for name, (serializer_view, fast_view, build) in VIEWS.items():
+                    path, params, kwargs = build(room)
+
+                    def call(view):
+                        request = factory.get(path, params, HTTP_ACCEPT='application/json', HTTP_HOST='localhost')
+                        return view(request, **kwargs).render()
+
+                    # ทั้งสองทางต้องได้ JSON เดียวกันก่อนจะเทียบความเร็ว
+                    if call(serializer_view).content != call(fast_view).content:
+                        self.stderr.write(f"{name} ({size} players): responses differ")
+
+                    before = self.requests_per_second(lambda: call(serializer_view), options["seconds"])
+                    after = self.requests_per_second(lambda: call(fast_view), options["seconds"])
+                    self.stdout.write(
+                        f"{size:>7} {name:<12} {before:>10.1f}/s {after:>8.1f}/s {after / before:>7.2f}x"
+                    )
+
+            transaction.set_rollback(True)
+
+    def create_room(self, size):
+        room = Room.objects.create(name=f"bench {size}", open_time=clock(18), close_time=clock(22))
+        Player.objects.bulk_create([
+            Player(room=room, name=f"player {n}", skill=SKILL_ORDER[n % len(SKILL_ORDER)], number_of_matches=n % 7)
+            for n in range(size)
+        ], batch_size=1000)
+        return room
+
+    def requests_per_second(self, request, seconds):
+        count = 0
+        started = time.perf_counter()
+        deadline = started + seconds
+        while time.perf_counter() < deadline:
+            request()
+            count += 1
+        return count / (time.perf_counter() - started)
@@ -0,0 +1,81 @@
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from myapp.services.candidates import trim_room_data
+from myapp.services.claude_service import MATCHMAKING_TOOL, ClaudeService
+
+from ._synthetic import synthetic_room_data
+
+
+def estimate_tokens(text):
+    # ประมาณคร่าวๆ เมื่อเรียก API ไม่ได้: ASCII ~4 ตัวอักษรต่อ token, ภาษาไทย ~1.5 ตัวอักษรต่อ token
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return round(ascii_chars / 4 + (len(text) - ascii_chars) / 1.5)
+
+
+class Command(BaseCommand):
+    help = "Report Claude matchmaking prompt token counts per room size (cached static prefix vs per-room part)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="4,20,50,100,150")
+        parser.add_argument(
+            "--top-k",
+            type=int,
+            default=settings.MATCHMAKING_PROMPT_TOP_K,
+            help="Players kept by trim_room_data for the top-k column (0 sends everyone)."
+        )
+        parser.add_argument(
+            "--offline",
+            action="store_true",
+            help="Estimate locally instead of calling the Anthropic count_tokens API."
+        )
+
+    def handle(self, *args, **options):
+        service = ClaudeService()
+        offline = options["offline"] or not os.environ.get("ANTHROPIC_API_KEY")
+        count = self.estimate if offline else self.count_with_api(service)
+
+        self.stdout.write(f"token counts ({'estimated offline' if offline else 'Anthropic count_tokens'})")
+        self.stdout.write(f"{'players':>8} {'prefix':>8} {'per-room':>9} {'legacy':>8} {'top-k':>8}")
+
+        for size in [int(s) for s in options["sizes"].split(",")]:
+            room_data = synthetic_room_data(size)
+            system_prompt, user_prompt = service.build_prompts(room_data)
+
+            prefix = count(system_prompt, ".")
+            per_room = count(system_prompt, user_prompt) - prefix
+            # user prompt เดียวกันแต่ใช้รายชื่อผู้เล่นแบบเดิม (format_player_info) เพื่อเปรียบเทียบกับตารางแบบย่อ
+            player_list = service.build_player_list(room_data)
+            legacy_prompt = user_prompt.replace(
+                service.format_player_table(player_list), service.format_player_info(player_list)
+            )
+            legacy = count(system_prompt, legacy_prompt) - prefix
+            # prompt ที่ส่งจริงหลังตัดเหลือผู้เล่น top-k คน
+            trimmed = count(*service.build_prompts(trim_room_data(room_data, options["top_k"]))) - prefix
+
+            self.stdout.write(f"{size:>8} {prefix:>8} {per_room:>9} {legacy:>8} {trimmed:>8}")
+
+        self.stdout.write(
+            "prefix is sent with cache_control and billed at the cache-read rate after the first call"
+        )
+
+    def estimate(self, system_prompt, user_prompt):
+        # tool definition อยู่ใน prefix ที่ cache ด้วย
+        return (
+            estimate_tokens(json.dumps(MATCHMAKING_TOOL, ensure_ascii=False))
+            + sum(estimate_tokens(block["text"]) for block in system_prompt)
+            + estimate_tokens(user_prompt)
+        )
+
+    def count_with_api(self, service):
+        def count(system_prompt, user_prompt):
+            return service.client.messages.count_tokens(
+                model=service.model,
+                system=system_prompt,
+                tools=[MATCHMAKING_TOOL],
+                messages=[{"role": "user", "content": user_prompt}],
+            ).input_tokens
+        return count
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from myapp.jobs import pending_job_ids, run_job
+from myapp.models import MatchmakingJob
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued matchmaking jobs in this process (e.g. jobs left over after a restart), "
+        "including jobs stuck in running for longer than MATCHMAKING_JOB_STALE_SECONDS."
+    )
+
+    def handle(self, *args, **options):
+        job_ids = pending_job_ids()
+        for job_id in job_ids:
+            run_job(job_id)
+            job = MatchmakingJob.objects.get(pk=job_id)
+            self.stdout.write(f"job {job_id}: {job.status}")
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {len(job_ids)} job(s)"))
@@ -0,0 +1,103 @@
+from functools import reduce
+from itertools import combinations, product
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils.functional import SimpleLazyObject
+
+from .models import Match, MatchParticipant, PairStat, Player, Room
+from .services.pair_history import PairHistory
+from . import signals
+
+
+class UnknownPlayersError(ValueError):
+    def __init__(self, player_ids):
+        self.player_ids = player_ids
+        super().__init__(f"Players not found in this room: {player_ids}")
+
+
+def split_teams(player_ids):
+    # ครึ่งแรกของรายชื่อคือทีมที่ 1 ครึ่งหลังคือทีมที่ 2 ตรงกับลำดับ teams ในผลการจับคู่
+    half = len(player_ids) // 2
+    return [player_ids[:half], player_ids[half:]]
+
+
+def _pairs_q(pairs):
+    return reduce(or_, (Q(player_low_id=low, player_high_id=high) for low, high in pairs))
+
+
+def _increment(field, pairs):
+    if not pairs:
+        return F(field)
+    return F(field) + Case(When(_pairs_q(pairs), then=Value(1)), default=Value(0))
+
+
+def record_pairs(room_id, teams):
+    """
+    เพิ่มจำนวนครั้งที่เป็นคู่หู/คู่แข่งของทุกคู่ในแมชต์: INSERT แถวที่ยังไม่มี แล้ว UPDATE เดียวด้วย F()
+    """
+    partners = [pair for team in teams for pair in combinations(sorted(team), 2)]
+    opponents = [tuple(sorted(pair)) for pair in product(*teams)]
+    pairs = partners + opponents
+
+    PairStat.objects.bulk_create(
+        [PairStat(room_id=room_id, player_low_id=low, player_high_id=high) for low, high in pairs],
+        ignore_conflicts=True,
+    )
+    PairStat.objects.filter(_pairs_q(pairs), room_id=room_id).update(
+        partnered=_increment('partnered', partners),
+        opposed=_increment('opposed', opponents),
+    )
+
+
+def load_pair_history(room_id):
+    rows = PairStat.objects.filter(room_id=room_id).values_list(
+        'player_low_id', 'player_high_id', 'partnered', 'opposed'
+    )
+    return PairHistory.from_rows(rows)
+
+
+def attach_pair_history(room_data):
+    """
+    ใส่ประวัติคู่หู/คู่แข่งให้ local engine ใช้เป็น penalty โดย query เมื่อ engine อ่านครั้งแรกเท่านั้น
+    (ผลจาก cache หรือ LLM ไม่ต้องใช้จึงไม่เสีย query) ใช้ได้เฉพาะโค้ดแบบ sync
+    """
+    room_id = room_data['id']
+    room_data['pair_history'] = SimpleLazyObject(lambda: load_pair_history(room_id))
+    return room_data
+
+
+def record_match(room_id, player_ids, shuttlecocks=1):
+    """
+    บันทึกผลแมชต์: เพิ่มจำนวนแมชต์และลูกแบดของผู้เล่นทุกคนด้วย UPDATE เดียวใน transaction เดียว
+    ใช้ F() จึงไม่มี read-modify-write race เมื่อหลายสนามจบพร้อมกัน
+    และบันทึก Match/MatchParticipant พร้อมสถิติคู่ (ทีมตาม split_teams) ใน transaction เดียวกัน
+    ถ้ามีผู้เล่นที่ไม่อยู่ในห้องจะ rollback ทั้งหมดและ raise UnknownPlayersError
+    """
+    with transaction.atomic():
+        players = Player.objects.filter(room_id=room_id, id__in=player_ids)
+        updated = players.update(
+            number_of_matches=F('number_of_matches') + 1,
+            number_of_shuttlecock=F('number_of_shuttlecock') + shuttlecocks,
+        )
+        if updated != len(player_ids):
+            found = set(players.values_list('id', flat=True))
+            raise UnknownPlayersError(sorted(set(player_ids) - found))
+        Room.objects.filter(pk=room_id).bump_version()
+
+        teams = split_teams(player_ids)
+        match = Match.objects.create(room_id=room_id, shuttlecocks=shuttlecocks)
+        MatchParticipant.objects.bulk_create([
+            MatchParticipant(match=match, player_id=player_id, team=team)
+            for team, team_ids in enumerate(teams, start=1)
+            for player_id in team_ids
+        ])
+        record_pairs(room_id, teams)
+
+        # update() ไม่ส่ง post_save จึงต้องแจ้งเองหลัง commit
+        transaction.on_commit(
+            lambda: signals.room_players_changed.send(sender=Room, room_id=room_id, player_ids=list(player_ids))
+        )
+
+    return Player.objects.filter(room_id=room_id).in_queue_order()
@@ -0,0 +1,88 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .services.engines import AUTO_ENGINE, provider_registry
+
+
+def get_cache():
+    return caches[settings.MATCHMAKING_CACHE_ALIAS]
+
+
+def roster_fingerprint(players):
+    """
+    สร้าง fingerprint ของรายชื่อผู้เล่นในห้อง ถ้ารายชื่อไม่เปลี่ยน fingerprint ก็ไม่เปลี่ยน
+    """
+    rows = sorted(
+        (p['id'], p['name'], p['skill'], p.get('number_of_matches', 0), str(p.get('join_time', '')))
+        for p in players
+    )
+    return hashlib.sha1(repr(rows).encode('utf-8')).hexdigest()
+
+
+def _generation_key(room_id):
+    return f"matchmaking:room:{room_id}:generation"
+
+
+def room_generation(room_id):
+    cache = get_cache()
+    cache.add(_generation_key(room_id), 0, timeout=None)
+    return cache.get(_generation_key(room_id), 0)
+
+
+async def aroom_generation(room_id):
+    cache = get_cache()
+    await cache.aadd(_generation_key(room_id), 0, timeout=None)
+    return await cache.aget(_generation_key(room_id), 0)
+
+
+def invalidate_room(room_id):
+    """
+    เปลี่ยน generation ของห้อง ทำให้ผลลัพธ์เก่าทั้งหมดของห้องนี้ใช้ไม่ได้อีก
+    """
+    cache = get_cache()
+    try:
+        cache.incr(_generation_key(room_id))
+    except ValueError:
+        cache.set(_generation_key(room_id), 1, timeout=None)
+
+
+def cache_key(room_id, engine, players):
+    return (
+        f"matchmaking:room:{room_id}:{room_generation(room_id)}"
+        f":{engine}:{roster_fingerprint(players)}"
+    )
+
+
+async def acache_key(room_id, engine, players):
+    return (
+        f"matchmaking:room:{room_id}:{await aroom_generation(room_id)}"
+        f":{engine}:{roster_fingerprint(players)}"
+    )
+
+
+def should_cache(engine, served):
+    """
+    เก็บเฉพาะผลจาก provider ที่ request ต้องการ: engine ที่ระบุต้องได้จากตัวนั้นเอง และ auto ต้องไม่ใช่ fallback_only
+    ผลจากตัวสำรอง (เช่น auto ที่ตกไปใช้ local) ไม่เก็บ request ถัดไปจึงได้ลอง provider หลักอีกครั้ง
+    """
+    if engine == AUTO_ENGINE:
+        return served not in provider_registry.fallback_only
+    return served == engine
+
+
+def get_result(key):
+    return get_cache().get(key)
+
+
+def set_result(key, result):
+    get_cache().set(key, result)
+
+
+async def aget_result(key):
+    return await get_cache().aget(key)
+
+
+async def aset_result(key, result):
+    await get_cache().aset(key, result)
@@ -0,0 +1,21 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0003_matchmakingjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(fields=['room', 'number_of_matches', 'join_time', 'id'], name='player_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(fields=['room', 'skill', 'number_of_matches', 'join_time'], name='player_skill_queue_idx'),
+        ),
+    ]
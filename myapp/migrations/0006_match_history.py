@@ -0,0 +1,49 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_room_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Match',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shuttlecocks', models.PositiveIntegerField(default=1)),
+                ('played_at', models.DateTimeField(auto_now_add=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='myapp.room')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MatchParticipant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('team', models.PositiveSmallIntegerField()),
+                ('match', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participants', to='myapp.match')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='match_participations', to='myapp.player')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('match', 'player'), name='match_participant_unique_player')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PairStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('partnered', models.PositiveIntegerField(default=0)),
+                ('opposed', models.PositiveIntegerField(default=0)),
+                ('player_high', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='myapp.player')),
+                ('player_low', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='myapp.player')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pair_stats', to='myapp.room')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('room', 'player_low', 'player_high'), name='pair_stat_unique_pair'), models.CheckConstraint(condition=models.Q(('player_low__lt', models.F('player_high'))), name='pair_stat_ordered_pair')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 10:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_match_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchmakingjob',
+            name='kind',
+            field=models.CharField(choices=[('matchmaking', 'Matchmaking'), ('analysis', 'Analysis')], default='matchmaking', max_length=12),
+        ),
+    ]
@@ -1,9 +1,42 @@
 from django.db import models
 
+class PlayerQuerySet(models.QuerySet):
+    def in_queue_order(self):
+        # ลำดับคิวเดียวกับ local engine: จำนวนแมชต์ → เวลาเข้าร่วม → id ตรงกับ index player_queue_idx
+        return self.order_by('number_of_matches', 'join_time', 'id')
+
+
+class RoomQuerySet(models.QuerySet):
+    def bump_version(self):
+        # เพิ่ม version ใน SQL จึงไม่ทับค่าที่ถูกเพิ่มพร้อมกันจาก request อื่น
+        return self.update(version=models.F('version') + 1)
+
+    def with_players(self):
+        # ดึงผู้เล่นของทุกห้องด้วย query เดียว แทนการ query ทีละห้องตอน serialize
+        return self.prefetch_related(
+            models.Prefetch('players', queryset=Player.objects.in_queue_order())
+        )
+
+
 class Room(models.Model):
     name = models.CharField(max_length=100)
     open_time = models.TimeField()
     close_time = models.TimeField()
+    # เพิ่มขึ้นทุกครั้งที่ห้องหรือผู้เล่นในห้องเปลี่ยน ใช้สร้าง ETag ของห้องและผู้เล่น
+    version = models.PositiveBigIntegerField(default=1, editable=False)
+
+    objects = RoomQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            return super().save(*args, **kwargs)
+
+        self.version = models.F('version') + 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+        self.refresh_from_db(fields=['version'])
+
     def __str__(self):
         return self.name
 
@@ -20,5 +53,127 @@ class Player(models.Model):
         related_name='players'
     )
 
+    objects = PlayerQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # จำห้องตอนโหลดไว้ ถ้าผู้เล่นถูกย้ายห้องจะได้อัปเดตทั้งห้องเดิมและห้องใหม่
+        instance._loaded_room_id = instance.__dict__.get('room_id')
+        return instance
+
+    def affected_room_ids(self):
+        return {room_id for room_id in (self.room_id, getattr(self, '_loaded_room_id', None)) if room_id}
+
+    class Meta:
+        indexes = [
+            # คิวของห้อง: อ่านผู้เล่นที่ถึงคิวถัดไปด้วย index scan แทนการ sort
+            models.Index(fields=['room', 'number_of_matches', 'join_time', 'id'], name='player_queue_idx'),
+            # คิวที่กรองตามทักษะ
+            models.Index(fields=['room', 'skill', 'number_of_matches', 'join_time'], name='player_skill_queue_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+class MatchmakingJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    # analysis: phase ที่สองของการจับคู่แบบสองขั้น result มีทีมจาก phase แรกอยู่แล้ว job เติมคำวิเคราะห์ให้
+    KIND_MATCHMAKING = 'matchmaking'
+    KIND_ANALYSIS = 'analysis'
+    KIND_CHOICES = [
+        (KIND_MATCHMAKING, 'Matchmaking'),
+        (KIND_ANALYSIS, 'Analysis'),
+    ]
+
+    room = models.ForeignKey(
+        Room,
+        on_delete=models.CASCADE,
+        related_name='matchmaking_jobs'
+    )
+    engine = models.CharField(max_length=20)
+    kind = models.CharField(max_length=12, choices=KIND_CHOICES, default=KIND_MATCHMAKING)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.room_id}:{self.engine}:{self.status}"
+
+
+class Match(models.Model):
+    """
+    แมชต์ที่เล่นจบแล้ว บันทึกพร้อมกับ record_match
+    """
+    room = models.ForeignKey(
+        Room,
+        on_delete=models.CASCADE,
+        related_name='matches'
+    )
+    shuttlecocks = models.PositiveIntegerField(default=1)
+    played_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.room_id}:{self.played_at:%Y-%m-%d %H:%M}"
+
+
+class MatchParticipant(models.Model):
+    match = models.ForeignKey(
+        Match,
+        on_delete=models.CASCADE,
+        related_name='participants'
+    )
+    player = models.ForeignKey(
+        Player,
+        on_delete=models.CASCADE,
+        related_name='match_participations'
+    )
+    team = models.PositiveSmallIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['match', 'player'], name='match_participant_unique_player'),
+        ]
+
+    def __str__(self):
+        return f"{self.match_id}:{self.team}:{self.player_id}"
+
+
+class PairStat(models.Model):
+    """
+    จำนวนครั้งที่ผู้เล่นสองคนในห้องเคยเป็นคู่หู (ทีมเดียวกัน) หรือเป็นคู่แข่งกัน
+    อัปเดตทีละแมชต์ใน record_match แทนการนับจาก MatchParticipant ใหม่ทุกครั้ง
+    เก็บคู่ละแถวโดย player_low < player_high จึงค้นหาคู่ใดคู่หนึ่งได้ด้วย unique index
+    """
+    room = models.ForeignKey(
+        Room,
+        on_delete=models.CASCADE,
+        related_name='pair_stats'
+    )
+    player_low = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+    player_high = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='+')
+    partnered = models.PositiveIntegerField(default=0)
+    opposed = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'player_low', 'player_high'], name='pair_stat_unique_pair'),
+            models.CheckConstraint(
+                condition=models.Q(player_low__lt=models.F('player_high')), name='pair_stat_ordered_pair'
+            ),
+        ]
+
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return f"{self.room_id}:{self.player_low_id}-{self.player_high_id}"
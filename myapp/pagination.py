@@ -0,0 +1,100 @@
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+def reverse_ordering(ordering):
+    return [field[1:] if field.startswith('-') else f'-{field}' for field in ordering]
+
+
+class KeysetPagination(CursorPagination):
+    """
+    แบ่งหน้าแบบ keyset: cursor เก็บค่าของทุกคอลัมน์ที่ใช้เรียง (ปิดท้ายด้วย id ที่ไม่ซ้ำ)
+    แล้วกรองด้วย (f1 > v1) OR (f1 = v1 AND id > last_id) แทน OFFSET และไม่ต้อง COUNT ทั้งตาราง
+    หน้าลึกแค่ไหนก็ใช้ index เดิม และแถวที่ค่าซ้ำกันจะไม่ซ้ำหรือหายระหว่างหน้า
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = 'id'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = list(super().get_ordering(request, queryset, view))
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering.append('-id' if ordering[0].startswith('-') else 'id')
+        return ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+
+        reverse = self.cursor is not None and self.cursor.reverse
+        ordering = reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        try:
+            if self.cursor is not None:
+                queryset = queryset.filter(self.after(ordering, self.cursor.position))
+            results = list(queryset[:self.page_size + 1])
+        except (TypeError, ValueError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        self.page = results[:self.page_size]
+        has_more = len(results) > self.page_size
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        self.display_page_controls = (self.has_previous or self.has_next) and self.template is not None
+        return self.page
+
+    def after(self, ordering, position):
+        # แถวที่อยู่ถัดจาก position ตามลำดับ: คอลัมน์ก่อนหน้าเท่ากันหมด และคอลัมน์ที่ i มากกว่า (หรือน้อยกว่าถ้าเรียงกลับ)
+        terms, equal = [], Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            terms.append(equal & Q(**{f'{name}__{lookup}': value}))
+            equal &= Q(**{name: value})
+        return reduce(or_, terms)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self.position(self.page[-1]) if self.page else self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self.position(self.page[0]) if self.page else self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def position(self, instance):
+        return [self._get_position_from_instance(instance, [field]) for field in self.ordering]
+
+    def encode_cursor(self, cursor):
+        return super().encode_cursor(cursor._replace(position=json.dumps(cursor.position)))
+
+    def decode_cursor(self, request):
+        cursor = super().decode_cursor(request)
+        if cursor is None:
+            return None
+        try:
+            position = json.loads(cursor.position)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor._replace(offset=0, position=position)
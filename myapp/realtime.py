@@ -0,0 +1,281 @@
+import asyncio
+import json
+import logging
+import queue
+import re
+import threading
+
+from django.db import transaction
+
+from .models import Room
+from .serializers import MatchmakingJobSerializer, PlayerSerializer, RoomSerializer
+from .streaming import sse_event
+
+SUBSCRIBER_QUEUE_SIZE = 100
+HEARTBEAT_SECONDS = 15
+WEBSOCKET_PATH = re.compile(r'/ws/rooms/(\d+)/?')
+
+# ส่งให้ subscriber ที่ตาม event ไม่ทัน (queue เต็ม) หรือเมื่อไม่รู้ว่าผู้เล่นคนไหนเปลี่ยน
+# transport จะตอบด้วย snapshot ใหม่ของห้องแทน
+RESYNC = object()
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    ผู้ติดตาม event ของห้องที่รอจาก thread ปกติ (SSE)
+    """
+
+    def __init__(self, room_id):
+        self.room_id = room_id
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self._overflow()
+
+    def _overflow(self):
+        # ทิ้ง diff ที่ค้างทั้งหมดแล้วให้ client รับ snapshot ใหม่แทน
+        with self.queue.mutex:
+            self.queue.queue.clear()
+            self.queue.queue.append(RESYNC)
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class AsyncSubscription:
+    """
+    ผู้ติดตาม event ของห้องที่รอใน event loop (WebSocket) รับ event จาก thread อื่นได้อย่างปลอดภัย
+    """
+
+    def __init__(self, room_id):
+        self.room_id = room_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def put(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # event loop ปิดไปแล้ว การเชื่อมต่อนี้จะถูกยกเลิกการติดตามใน finally ของ transport
+            pass
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class RoomBroadcaster:
+    """
+    กระจาย event ของแต่ละห้องให้ผู้ติดตามภายในโปรเซสเดียวกัน ไม่ต้องใช้ broker ภายนอก
+    (ถ้ารันหลาย worker แต่ละ worker จะเห็นเฉพาะการเปลี่ยนแปลงที่เกิดใน worker นั้น)
+    """
+
+    def __init__(self):
+        self.rooms = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, subscription):
+        with self.lock:
+            self.rooms.setdefault(subscription.room_id, set()).add(subscription)
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscriptions = self.rooms.get(subscription.room_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self.rooms[subscription.room_id]
+
+    def has_subscribers(self, room_id):
+        return room_id in self.rooms
+
+    def publish(self, room_id, event):
+        with self.lock:
+            subscriptions = list(self.rooms.get(room_id, ()))
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def publish_on_commit(self, room_id, build_event):
+        """
+        ส่ง event หลัง transaction commit เท่านั้น และสร้าง event (ซึ่งอาจ query) เมื่อมีผู้ติดตามห้องนี้อยู่
+        """
+        if not self.has_subscribers(room_id):
+            return
+
+        def send():
+            try:
+                self.publish(room_id, build_event())
+            except Exception:
+                logger.exception(f"Failed to publish realtime event for room {room_id}")
+
+        transaction.on_commit(send)
+
+
+broadcaster = RoomBroadcaster()
+
+
+def snapshot_event(room):
+    return {"type": "snapshot", "room": RoomSerializer(room).data}
+
+
+def room_event(room):
+    return {
+        "type": "room",
+        "room": {
+            "id": room.id,
+            "name": room.name,
+            "open_time": room.open_time.isoformat() if room.open_time else None,
+            "close_time": room.close_time.isoformat() if room.close_time else None,
+        },
+    }
+
+
+def players_event(players):
+    # เฉพาะแถวของผู้เล่นที่เปลี่ยน ไม่ใช่ทั้งห้อง
+    return {"type": "players", "players": PlayerSerializer(players, many=True).data}
+
+
+def player_removed_event(player_id):
+    return {"type": "player_removed", "id": player_id}
+
+
+def analysis_event(job):
+    # คำวิเคราะห์จาก phase ที่สองของการจับคู่แบบสองขั้น (หรือ error ถ้า job ล้มเหลว)
+    return {"type": "analysis", "job": MatchmakingJobSerializer(job).data}
+
+
+def room_deleted_event(room_id):
+    return {"type": "room_deleted", "id": room_id}
+
+
+def load_snapshot(room_id):
+    try:
+        return snapshot_event(Room.objects.with_players().get(pk=room_id))
+    except Room.DoesNotExist:
+        return room_deleted_event(room_id)
+
+
+async def aload_snapshot(room_id):
+    try:
+        # players ถูก prefetch มาแล้ว การ serialize จึงไม่ query ฐานข้อมูลเพิ่ม
+        return snapshot_event(await Room.objects.with_players().aget(pk=room_id))
+    except Room.DoesNotExist:
+        return room_deleted_event(room_id)
+
+
+def room_event_stream(room_id):
+    """
+    server-sent events ของห้อง: snapshot ครั้งแรก ตามด้วย diff ทุกครั้งที่ผู้เล่นหรือห้องเปลี่ยน
+    ติดตามก่อนโหลด snapshot จึงไม่พลาดการเปลี่ยนแปลงที่เกิดระหว่างนั้น ใช้กับ WSGI ส่วน ASGI ใช้ aroom_event_stream
+    """
+    subscription = Subscription(room_id)
+    broadcaster.subscribe(subscription)
+    try:
+        event = load_snapshot(room_id)
+        while True:
+            if event is None:
+                # comment ของ SSE กันไม่ให้ proxy ตัดการเชื่อมต่อที่เงียบนานเกินไป
+                yield ": keep-alive\n\n"
+            else:
+                if event is RESYNC:
+                    event = load_snapshot(room_id)
+                yield sse_event(event["type"], event)
+                if event["type"] == "room_deleted":
+                    return
+            event = subscription.get(HEARTBEAT_SECONDS)
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+async def aroom_event_stream(room_id):
+    """
+    room_event_stream แบบ async generator สำหรับ ASGI รอ event ใน event loop ผ่าน AsyncSubscription
+    เมื่อ client ตัดการเชื่อมต่อ Django จะยกเลิก generator และยกเลิกการติดตามใน finally
+    """
+    subscription = AsyncSubscription(room_id)
+    broadcaster.subscribe(subscription)
+    try:
+        event = await aload_snapshot(room_id)
+        while True:
+            if event is None:
+                yield ": keep-alive\n\n"
+            else:
+                if event is RESYNC:
+                    event = await aload_snapshot(room_id)
+                yield sse_event(event["type"], event)
+                if event["type"] == "room_deleted":
+                    return
+            event = await subscription.get(HEARTBEAT_SECONDS)
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+async def websocket_application(scope, receive, send):
+    """
+    ASGI WebSocket ที่ /ws/rooms/<id>/ ส่ง event ชุดเดียวกับ room_event_stream เป็นข้อความ JSON
+    """
+    message = await receive()
+    if message["type"] != "websocket.connect":
+        return
+
+    match = WEBSOCKET_PATH.fullmatch(scope["path"])
+    if not match:
+        await send({"type": "websocket.close", "code": 4404})
+        return
+
+    room_id = int(match.group(1))
+    subscription = AsyncSubscription(room_id)
+    broadcaster.subscribe(subscription)
+    receiver = None
+    try:
+        event = await aload_snapshot(room_id)
+        if event["type"] == "room_deleted":
+            await send({"type": "websocket.close", "code": 4404})
+            return
+
+        await send({"type": "websocket.accept"})
+        receiver = asyncio.ensure_future(receive())
+        while True:
+            if event is not None:
+                if event is RESYNC:
+                    event = await aload_snapshot(room_id)
+                await send({"type": "websocket.send", "text": json.dumps(event, ensure_ascii=False)})
+                if event["type"] == "room_deleted":
+                    await send({"type": "websocket.close", "code": 1000})
+                    return
+
+            getter = asyncio.ensure_future(subscription.get(HEARTBEAT_SECONDS))
+            done, _ = await asyncio.wait({receiver, getter}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                event = getter.result()
+            else:
+                getter.cancel()
+                event = None
+
+            if receiver in done:
+                if receiver.result()["type"] == "websocket.disconnect":
+                    return
+                # ช่องทางนี้ส่งจาก server อย่างเดียว ข้อความจาก client จึงถูกข้ามไป
+                receiver = asyncio.ensure_future(receive())
+    finally:
+        broadcaster.unsubscribe(subscription)
+        if receiver is not None and not receiver.done():
+            receiver.cancel()
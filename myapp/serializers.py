@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Room,Player
+from .models import Room,Player,MatchmakingJob
 
 
 class PlayerSerializer(serializers.ModelSerializer):
@@ -8,9 +8,23 @@ class PlayerSerializer(serializers.ModelSerializer):
         fields = ['id','room', 'name', 'skill', 'join_time', 'number_of_matches', 'number_of_shuttlecock']
 
 
+class PlayerCheckInSerializer(serializers.ModelSerializer):
+    # ใช้ตรวจแต่ละแถวของการเช็คอินแบบกลุ่ม ไม่มี room จึงไม่ต้อง query ห้องทีละแถว
+    class Meta:
+        model = Player
+        fields = ['name', 'skill', 'number_of_matches', 'number_of_shuttlecock']
+
+
 class RoomSerializer(serializers.ModelSerializer):
     players = PlayerSerializer(many=True, read_only=True)
 
     class Meta:
         model = Room
         fields = '__all__'
+
+
+class MatchmakingJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MatchmakingJob
+        fields = ['id', 'room', 'engine', 'kind', 'status', 'result', 'error', 'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
@@ -0,0 +1,108 @@
+import json
+from datetime import datetime, timezone
+
+from asgiref.sync import sync_to_async
+
+from .json_scanner import extract_json
+from .matchmaking_schema import validate_matchmaking, validate_teams
+
+
+class BaseMatchmakingService:
+    """
+    ส่วนที่ provider ทุกตัวใช้ร่วมกัน: เตรียมรายชื่อผู้เล่น, แยก JSON ออกจากข้อความของโมเดล
+    และสร้างผลลัพธ์ในรูปแบบ teams/match/analysis เดียวกัน
+    """
+
+    name = None
+
+    def build_player_list(self, room_data):
+        player_list = []
+        for p in room_data['players']:
+            player_list.append({
+                'id': p['id'],
+                'name': p['name'],
+                'skill': p['skill'],
+                'join_time': p.get('join_time', ''),
+                'number_of_matches': p.get('number_of_matches', 0),
+                'number_of_shuttlecock': p.get('number_of_shuttlecock', 0)
+            })
+        return player_list
+
+    def format_player_info(self, player_list):
+        return "\n".join([
+            f"Player {p['id']}: {p['name']} (Skill: {p['skill']}, Matches: {p['number_of_matches']}, Join Time: {p['join_time']})"
+            for p in player_list
+        ])
+
+    def format_player_table(self, player_list, now=None):
+        """
+        ตารางผู้เล่นแบบย่อ หนึ่งบรรทัดต่อคน: id|ชื่อ|ทักษะ|จำนวนแมชต์|จำนวนนาทีที่เข้าร่วมมาแล้ว
+        ใช้ token น้อยกว่า format_player_info มาก
+        """
+        now = now or datetime.now(timezone.utc)
+        return "\n".join([
+            f"{p['id']}|{str(p['name']).replace('|', '/')}|{p['skill']}|{p['number_of_matches']}|{self.minutes_since(p['join_time'], now)}"
+            for p in player_list
+        ])
+
+    def minutes_since(self, join_time, now):
+        try:
+            joined = datetime.fromisoformat(str(join_time).replace('Z', '+00:00'))
+        except ValueError:
+            return '?'
+        if joined.tzinfo is None:
+            joined = joined.replace(tzinfo=timezone.utc)
+        return max(0, int((now - joined).total_seconds() // 60))
+
+    def clean_json_text(self, text):
+        """
+        แยกข้อความ JSON ของ object แรกออกมาจากข้อความที่ส่งกลับ พร้อมซ่อมในรอบเดียว
+        """
+        json_text = extract_json(text)
+        # ถ้าไม่สามารถแยก JSON ได้ ส่งคืนข้อความเดิม
+        return json_text if json_text is not None else text.strip()
+
+    def load_json(self, text, debug_info):
+        """
+        แยก JSON ออกจากข้อความของโมเดลด้วย json_scanner แล้ว parse ครั้งเดียว
+        """
+        try:
+            # provider ที่ใช้ structured output ส่ง JSON ล้วนมาอยู่แล้ว จึงไม่ต้องสแกน
+            return json.loads(text)
+        except json.JSONDecodeError:
+            pass
+
+        json_text = self.clean_json_text(text)
+        debug_info["cleaned_json"] = json_text[:200] + "..." if len(json_text) > 200 else json_text
+        return json.loads(json_text)
+
+    def to_result(self, matchmaking_data):
+        # ตรวจกับ MATCHMAKING_SCHEMA ที่เดียว ไม่ว่าจะมาจาก provider ใด
+        validate_matchmaking(matchmaking_data)
+        return {
+            "teams": matchmaking_data["teams"],
+            "match": matchmaking_data["match"],
+            "analysis": matchmaking_data["analysis"],
+            "model_used": self.model
+        }
+
+    def to_teams_result(self, teams_data):
+        validate_teams(teams_data)
+        return {
+            "teams": teams_data["teams"],
+            "match": teams_data["match"],
+            "model_used": self.model
+        }
+
+    def generate_matchmaking(self, room_data):
+        raise NotImplementedError
+
+    def generate_teams(self, room_data):
+        """
+        phase แรกของการจับคู่แบบสองขั้น provider ที่ไม่มีโหมดเลือกทีมอย่างเดียวคืนผลเต็มพร้อม analysis
+        provider ที่คืนผลโดยไม่มี analysis ต้องมี generate_analysis ด้วย
+        """
+        return self.generate_matchmaking(room_data)
+
+    async def agenerate_matchmaking(self, room_data):
+        return await sync_to_async(self.generate_matchmaking, thread_sensitive=False)(room_data)
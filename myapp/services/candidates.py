@@ -0,0 +1,49 @@
+from .local_matchmaking_service import skill_rank
+
+# กันที่ให้ผู้เล่นคิวต้นๆ ของทุกระดับทักษะอย่างน้อยระดับละ 2 คน
+# สองระดับที่ติดกันจึงรวมกันได้ 4 คนเสมอ และยังจัดแมชต์ที่ทักษะห่างกันไม่เกิน 1 ขั้นได้ถ้าห้องมีผู้เล่นแบบนั้น
+PLAYERS_PER_SKILL_BAND = 2
+
+
+def queue_key(player):
+    return (player.get('number_of_matches') or 0, player.get('join_time') or '', player['id'])
+
+
+def select_candidates(players, top_k, per_band=PLAYERS_PER_SKILL_BAND):
+    """
+    เลือกผู้เล่น top_k คนที่มีสิทธิ์ลงสนามมากที่สุด (จำนวนแมชต์น้อย → รอนาน) ก่อนส่งให้ provider
+    โดยกันที่ให้ผู้เล่นคิวต้นๆ ของแต่ละระดับทักษะก่อน แล้วเติมที่เหลือตามลำดับคิว
+    ถ้า top_k เป็น 0 หรือห้องมีผู้เล่นไม่เกิน top_k คืนรายชื่อทั้งหมดตามเดิม
+    """
+    if not top_k or len(players) <= top_k:
+        return list(players)
+
+    queue = sorted(players, key=queue_key)
+    per_rank = {}
+    reserved = []
+    for player in queue:
+        rank = skill_rank(player['skill'])
+        if per_rank.get(rank, 0) < per_band:
+            per_rank[rank] = per_rank.get(rank, 0) + 1
+            reserved.append(player)
+
+    selected = reserved[:top_k]
+    chosen = {player['id'] for player in selected}
+    for player in queue:
+        if len(selected) >= top_k:
+            break
+        if player['id'] not in chosen:
+            selected.append(player)
+            chosen.add(player['id'])
+
+    return sorted(selected, key=queue_key)
+
+
+def trim_room_data(room_data, top_k):
+    """
+    room_data ที่เหลือเฉพาะผู้เล่นจาก select_candidates ค่าอื่น (เช่น pair_history) คงเดิม
+    """
+    players = room_data['players']
+    if not top_k or len(players) <= top_k:
+        return room_data
+    return {**room_data, 'players': select_candidates(players, top_k)}
@@ -1,208 +1,279 @@
 import os
 import json
-from anthropic import Anthropic
+from anthropic import Anthropic, AsyncAnthropic
+
+from . import http_transport
+from .base_service import BaseMatchmakingService
+from .matchmaking_schema import MATCHMAKING_SCHEMA, TEAMS_SCHEMA, MatchmakingSchemaError
+
+
+SYSTEM_PROMPT = """คุณเป็นผู้เชี่ยวชาญการจัดการแข่งขันแบดมินตัน และการจับคู่แมชต์การแข่งขันตามทักษะที่เหมาะสมกับรายชื่อนักกีฬาแต่ละคน
+คุณต้องตอบกลับในรูปแบบ JSON ที่มีโครงสร้างตามที่กำหนดเท่านั้น"""
+
+# กฎ, ประเภททักษะ และโครงสร้าง JSON ไม่เปลี่ยนตามห้อง จึงส่งเป็น prefix ที่ cache ได้
+RULES_PROMPT = """*** การวิเคราะห์อย่างเป็นระบบ ***
+
+1. วิเคราะห์รายละเอียดผู้เล่นทีละขั้นตอน:
+   - ตรวจสอบจำนวนแมชต์ของแต่ละคน
+   - จัดลำดับผู้เล่นตามเกณฑ์การเลือก
+   - คำนวณความสมดุลของทักษะอย่างแม่นยำ
+
+2. หลักการคัดเลือกที่ต้องปฏิบัติอย่างเคร่งครัด:
+   - เริ่มจากผู้เล่นที่มีจำนวนแมชต์น้อยที่สุด
+   - กระจายทักษะอย่างเป็นธรรม
+   - ห้ามมีความแตกต่างของทักษะเกิน 1 ขั้น
+
+3. เกณฑ์การพิจารณาอย่างละเอียด:
+   - จำนวนแมชต์ : น้อย → มาก
+   - ทักษะ : BG → N → S → P- → P/P+ → C → B/A
+   - เวลาเข้าร่วม : เป็นปัจจัยรอง
+
+4. เป้าหมายสูงสุด:
+   - ความเป็นธรรม
+   - ความสมดุล
+   - การกระจายโอกาส
+
+*** ข้อควรระวัง ***
+- อย่าด่วนสรุป
+- วิเคราะห์ทุกมุมมอง
+- คำนึงถึงหลักการหลักตลอดเวลา
+
+หน้าที่ของคุณคือจับคู่ผู้เล่นสำหรับการแข่งขันแบบคู่ (doubles) ที่มีความสมดุลที่สุด
+โดยพิจารณาจากระดับทักษะของผู้เล่น
+กฎการเลือกผู้เล่น:
+1. การเลือกผู้เล่น 4 คน:
+   - ความสามารถของผู้เล่นต้องใกล้เคียงกัน
+   - ช่วงทักษะระหว่างคนเก่งที่สุดและคนอ่อนที่สุดห้ามต่างกันเกิน 1 ขั้น
+   - กรณียอมรับได้:
+     * ทั้ง 4 คนมีทักษะเท่ากัน
+     * มีความแตกต่างของทักษะไม่เกิน 1 ขั้น (เช่น S, P-, N อยู่ร่วมกัน)
+
+   # เพิ่มข้อสังเกตใหม่: การจัดลำดับทักษะจากน้อยไปมาก
+   - ลำดับทักษะ (จากอ่อนไปเก่ง): BG → N → S → P- → P/P+ → C → B/A
+
+2. เกณฑ์การคัดเลือก:
+   - ไม่คำนึงถึงเพศของผู้เล่น
+   - พิจารณาจากจำนวนแมชต์เป็นหลัก
+   - เปรียบเทียบกับจำนวนแมชต์ของผู้เล่นทั้งหมดในห้อง
+
+   # เพิ่มเติมข้อสังเกตการคัดเลือก
+   - หากมีผู้เล่นมีจำนวนแมชต์เท่ากัน ให้คำนึงถึงความสมดุลของทักษะเป็นหลัก
+
+3. การประเมินเวลา:
+   - คำนวณจากเวลาที่ผู้เล่นเข้าร่วม
+   - หลักเกณฑ์: ทุกๆ 30 นาที ควรได้เล่นอย่างน้อย 1 แมชต์
+   - ใช้เวลาเป็นปัจจัยรองจากจำนวนแมชต์
+
+   # เพิ่มเกณฑ์การพิจารณาเวลา
+   - กรณีเวลาเข้าร่วมใกล้เคียงกันมาก ให้พิจารณาถึงความสมดุลของทีม
+
+4. ลำดับความสำคัญในการเลือกผู้เล่น:
+   - อันดับแรก: เลือกผู้เล่นที่มีจำนวนแมชต์น้อยที่สุด
+   - หากจำนวนแมชต์เท่ากัน:
+     * พิจารณาเวลาที่เข้าร่วมใกล้เคียงกัน
+     * เลือกผู้เล่นที่เข้าร่วมก่อน
+   - ผู้เล่นที่มีจำนวนแมชต์มากจะได้รับการพิจารณาเป็นลำดับสุดท้าย
+
+   # เพิ่มเกณฑ์การพิจารณาสำรอง
+   - หากยังคงมีความไม่ชัดเจน ให้คำนึงถึงความสมดุลของทักษะเป็นลำดับสุดท้าย
+
+หมายเหตุเพิ่มเติม:
+- เป้าหมายคือกระจายโอกาสอย่างเป็นธรรม
+- คำนึงถึงความสมดุลของทักษะและโอกาสในการเล่น
+- ไม่ให้ผู้เล่นคนเดิมๆ ได้เปรียบในการเล่นซ้ำๆ
+
+# เพิ่มหลักการสำคัญ
+- หากมีความขัดแย้งระหว่างกฎ ให้ยึดหลักความเป็นธรรมและความสมดุลเป็นหลัก
+
+เมื่อเลือกผู้เล่นที่จะจัดทีมมาได้ 4 คนแล้ว ต่อไปคือกฎการจัดทีม
+
+กฎการจัดทีม:
+1.จับคู่ให้ทั้งสองทีมมีความสมดุลกัน โดยเน้นจากทักษะของผู้เล่นที่เลือกมา
+
+        ตัวอย่างที่ถูกต้อง:
+        - ถ้ามีผู้เล่น 4 คน โดยเป็นระดับ S 2 คน และ P- 2 คน ควรจับให้แต่ละทีมมี S 1 คน และ P- 1 คน
+        - ถ้ามีผู้เล่น 4 คน โดยเป็นระดับ N 1 คน, S 2 คน และ P- 1 คน ควรจับให้ทีมหนึ่งมี P- กับ N อีกทีมมี S กับ S เนื่องจาก P- เก่งกว่า S และ S เก่งกว่า N จัดแบบนี้จึงเหมาะสม
+
+        ตัวอย่างที่ไม่ถูกต้อง:
+        - จับให้ผู้เล่นระดับเดียวกัน อยู่ในทีมเดียวกัน เจอผู้เล่นคนละระดับอยู่ทีมตรงข้ามทั้งหมด
+
+2. จำนวนแมชต์ในที่นี้หมายถึงจำนวนแมชต์ที่เล่นไปตั้งแต่เข้าร่วมห้องนี้ ไม่ได้หมายถึงประสบการณ์ ดังนั้นคนที่จำนวนแมชต์เยอะ หมายถึงแรงจะน้อยลง ไม่เกี่ยวกับประสบการณ์
+
+ทักษะจะมีการจัดประเภทดังนี้:
+BG: ทักษะต่ำสุด พอตีลูกโดนบ้าง แทบไม่มีพื้นฐานการตี
+N: ตีลูกโดนบ่อยขึ้น แต่อาจจะไม่ 100% เมื่อตีลูกยากๆ และเล่นลูกที่ใช้ทักษะสูงๆได้ไม่ดีมากเช่น backhand, การวิ่ง, ลูกตบ
+S: ตีลูกโดน มีความชัวร์ในการตี มีเบสิคตีลุกต่างๆได้ครบ แต่ถ้าทางการตีอาจจะไม่สวยเท่าคนที่เรียนมา ส่วนใหญ่คนพวกนี้คือคนที่เล่นมานาน
+P-: เก่งกว่า S และอาจเคยเรียนมาก่อน มีแรงและความไวที่มากขึ้น ถึงแม้ท่าทางอาจไม่สวย แต่ลูกที่ตีออกไปมักค่อนข้างมีประสิทธิภาพ
+P/P+: มีทักษะระดับเป็นนักกีฬาเก่า หรือเป็นโค้ชสอนแบด มีเบสิค แรง ความเร็ว ครบถ้วน
+C: เป็นนักกีฬาหรือเคยเป็นนักกีฬาอาชีพ มีทักษะสูงมากๆ
+B/A: เป็นทีมชาติหรืออดีตทีมชาติ
+
+
+เลือกคน 2 คู่ เพื่อมาแข่งขันกัน และตอบกลับเป็น JSON ที่มีโครงสร้างดังนี้เท่านั้น:
+{
+  "teams": [
+    {
+      "team_name": "ชื่อทีม 1",
+      "players": [
+        { "id": player_id, "name": "player_name", "skill": "skill_level" },
+        { "id": player_id, "name": "player_name", "skill": "skill_level" }
+      ],
+      "compatibility_score": 85 // คะแนนความเข้ากันของคู่นี้ (0-100)
+    },
+    {
+      "team_name": "ชื่อทีม 2",
+      "players": [
+        { "id": player_id, "name": "player_name", "skill": "skill_level" },
+        { "id": player_id, "name": "player_name", "skill": "skill_level" }
+      ],
+      "compatibility_score": 82
+    }
+  ],
+  "match": {
+    "team1": "ชื่อทีม 1",
+    "team2": "ชื่อทีม 2",
+    "balance_score": 90,  // คะแนนความสมดุลของการแข่งขัน (0-100)
+  },
+  "analysis": "คำอธิบายการจับคู่และเหตุผล รวมถึงข้อแนะนำอื่นๆ"
+}
+
+ห้ามมีข้อความอื่นๆ นอกเหนือจาก JSON ที่กำหนด ชื่อทีมให้กำหนดเป็น ทีมที่ 1 กับ ทีมที่ 2 เท่านั้น analysis ให้ตอบเป็นภาษาไทยเท่านั้น"""
+
+PLAYER_TABLE_HEADER = "หนึ่งบรรทัดต่อหนึ่งคน: id|ชื่อ|ทักษะ|จำนวนแมชต์|จำนวนนาทีที่เข้าร่วมมาแล้ว"
+
+# บังคับให้ Claude ตอบผ่าน tool นี้ จึงได้ input ที่ตรง schema มาเป็น dict โดยไม่ต้องแยก JSON จากข้อความ
+MATCHMAKING_TOOL = {
+    "name": "submit_matchmaking",
+    "description": "ส่งผลการจับคู่ผู้เล่น 2 ทีม ทีมละ 2 คน พร้อมคะแนนและคำวิเคราะห์ภาษาไทย",
+    "input_schema": MATCHMAKING_SCHEMA,
+}
+
+# phase แรกของการจับคู่แบบสองขั้น: เลือกทีมอย่างเดียว คำตอบมีแค่ id/ชื่อ/คะแนน จึงใช้ max_tokens ต่ำได้
+TEAMS_TOOL = {
+    "name": "submit_teams",
+    "description": "ส่งผลการจับคู่ผู้เล่น 2 ทีม ทีมละ 2 คน พร้อมคะแนน ไม่ต้องมีคำวิเคราะห์",
+    "input_schema": TEAMS_SCHEMA,
+}
+MATCHMAKING_MAX_TOKENS = 1000
+TEAMS_MAX_TOKENS = 300
+ANALYSIS_MAX_TOKENS = 600
+
+ANALYSIS_SYSTEM_PROMPT = """คุณเป็นผู้เชี่ยวชาญการจัดการแข่งขันแบดมินตัน
+หน้าที่ของคุณคืออธิบายเหตุผลของการจับคู่ที่จัดไว้แล้ว พร้อมข้อแนะนำสั้นๆ เป็นภาษาไทยเท่านั้น ตอบเป็นข้อความธรรมดา ไม่ใช่ JSON"""
+
+
+class ClaudeService(BaseMatchmakingService):
+    name = "claude"
 
-class ClaudeService:
     def __init__(self):
-        self.client = Anthropic(api_key=os.environ.get("ANTHROPIC_API_KEY"))
+        # ใช้ timeout และจำนวน retry เดียวกับ provider อื่น (Anthropic client มี connection pool ของตัวเองอยู่แล้ว)
+        self.client = Anthropic(
+            api_key=os.environ.get("ANTHROPIC_API_KEY"),
+            timeout=http_transport.READ_TIMEOUT,
+            max_retries=http_transport.MAX_RETRIES
+        )
+        self.async_client = AsyncAnthropic(
+            api_key=os.environ.get("ANTHROPIC_API_KEY"),
+            timeout=http_transport.READ_TIMEOUT,
+            max_retries=http_transport.MAX_RETRIES
+        )
         self.model = "claude-3-5-sonnet-20240620"
 
-    def generate_matchmaking(self, room_data):
+    def build_prompts(self, room_data, tool=MATCHMAKING_TOOL):
+        """
+        system prompt คงที่ทุกครั้งและถูก cache ฝั่ง Anthropic (prompt caching)
+        ส่วนที่เปลี่ยนตามห้องมีแค่ตารางผู้เล่นแบบย่อใน user prompt
+        """
+        player_table = self.format_player_table(self.build_player_list(room_data))
+
+        system_prompt = [
+            {"type": "text", "text": SYSTEM_PROMPT},
+            {"type": "text", "text": RULES_PROMPT, "cache_control": {"type": "ephemeral"}},
+        ]
+
+        user_prompt = f"""จากรายชื่อผู้เล่นต่อไปนี้ ({PLAYER_TABLE_HEADER}):
+
+{player_table}
+
+กรุณาจับคู่ผู้เล่นตามกฎที่กำหนด และส่งผลลัพธ์ผ่าน tool {tool["name"]} เท่านั้น"""
+
+        return system_prompt, user_prompt
 
-        system_prompt = """คุณเป็นผู้เชี่ยวชาญการจัดการแข่งขันแบดมินตัน และการจับคู่แมชต์การแข่งขันตามทักษะที่เหมาะสมกับรายชื่อนักกีฬาแต่ละคน
-        คุณต้องตอบกลับในรูปแบบ JSON ที่มีโครงสร้างตามที่กำหนดเท่านั้น"""
-
-        player_list = []
-        for p in room_data['players']:
-            player_list.append({
-                'id': p['id'],
-                'name': p['name'],
-                'skill': p['skill'],
-                'join_time': p.get('join_time', ''),
-                'number_of_matches': p.get('number_of_matches', 0),
-                'number_of_shuttlecock': p.get('number_of_shuttlecock', 0)
-            })
-
-        player_info = "\n".join([
-            f"Player {p['id']}: {p['name']} (Skill: {p['skill']}, Matches: {p['number_of_matches']}, Join Time: {p['join_time']})"
-            for p in player_list
-        ])
-
-        user_prompt = f"""
-        
-        *** การวิเคราะห์อย่างเป็นระบบ ***
-
-        1. วิเคราะห์รายละเอียดผู้เล่นทีละขั้นตอน:
-           - ตรวจสอบจำนวนแมชต์ของแต่ละคน
-           - จัดลำดับผู้เล่นตามเกณฑ์การเลือก
-           - คำนวณความสมดุลของทักษะอย่างแม่นยำ
-        
-        2. หลักการคัดเลือกที่ต้องปฏิบัติอย่างเคร่งครัด:
-           - เริ่มจากผู้เล่นที่มีจำนวนแมชต์น้อยที่สุด
-           - กระจายทักษะอย่างเป็นธรรม
-           - ห้ามมีความแตกต่างของทักษะเกิน 1 ขั้น
-        
-        3. เกณฑ์การพิจารณาอย่างละเอียด:
-           - จำนวนแมชต์ : น้อย → มาก
-           - ทักษะ : BG → N → S → P- → P/P+ → C → B/A
-           - เวลาเข้าร่วม : เป็นปัจจัยรอง
-        
-        4. เป้าหมายสูงสุด:
-           - ความเป็นธรรม
-           - ความสมดุล
-           - การกระจายโอกาส
-        
-        *** ข้อควรระวัง ***
-        - อย่าด่วนสรุป
-        - วิเคราะห์ทุกมุมมอง
-        - คำนึงถึงหลักการหลักตลอดเวลา
-
-        จากรายชื่อผู้เล่นต่อไปนี้:
-
-        {player_info}
-
-        กรุณาจับคู่ผู้เล่นสำหรับการแข่งขันแบบคู่ (doubles) ที่มีความสมดุลที่สุด
-        โดยพิจารณาจากระดับทักษะของผู้เล่น
-      กฎการเลือกผู้เล่น:
-        1. การเลือกผู้เล่น 4 คน:
-           - ความสามารถของผู้เล่นต้องใกล้เคียงกัน
-           - ช่วงทักษะระหว่างคนเก่งที่สุดและคนอ่อนที่สุดห้ามต่างกันเกิน 1 ขั้น
-           - กรณียอมรับได้:
-             * ทั้ง 4 คนมีทักษะเท่ากัน
-             * มีความแตกต่างของทักษะไม่เกิน 1 ขั้น (เช่น S, P-, N อยู่ร่วมกัน)
-           
-           # เพิ่มข้อสังเกตใหม่: การจัดลำดับทักษะจากน้อยไปมาก
-           - ลำดับทักษะ (จากอ่อนไปเก่ง): BG → N → S → P- → P/P+ → C → B/A
-        
-        2. เกณฑ์การคัดเลือก:
-           - ไม่คำนึงถึงเพศของผู้เล่น
-           - พิจารณาจากจำนวนแมชต์เป็นหลัก
-           - เปรียบเทียบกับจำนวนแมชต์ของผู้เล่นทั้งหมดในห้อง
-           
-           # เพิ่มเติมข้อสังเกตการคัดเลือก
-           - หากมีผู้เล่นมีจำนวนแมชต์เท่ากัน ให้คำนึงถึงความสมดุลของทักษะเป็นหลัก
-        
-        3. การประเมินเวลา:
-           - คำนวณจากเวลาที่ผู้เล่นเข้าร่วม
-           - หลักเกณฑ์: ทุกๆ 30 นาที ควรได้เล่นอย่างน้อย 1 แมชต์
-           - ใช้เวลาเป็นปัจจัยรองจากจำนวนแมชต์
-           
-           # เพิ่มเกณฑ์การพิจารณาเวลา
-           - กรณีเวลาเข้าร่วมใกล้เคียงกันมาก ให้พิจารณาถึงความสมดุลของทีม
-        
-        4. ลำดับความสำคัญในการเลือกผู้เล่น:
-           - อันดับแรก: เลือกผู้เล่นที่มีจำนวนแมชต์น้อยที่สุด
-           - หากจำนวนแมชต์เท่ากัน:
-             * พิจารณาเวลาที่เข้าร่วมใกล้เคียงกัน
-             * เลือกผู้เล่นที่เข้าร่วมก่อน
-           - ผู้เล่นที่มีจำนวนแมชต์มากจะได้รับการพิจารณาเป็นลำดับสุดท้าย
-           
-           # เพิ่มเกณฑ์การพิจารณาสำรอง
-           - หากยังคงมีความไม่ชัดเจน ให้คำนึงถึงความสมดุลของทักษะเป็นลำดับสุดท้าย
-        
-        หมายเหตุเพิ่มเติม:
-        - เป้าหมายคือกระจายโอกาสอย่างเป็นธรรม
-        - คำนึงถึงความสมดุลของทักษะและโอกาสในการเล่น
-        - ไม่ให้ผู้เล่นคนเดิมๆ ได้เปรียบในการเล่นซ้ำๆ
-        
-        # เพิ่มหลักการสำคัญ
-        - หากมีความขัดแย้งระหว่างกฎ ให้ยึดหลักความเป็นธรรมและความสมดุลเป็นหลัก
-        
-        เมื่อเลือกผู้เล่นที่จะจัดทีมมาได้ 4 คนแล้ว ต่อไปคือกฎการจัดทีม
-        
-        กฎการจัดทีม:
-        1.จับคู่ให้ทั้งสองทีมมีความสมดุลกัน โดยเน้นจากทักษะของผู้เล่นที่เลือกมา
-                
-                ตัวอย่างที่ถูกต้อง: 
-                - ถ้ามีผู้เล่น 4 คน โดยเป็นระดับ S 2 คน และ P- 2 คน ควรจับให้แต่ละทีมมี S 1 คน และ P- 1 คน
-                - ถ้ามีผู้เล่น 4 คน โดยเป็นระดับ N 1 คน, S 2 คน และ P- 1 คน ควรจับให้ทีมหนึ่งมี P- กับ N อีกทีมมี S กับ S เนื่องจาก P- เก่งกว่า S และ S เก่งกว่า N จัดแบบนี้จึงเหมาะสม
-                
-                ตัวอย่างที่ไม่ถูกต้อง:
-                - จับให้ผู้เล่นระดับเดียวกัน อยู่ในทีมเดียวกัน เจอผู้เล่นคนละระดับอยู่ทีมตรงข้ามทั้งหมด
-                
-        2. จำนวนแมชต์ในที่นี้หมายถึงจำนวนแมชต์ที่เล่นไปตั้งแต่เข้าร่วมห้องนี้ ไม่ได้หมายถึงประสบการณ์ ดังนั้นคนที่จำนวนแมชต์เยอะ หมายถึงแรงจะน้อยลง ไม่เกี่ยวกับประสบการณ์
-                
-        ทักษะจะมีการจัดประเภทดังนี้:
-        BG: ทักษะต่ำสุด พอตีลูกโดนบ้าง แทบไม่มีพื้นฐานการตี
-        N: ตีลูกโดนบ่อยขึ้น แต่อาจจะไม่ 100% เมื่อตีลูกยากๆ และเล่นลูกที่ใช้ทักษะสูงๆได้ไม่ดีมากเช่น backhand, การวิ่ง, ลูกตบ
-        S: ตีลูกโดน มีความชัวร์ในการตี มีเบสิคตีลุกต่างๆได้ครบ แต่ถ้าทางการตีอาจจะไม่สวยเท่าคนที่เรียนมา ส่วนใหญ่คนพวกนี้คือคนที่เล่นมานาน
-        P-: เก่งกว่า S และอาจเคยเรียนมาก่อน มีแรงและความไวที่มากขึ้น ถึงแม้ท่าทางอาจไม่สวย แต่ลูกที่ตีออกไปมักค่อนข้างมีประสิทธิภาพ
-        P/P+: มีทักษะระดับเป็นนักกีฬาเก่า หรือเป็นโค้ชสอนแบด มีเบสิค แรง ความเร็ว ครบถ้วน
-        C: เป็นนักกีฬาหรือเคยเป็นนักกีฬาอาชีพ มีทักษะสูงมากๆ
-        B/A: เป็นทีมชาติหรืออดีตทีมชาติ
-
-
-        เลือกคน 2 คู่ เพื่อมาแข่งขันกัน และตอบกลับเป็น JSON ที่มีโครงสร้างดังนี้เท่านั้น:
-        {{
-          "teams": [
-            {{
-              "team_name": "ชื่อทีม 1",
-              "players": [
-                {{ "id": player_id, "name": "player_name", "skill": "skill_level" }},
-                {{ "id": player_id, "name": "player_name", "skill": "skill_level" }}
-              ],
-              "compatibility_score": 85 // คะแนนความเข้ากันของคู่นี้ (0-100)
-            }},
-            {{
-              "team_name": "ชื่อทีม 2",
-              "players": [
-                {{ "id": player_id, "name": "player_name", "skill": "skill_level" }},
-                {{ "id": player_id, "name": "player_name", "skill": "skill_level" }}
-              ],
-              "compatibility_score": 82
-            }}
-          ],
-          "match": {{
-            "team1": "ชื่อทีม 1",
-            "team2": "ชื่อทีม 2",
-            "balance_score": 90,  // คะแนนความสมดุลของการแข่งขัน (0-100)
-          }},
-          "analysis": "คำอธิบายการจับคู่และเหตุผล รวมถึงข้อแนะนำอื่นๆ"
-        }}
-
-        ห้ามมีข้อความอื่นๆ นอกเหนือจาก JSON ที่กำหนด ชื่อทีมให้กำหนดเป็น ทีมที่ 1 กับ ทีมที่ 2 เท่านั้น analysis ให้ตอบเป็นภาษาไทยเท่านั้น
+    def build_request(self, room_data, tool=MATCHMAKING_TOOL, max_tokens=MATCHMAKING_MAX_TOKENS):
+        system_prompt, user_prompt = self.build_prompts(room_data, tool)
+        return {
+            "model": self.model,
+            "system": system_prompt,
+            "messages": [
+                {"role": "user", "content": user_prompt}
+            ],
+            "tools": [tool],
+            "tool_choice": {"type": "tool", "name": tool["name"]},
+            "max_tokens": max_tokens,
+            "temperature": 0.3
+        }
+
+    def build_analysis_request(self, players, result):
+        """
+        prompt ของ phase ที่สอง: ส่งเฉพาะผู้เล่น 4 คนที่ถูกเลือกกับทีมที่จัดไว้แล้ว ไม่ต้องส่งทั้งห้อง
         """
+        player_table = self.format_player_table(self.build_player_list({'players': players}))
+        teams = "\n".join(
+            f"{team['team_name']}: "
+            + ", ".join(f"{p['name']} ({p['skill']})" for p in team['players'])
+            + f" (ความเข้ากัน {team['compatibility_score']})"
+            for team in result['teams']
+        )
 
-        response = None
+        user_prompt = f"""ผู้เล่นที่ถูกเลือก ({PLAYER_TABLE_HEADER}):
 
-        try:
-            response = self.client.messages.create(
-                model=self.model,
-                system=system_prompt,
-                messages=[
-                    {"role": "user", "content": user_prompt}
-                ],
-                max_tokens=1000,
-                temperature=0.3
-            )
-
-            # แปลงข้อความตอบกลับเป็น JSON
-            result_text = response.content[0].text.strip()
-
-            # ลบเครื่องหมาย ``` ออกถ้ามี (กรณีที่ Claude ตอบกลับเป็น code block)
-            if result_text.startswith('```json'):
-                result_text = result_text.replace('```json', '', 1)
-                if result_text.endswith('```'):
-                    result_text = result_text[:-3]
-            elif result_text.startswith('```'):
-                result_text = result_text.replace('```', '', 1)
-                if result_text.endswith('```'):
-                    result_text = result_text[:-3]
-
-            result_text = result_text.strip()
-
-            # แปลง JSON string เป็น Python dictionary
-            matchmaking_data = json.loads(result_text)
-
-            # ปรับโครงสร้าง response ให้รองรับการแสดงผลที่ต้องการ
-            return {
-                "teams": matchmaking_data.get("teams", []),
-                "match": matchmaking_data.get("match", {}),
-                "analysis": matchmaking_data.get("analysis", ""),
-                "model_used": self.model
-            }
+{player_table}
 
-        except json.JSONDecodeError as e:
+ทีมที่จัดไว้แล้ว:
+{teams}
+คะแนนความสมดุลของแมชต์: {result['match']['balance_score']}
+
+กรุณาอธิบายเหตุผลของการจับคู่นี้และข้อแนะนำอื่นๆ"""
+
+        return {
+            "model": self.model,
+            "system": ANALYSIS_SYSTEM_PROMPT,
+            "messages": [
+                {"role": "user", "content": user_prompt}
+            ],
+            "max_tokens": ANALYSIS_MAX_TOKENS,
+            "temperature": 0.3
+        }
+
+    def parse_response(self, response):
+        """
+        อ่านผลการจับคู่จาก tool_use block ของ Claude
+        """
+        for block in response.content:
+            if block.type == "tool_use":
+                return self.to_result(block.input)
+
+        # ไม่มี tool_use (ไม่ควรเกิดเมื่อบังคับ tool_choice) จึงลองอ่านจากข้อความแทน
+        return self.parse_response_text(self.response_text(response))
+
+    def response_text(self, response):
+        return "".join(
+            json.dumps(block.input, ensure_ascii=False) if block.type == "tool_use" else getattr(block, "text", "")
+            for block in response.content
+        )
+
+    def parse_response_text(self, result_text):
+        """
+        แปลงข้อความตอบกลับของ Claude เป็นผลลัพธ์การจับคู่
+        """
+        # json_scanner ข้าม code block/ข้อความรอบ ๆ และซ่อม comment หรือ trailing comma ให้ในรอบเดียว
+        matchmaking_data = self.load_json(result_text, {})
+
+        # ปรับโครงสร้าง response ให้รองรับการแสดงผลที่ต้องการ
+        return self.to_result(matchmaking_data)
+
+    def error_result(self, error, response=None):
+        if isinstance(error, json.JSONDecodeError):
             # กรณีที่ AI ไม่ได้ตอบกลับในรูปแบบ JSON ที่ถูกต้อง
             error_data = {
                 "error": "Could not parse AI response as JSON",
@@ -211,14 +282,86 @@ class ClaudeService:
 
             # เพิ่ม raw_response เฉพาะเมื่อ response มีค่า
             if response:
-                error_data["raw_response"] = response.content[0].text
+                error_data["raw_response"] = self.response_text(response)
 
             return error_data
+
+        # จัดการ error อื่นๆ
+        error_data = {
+            "error": str(error),
+            "model_used": self.model
+        }
+        if isinstance(error, MatchmakingSchemaError) and response:
+            error_data["raw_response"] = self.response_text(response)
+        return error_data
+
+    def generate_matchmaking(self, room_data):
+        response = None
+
+        try:
+            response = self.client.messages.create(**self.build_request(room_data))
+            return self.parse_response(response)
+
         except Exception as e:
-            # จัดการ error อื่นๆ
-            return {
-                "error": str(e),
-                "model_used": self.model
-            }
+            return self.error_result(e, response)
 
+    def generate_teams(self, room_data):
+        """
+        เลือกทีมอย่างเดียวผ่าน TEAMS_TOOL ด้วย max_tokens ต่ำ คำวิเคราะห์สร้างภายหลังด้วย generate_analysis
+        """
+        response = None
 
+        try:
+            response = self.client.messages.create(**self.build_request(room_data, TEAMS_TOOL, TEAMS_MAX_TOKENS))
+            for block in response.content:
+                if block.type == "tool_use":
+                    return self.to_teams_result(block.input)
+            return self.to_teams_result(self.load_json(self.response_text(response), {}))
+
+        except Exception as e:
+            return self.error_result(e, response)
+
+    def generate_analysis(self, players, result):
+        """
+        phase ที่สอง: คำวิเคราะห์ภาษาไทยของทีมที่ generate_teams เลือกไว้
+        """
+        try:
+            response = self.client.messages.create(**self.build_analysis_request(players, result))
+            analysis = self.response_text(response).strip()
+            if not analysis:
+                raise ValueError("Empty analysis from model")
+            return {"analysis": analysis, "model_used": self.model}
+
+        except Exception as e:
+            return self.error_result(e)
+
+    async def agenerate_matchmaking(self, room_data):
+        """
+        เหมือน generate_matchmaking แต่ใช้ AsyncAnthropic จึงไม่บล็อก event loop ระหว่างรอ Claude
+        """
+        response = None
+
+        try:
+            response = await self.async_client.messages.create(**self.build_request(room_data))
+            return self.parse_response(response)
+
+        except Exception as e:
+            return self.error_result(e, response)
+
+    def stream_matchmaking(self, room_data):
+        """
+        ส่ง JSON ของ tool input จาก Claude ออกมาทีละ chunk ผ่าน streaming API
+        """
+        with self.client.messages.stream(**self.build_request(room_data)) as stream:
+            for event in stream:
+                if event.type == "content_block_delta" and event.delta.type == "input_json_delta":
+                    yield event.delta.partial_json
+
+    async def astream_matchmaking(self, room_data):
+        """
+        stream_matchmaking แบบ async ผ่าน AsyncAnthropic
+        """
+        async with self.async_client.messages.stream(**self.build_request(room_data)) as stream:
+            async for event in stream:
+                if event.type == "content_block_delta" and event.delta.type == "input_json_delta":
+                    yield event.delta.partial_json
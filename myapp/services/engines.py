@@ -0,0 +1,28 @@
+from .claude_service import ClaudeService
+from .huggingface_service import HuggingFaceService
+from .local_matchmaking_service import LocalMatchmakingService
+from .ollama_service import OllamaService
+from .registry import ProviderRegistry
+
+claude_service = ClaudeService()
+ollama_service = OllamaService()
+huggingface_service = HuggingFaceService()
+local_matchmaking_service = LocalMatchmakingService()
+
+# ลำดับการลงทะเบียนคือลำดับที่ใช้ก่อนมีสถิติ latency
+provider_registry = ProviderRegistry()
+provider_registry.register(claude_service.name, claude_service)
+provider_registry.register(ollama_service.name, ollama_service)
+provider_registry.register(huggingface_service.name, huggingface_service)
+provider_registry.register(local_matchmaking_service.name, local_matchmaking_service, fallback_only=True)
+
+MATCHMAKING_ENGINES = provider_registry.providers
+
+# engine ที่เลือกได้ผ่าน ?engine=... โดย auto ให้ registry เลือก provider ที่เร็วที่สุดที่ยังปกติ
+AUTO_ENGINE = 'auto'
+ENGINE_CHOICES = [AUTO_ENGINE] + list(MATCHMAKING_ENGINES)
+DEFAULT_MATCHMAKING_ENGINE = AUTO_ENGINE
+
+
+def preferred_provider(engine):
+    return None if engine == AUTO_ENGINE else engine
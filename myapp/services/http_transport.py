@@ -0,0 +1,126 @@
+import asyncio
+import os
+import threading
+import weakref
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# ค่าเริ่มต้นของ transport ที่ provider ทุกตัวใช้ร่วมกัน ปรับได้ผ่าน environment variable
+CONNECT_TIMEOUT = float(os.environ.get("PROVIDER_CONNECT_TIMEOUT", 5))
+READ_TIMEOUT = float(os.environ.get("PROVIDER_READ_TIMEOUT", 120))
+MAX_RETRIES = int(os.environ.get("PROVIDER_MAX_RETRIES", 2))
+BACKOFF_FACTOR = float(os.environ.get("PROVIDER_BACKOFF_FACTOR", 0.5))
+POOL_MAXSIZE = int(os.environ.get("PROVIDER_POOL_MAXSIZE", 10))
+# เวลารอสูงสุดก่อน retry แต่ละครั้ง (วินาที) ใช้กับทั้ง backoff และ Retry-After ที่ provider ส่งมา
+MAX_RETRY_DELAY = float(os.environ.get("PROVIDER_MAX_RETRY_DELAY", 10))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_sessions = {}
+_async_clients = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def provider_timeout():
+    return httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+
+class BoundedRetry(Retry):
+    """
+    Retry ที่รอตาม Retry-After ได้ไม่เกิน MAX_RETRY_DELAY (urllib3 รอตามค่าที่ส่งมาโดยไม่จำกัด)
+    """
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, MAX_RETRY_DELAY)
+
+
+def _build_session():
+    # ไม่ retry เมื่อ read ล้มเหลว เพราะโมเดลอาจประมวลผลไปแล้วและจะเสียค่าใช้จ่ายซ้ำ
+    retry = BoundedRetry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        read=0,
+        status=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        backoff_max=MAX_RETRY_DELAY,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET", "POST"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session():
+    """
+    requests.Session ที่ใช้ร่วมกันภายในโปรเซส (แยกตาม pid เพราะ connection pool ใช้ข้าม fork ไม่ได้)
+    """
+    pid = os.getpid()
+    session = _sessions.get(pid)
+    if session is None:
+        with _lock:
+            session = _sessions.get(pid)
+            if session is None:
+                session = _sessions[pid] = _build_session()
+    return session
+
+
+def post(url, **kwargs):
+    """
+    requests.post ผ่าน connection pool ที่ keep-alive พร้อม timeout และ retry แบบ backoff
+    """
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    return get_session().post(url, **kwargs)
+
+
+def get_async_client():
+    """
+    httpx.AsyncClient ที่ใช้ร่วมกันภายใน event loop เดียวกัน
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = _async_clients[loop] = httpx.AsyncClient(
+            timeout=provider_timeout(),
+            limits=httpx.Limits(max_keepalive_connections=POOL_MAXSIZE),
+            transport=httpx.AsyncHTTPTransport(retries=MAX_RETRIES),
+        )
+    return client
+
+
+def retry_delay(attempt, response):
+    """
+    เวลารอก่อน retry ครั้งถัดไป: Retry-After ถ้ามี ไม่งั้น backoff แบบ exponential ไม่เกิน MAX_RETRY_DELAY
+    """
+    retry_after = response.headers.get("Retry-After", "")
+    delay = int(retry_after) if retry_after.isdigit() else BACKOFF_FACTOR * (2 ** attempt)
+    return min(delay, MAX_RETRY_DELAY)
+
+
+async def apost(url, **kwargs):
+    """
+    post แบบ async ที่ retry เมื่อได้สถานะ 5xx/429 เหมือนกับ post
+    """
+    client = get_async_client()
+    for attempt in range(MAX_RETRIES + 1):
+        response = await client.post(url, **kwargs)
+        if response.status_code not in RETRY_STATUSES or attempt == MAX_RETRIES:
+            return response
+        await asyncio.sleep(retry_delay(attempt, response))
+
+
+def astream(url, **kwargs):
+    """
+    POST แบบ async ที่อ่าน body ทีละส่วน ใช้กับ async with:
+    async with astream(url, json=payload) as response: ...
+    (ไม่ retry ตามสถานะ เพราะ body ของ stream ถูกส่งต่อให้ client ทันทีที่ได้รับ)
+    """
+    return get_async_client().stream("POST", url, **kwargs)
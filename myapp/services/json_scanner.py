@@ -0,0 +1,269 @@
+import json
+import re
+
+# ช่วงตัวอักษรธรรมดาที่ข้ามได้ทีละก้อน ทำให้ scanner ไม่ต้องวนทีละตัวอักษร
+_PLAIN_RUN = re.compile(r'[^"\'{}\[\],:/\s]+')
+_STRING_RUN = {
+    '"': re.compile(r'[^"\\\n\r\t]+'),
+    "'": re.compile(r'[^\'"\\\n\r\t]+'),
+}
+_CONTROL_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+
+# ชนิดของ event ที่ feed() คืน
+VALUE = 'value'
+DELTA = 'delta'
+# path ของทุกสมาชิกใน array
+ANY = '*'
+
+
+class TruncatedJsonError(json.JSONDecodeError):
+    """
+    ข้อความจบก่อน JSON ระดับบนสุดจะปิดครบ เช่นโมเดลชน max_tokens
+    """
+
+
+class JsonScanner:
+    """
+    สแกนข้อความจากโมเดลรอบเดียวแบบเชิงเส้น หา JSON object ระดับบนสุดที่สมบูรณ์โดยรู้จัก string และ escape
+    และซ่อมปัญหาที่พบบ่อยไปพร้อมกัน: trailing comma, comment แบบ // และ /* */,
+    string ที่ใช้ single quote และการขึ้นบรรทัดใหม่ภายใน string
+
+    feed() รับข้อความทีละ chunk ได้ จึงใช้กับ stream ได้โดยไม่ต้องสแกนซ้ำ และคืนรายการ event (ชนิด, path, ข้อมูล):
+    - (VALUE, (), json) เมื่อ object ระดับบนสุดครบ
+    - (VALUE, path, json) เมื่อค่าที่ path อยู่ใน watch ครบ เช่น ('teams', ANY) คือแต่ละทีม
+    - (DELTA, path, ข้อความ) ส่วนของ string ที่ path อยู่ใน deltas ที่ถอดรหัสแล้ว ระหว่างที่ยังเขียนไม่จบ
+    path นับเฉพาะ object/array ที่ซ้อนกัน และค่าใน watch ต้องเป็น object, array หรือ string
+    """
+
+    def __init__(self, watch=(), deltas=()):
+        self.watch = frozenset(watch)
+        self.deltas = frozenset(deltas)
+        # ไม่ต้องจำ key ของชั้นที่ลึกกว่า path ที่ยาวที่สุด
+        self.track_depth = max(map(len, self.watch | self.deltas), default=0)
+        # แต่ละชั้นคือ [วงเล็บเปิด, key ปัจจุบัน (object) หรือ ANY (array)]
+        self.stack = []
+        self.out = []
+        self.pending = []
+        self.quote = None
+        self.escape = False
+        self.comment = None
+        self.star = False
+        self.slash = False
+        self.expect_key = False
+        self.key_start = None
+        # ค่าที่ถูก watch และยังไม่จบ: (path, ตำแหน่งใน out, ความลึก)
+        self.values = []
+        # string ที่กำลังส่ง delta: [path, ตำแหน่งใน out ที่ยังไม่ได้ถอดรหัส, ส่วนท้ายที่ค้างไว้รอ chunk ถัดไป]
+        self.delta = None
+        self.done = False
+
+    def feed(self, chunk):
+        """
+        ประมวลผล chunk ต่อจากสถานะเดิม และคืนรายการ event ที่เกิดขึ้นจาก chunk นี้
+        """
+        events = []
+        i = 0
+        n = len(chunk)
+
+        while i < n and not self.done:
+            if not self.stack:
+                # ข้ามข้อความก่อน JSON เช่นคำอธิบายหรือ ```json
+                start = chunk.find('{', i)
+                if start == -1:
+                    break
+                self.stack.append(['{', None])
+                self.out.append('{')
+                self.expect_key = True
+                i = start + 1
+                continue
+
+            c = chunk[i]
+
+            if self.comment == '//':
+                if c == '\n':
+                    self.comment = None
+                i += 1
+                continue
+
+            if self.comment == '/*':
+                if self.star and c == '/':
+                    self.comment = None
+                self.star = c == '*'
+                i += 1
+                continue
+
+            if self.quote:
+                if self.escape:
+                    self.escape = False
+                    # JSON ไม่มี \' จึงแปลงเป็น ' ธรรมดา
+                    self.out.append("'" if c == "'" else '\\' + c)
+                elif c == '\\':
+                    self.escape = True
+                elif c == self.quote:
+                    self.out.append('"')
+                    self.quote = None
+                    self._close_string(events)
+                elif c == '"':
+                    self.out.append('\\"')
+                elif c in _CONTROL_ESCAPES:
+                    self.out.append(_CONTROL_ESCAPES[c])
+                else:
+                    run = _STRING_RUN[self.quote].match(chunk, i)
+                    self.out.append(run.group())
+                    i = run.end()
+                    continue
+                i += 1
+                continue
+
+            if self.slash:
+                self.slash = False
+                if c == '/':
+                    self.comment = '//'
+                    i += 1
+                    continue
+                if c == '*':
+                    self.comment = '/*'
+                    self.star = False
+                    i += 1
+                    continue
+                self._flush_pending()
+                self.out.append('/')
+
+            if c.isspace():
+                (self.pending if self.pending else self.out).append(c)
+            elif c == ',':
+                if not self.pending:
+                    self.pending.append(',')
+                self.expect_key = self.stack[-1][0] == '{'
+            elif c == ':':
+                self._flush_pending()
+                self.out.append(':')
+                self.expect_key = False
+            elif c in '}]':
+                # comma ที่ค้างอยู่ก่อนวงเล็บปิดคือ trailing comma จึงทิ้งไป
+                self.pending = []
+                self.stack.pop()
+                self.out.append(c)
+                self.expect_key = False
+                if not self.stack:
+                    events.append((VALUE, (), ''.join(self.out)))
+                    self.done = True
+                else:
+                    self._close_value(events)
+            elif c in '{[':
+                self._flush_pending()
+                self._open_value()
+                self.stack.append([c, None if c == '{' else ANY])
+                self.out.append(c)
+                self.expect_key = c == '{'
+            elif c in '"\'':
+                self._flush_pending()
+                if self.expect_key and self.stack[-1][0] == '{':
+                    self.key_start = len(self.out)
+                else:
+                    self._open_value(string=True)
+                self.out.append('"')
+                self.quote = c
+            elif c == '/':
+                self.slash = True
+            else:
+                self._flush_pending()
+                run = _PLAIN_RUN.match(chunk, i)
+                self.out.append(run.group())
+                i = run.end()
+                continue
+            i += 1
+
+        if self.quote and self.delta is not None:
+            self._emit_delta(events)
+        return events
+
+    def finish(self):
+        """
+        จบ stream: ถ้า JSON เริ่มแล้วแต่ยังไม่ปิด (เช่นโมเดลชน max_tokens) ถือว่าข้อความถูกตัดและ raise TruncatedJsonError
+        """
+        if self.stack and not self.done:
+            text = ''.join(self.out)
+            raise TruncatedJsonError("Model output ended before the JSON was complete", text, len(text))
+
+    def _path(self):
+        return tuple(frame[1] for frame in self.stack)
+
+    def _open_value(self, string=False):
+        if len(self.stack) > self.track_depth:
+            return
+        path = self._path()
+        if path in self.watch:
+            self.values.append((path, len(self.out), len(self.stack)))
+        if string and path in self.deltas:
+            self.delta = [path, len(self.out) + 1, '']
+
+    def _close_value(self, events):
+        # ค่าที่ถูก watch จบเมื่อกลับมาที่ความลึกเดียวกับตอนเริ่ม
+        if self.values and self.values[-1][2] == len(self.stack):
+            path, start, _ = self.values.pop()
+            events.append((VALUE, path, ''.join(self.out[start:])))
+
+    def _close_string(self, events):
+        if self.key_start is not None:
+            if len(self.stack) <= self.track_depth:
+                try:
+                    self.stack[-1][1] = json.loads(''.join(self.out[self.key_start:]))
+                except json.JSONDecodeError:
+                    self.stack[-1][1] = None
+            self.key_start = None
+            return
+        if self.delta is not None:
+            self._emit_delta(events, closed=True)
+            self.delta = None
+        self._close_value(events)
+
+    def _emit_delta(self, events, closed=False):
+        """
+        ถอดรหัสเฉพาะส่วนที่เพิ่มเข้ามาใน out ตั้งแต่ครั้งก่อน โดยไม่ตัดกลาง \\uXXXX หรือคู่ surrogate
+        ส่วนท้ายที่ยังถอดรหัสไม่ได้เก็บไว้ต่อหน้า chunk ถัดไป งานรวมจึงเป็นเชิงเส้นตามความยาว string
+        """
+        path, index, carry = self.delta
+        end = len(self.out) - 1 if closed else len(self.out)
+        raw = carry + ''.join(self.out[index:end])
+        self.delta[1] = end
+        carry = ''
+        if not closed:
+            # escape อื่นถูกเขียนลง out ทั้งก้อนแล้ว เหลือแค่ \u ที่เลขฐานสิบหกอาจยังมาไม่ครบ
+            unicode_escape = raw.rfind('\\u', max(0, len(raw) - 5))
+            if unicode_escape != -1:
+                # \\u คือ backslash ตามด้วย u ธรรมดา ต้องนับ backslash ที่ติดกันว่าเป็นเลขคี่
+                backslashes = unicode_escape + 1 - len(raw[:unicode_escape + 1].rstrip('\\'))
+                if backslashes % 2:
+                    raw, carry = raw[:unicode_escape], raw[unicode_escape:]
+        try:
+            decoded = json.loads('"' + raw + '"')
+        except json.JSONDecodeError:
+            # escape ที่ผิดรูปแบบ ข้ามส่วนนี้ไปเลยแทนที่จะเก็บไว้ถอดซ้ำ
+            self.delta[2] = carry
+            return
+        if not closed and decoded and '\ud800' <= decoded[-1] <= '\udbff':
+            # เก็บ high surrogate ไว้รอคู่ของมันใน chunk ถัดไป
+            held = 6 if raw[-6:-4] == '\\u' else 1
+            carry = raw[-held:] + carry
+            decoded = decoded[:-1]
+        self.delta[2] = carry
+        if decoded:
+            events.append((DELTA, path, decoded))
+
+    def _flush_pending(self):
+        if self.pending:
+            self.out.extend(self.pending)
+            self.pending = []
+
+
+def extract_json(text):
+    """
+    คืนข้อความ JSON (ที่ซ่อมแล้ว) ของ object แรกในข้อความ หรือ None ถ้าไม่พบ
+    ถ้า object ถูกตัดกลางทางจะ raise TruncatedJsonError
+    """
+    scanner = JsonScanner()
+    for _, _, value in scanner.feed(text):
+        return value
+    scanner.finish()
+    return None
@@ -0,0 +1,289 @@
+import logging
+
+from .base_service import BaseMatchmakingService
+
+# ลำดับทักษะจากอ่อนไปเก่ง ตามที่ระบุไว้ใน prompt ของ ClaudeService
+SKILL_ORDER = ['BG', 'N', 'S', 'P-', 'P/P+', 'C', 'B/A']
+SKILL_ALIASES = {'P': 'P/P+', 'P+': 'P/P+', 'B': 'B/A', 'A': 'B/A'}
+SKILL_RANK = {skill: rank for rank, skill in enumerate(SKILL_ORDER)}
+
+# ทักษะที่ไม่รู้จักจะถูกนับเป็นระดับ S (ระดับกลาง)
+DEFAULT_SKILL_RANK = SKILL_RANK['S']
+
+# ช่วงทักษะสูงสุดที่ยอมรับได้ในแมชต์เดียวกัน (ห้ามต่างกันเกิน 1 ขั้น)
+MAX_SKILL_SPREAD = 1
+
+# penalty ต่อครั้งที่เคยเป็นคู่หู/คู่แข่งกันมาก่อน (หน่วยเดียวกับความต่างทักษะของสองทีม)
+PARTNER_REPEAT_PENALTY = 0.5
+OPPONENT_REPEAT_PENALTY = 0.125
+# ประวัติเปลี่ยนการแบ่งทีมได้ไม่เกินความต่างทักษะ 1 ขั้น ทีมจึงไม่เสียสมดุลเพื่อเลี่ยงคู่ซ้ำ
+MAX_HISTORY_PENALTY = 1
+
+
+def skill_rank(skill):
+    """
+    แปลงระดับทักษะเป็นตัวเลขตามลำดับ BG → N → S → P- → P/P+ → C → B/A
+    """
+    key = (skill or '').strip().upper()
+    key = SKILL_ALIASES.get(key, key)
+    return SKILL_RANK.get(key, DEFAULT_SKILL_RANK)
+
+
+class LocalMatchmakingService(BaseMatchmakingService):
+    """
+    ตัวจับคู่แบบ deterministic ที่ทำงานในโปรเซส ใช้กฎเดียวกับ prompt ของ LLM:
+    จำนวนแมชต์น้อยก่อน, เวลาเข้าร่วมเป็นปัจจัยรอง, ทักษะห่างกันไม่เกิน 1 ขั้น
+    และจัดทีมให้ไขว้กันอย่างสมดุล
+    """
+
+    name = "local"
+
+    def __init__(self):
+        self.model = "local"
+        self.logger = logging.getLogger(__name__)
+
+    def build_queue(self, players):
+        """
+        เรียงผู้เล่นตามคิว: จำนวนแมชต์ → เวลาเข้าร่วม → id
+        """
+        queue = []
+        for p in players:
+            queue.append({
+                'id': p['id'],
+                'name': p['name'],
+                'skill': p['skill'],
+                'rank': skill_rank(p['skill']),
+                'join_time': p.get('join_time') or '',
+                'number_of_matches': p.get('number_of_matches', 0) or 0,
+            })
+        queue.sort(key=lambda p: (p['number_of_matches'], p['join_time'], p['id']))
+        for position, p in enumerate(queue):
+            p['position'] = position
+        return queue
+
+    def _window_candidates(self, queue, spread):
+        """
+        หา 4 คนแรกในคิวของแต่ละช่วงทักษะกว้าง spread ขั้น
+        เนื่องจากคิวเรียงตามความเป็นธรรมแล้ว 4 คนแรกของแต่ละช่วงจึงดีที่สุดของช่วงนั้น
+        และหยุดสแกนทันทีเมื่อทุกช่วงได้ครบ 4 คน
+        """
+        windows = {low: [] for low in range(len(SKILL_ORDER) - spread)}
+        open_windows = len(windows)
+
+        for p in queue:
+            for low in range(max(0, p['rank'] - spread), min(p['rank'], len(windows) - 1) + 1):
+                window = windows[low]
+                if len(window) < 4:
+                    window.append(p)
+                    if len(window) == 4:
+                        open_windows -= 1
+            if open_windows == 0:
+                break
+
+        return [window for window in windows.values() if len(window) == 4]
+
+    def quartet_cost(self, quartet):
+        return (
+            sum(p['number_of_matches'] for p in quartet),
+            sum(p['position'] for p in quartet),
+        )
+
+    def select_quartet(self, queue):
+        """
+        เลือกผู้เล่น 4 คนที่ได้คิวก่อนที่สุดโดยที่ช่วงทักษะไม่เกิน MAX_SKILL_SPREAD
+        ถ้าไม่มีกลุ่มไหนผ่านเงื่อนไข จะขยายช่วงทักษะทีละขั้นจนกว่าจะหาได้
+        """
+        for spread in range(MAX_SKILL_SPREAD, len(SKILL_ORDER)):
+            candidates = self._window_candidates(queue, spread)
+            if candidates:
+                return min(candidates, key=self.quartet_cost)
+        return None
+
+    def team_splits(self, quartet):
+        """
+        คืนค่าการแบ่งทีมทั้ง 3 แบบ เรียงให้แบบไขว้ (เก่งสุดคู่กับอ่อนสุด) มาก่อน
+        """
+        a, b, c, d = sorted(quartet, key=lambda p: (-p['rank'], p['position']))
+        return [((a, d), (b, c)), ((a, c), (b, d)), ((a, b), (c, d))]
+
+    def split_cost(self, split):
+        team1, team2 = split
+        return abs(sum(p['rank'] for p in team1) - sum(p['rank'] for p in team2))
+
+    def history_cost(self, split, history):
+        """
+        penalty ของการแบ่งทีมที่ให้คนเดิมเป็นคู่หูหรือคู่แข่งกันซ้ำ จาก PairHistory ของห้อง
+        """
+        if not history:
+            return 0
+        team1, team2 = split
+        repeats = (
+            PARTNER_REPEAT_PENALTY * sum(history.partnered(a['id'], b['id']) for a, b in (team1, team2))
+            + OPPONENT_REPEAT_PENALTY * sum(history.opposed(a['id'], b['id']) for a in team1 for b in team2)
+        )
+        return min(repeats, MAX_HISTORY_PENALTY)
+
+    def split_teams(self, quartet, history=None):
+        """
+        เลือกการแบ่งทีมที่ผลรวมระดับทักษะของสองทีมต่างกันน้อยที่สุด
+        โดยเลี่ยงคู่หู/คู่แข่งที่เคยเจอกันบ่อยถ้ามีประวัติของห้อง
+        """
+        return min(
+            self.team_splits(quartet),
+            key=lambda split: self.split_cost(split) + self.history_cost(split, history)
+        )
+
+    def _compatibility_score(self, team):
+        return max(0, 100 - 15 * abs(team[0]['rank'] - team[1]['rank']))
+
+    def _balance_score(self, split, spread):
+        penalty = 25 * self.split_cost(split) + 15 * max(0, spread - MAX_SKILL_SPREAD)
+        return max(0, 100 - penalty)
+
+    def build_analysis(self, quartet, split, spread):
+        matches = [p['number_of_matches'] for p in quartet]
+        ranks = [p['rank'] for p in quartet]
+        team1, team2 = split
+
+        analysis = (
+            f"เลือกผู้เล่นที่มีจำนวนแมชต์น้อยที่สุดก่อน (แมชต์ {min(matches)}–{max(matches)}) "
+            f"โดยใช้เวลาเข้าร่วมเป็นปัจจัยรอง ช่วงทักษะของผู้เล่นทั้ง 4 คนคือ "
+            f"{SKILL_ORDER[min(ranks)]}–{SKILL_ORDER[max(ranks)]} "
+        )
+        if spread > MAX_SKILL_SPREAD:
+            analysis += f"(ต่างกัน {spread} ขั้น เนื่องจากไม่มีผู้เล่นที่ทักษะใกล้เคียงกันพอในห้อง) "
+        analysis += (
+            f"จัดทีมแบบไขว้ให้ทีมที่ 1 ({team1[0]['skill']} กับ {team1[1]['skill']}) "
+            f"พบกับทีมที่ 2 ({team2[0]['skill']} กับ {team2[1]['skill']}) "
+            f"ผลรวมระดับทักษะของสองทีมต่างกัน {self.split_cost(split)} ขั้น"
+        )
+        return analysis
+
+    def build_result(self, quartet, split):
+        ranks = [p['rank'] for p in quartet]
+        spread = max(ranks) - min(ranks)
+
+        teams = []
+        for index, team in enumerate(split, start=1):
+            teams.append({
+                "team_name": f"ทีมที่ {index}",
+                "players": [
+                    {"id": p['id'], "name": p['name'], "skill": p['skill']}
+                    for p in team
+                ],
+                "compatibility_score": self._compatibility_score(team)
+            })
+
+        return {
+            "teams": teams,
+            "match": {
+                "team1": teams[0]["team_name"],
+                "team2": teams[1]["team_name"],
+                "balance_score": self._balance_score(split, spread)
+            },
+            "analysis": self.build_analysis(quartet, split, spread),
+            "model_used": self.model
+        }
+
+    def court_cost(self, quartet, history=None):
+        """
+        ต้นทุนของสนามหนึ่งสนาม: ช่วงทักษะที่เกินกำหนดสำคัญกว่าความต่างของสองทีมและคู่ซ้ำ
+        """
+        ranks = [p['rank'] for p in quartet]
+        violation = max(0, max(ranks) - min(ranks) - MAX_SKILL_SPREAD)
+        split = self.split_teams(quartet, history)
+        return violation * 10 + self.split_cost(split) + self.history_cost(split, history)
+
+    def improve_courts(self, courts, max_passes=10, history=None):
+        """
+        ปรับผู้เล่นระหว่างสนามแบบ pairwise swap เพื่อลดต้นทุนรวมของทุกสนาม
+        ผู้เล่นที่ถูกเลือกยังเป็นชุดเดิม จึงไม่กระทบความเป็นธรรมของคิว
+        """
+        costs = [self.court_cost(quartet, history) for quartet in courts]
+
+        for _ in range(max_passes):
+            improved = False
+            for i in range(len(courts)):
+                for j in range(i + 1, len(courts)):
+                    if costs[i] == 0 and costs[j] == 0:
+                        continue
+                    for x in range(4):
+                        for y in range(4):
+                            first = list(courts[i])
+                            second = list(courts[j])
+                            first[x], second[y] = second[y], first[x]
+                            first_cost = self.court_cost(first, history)
+                            second_cost = self.court_cost(second, history)
+                            if first_cost + second_cost < costs[i] + costs[j]:
+                                courts[i], courts[j] = first, second
+                                costs[i], costs[j] = first_cost, second_cost
+                                improved = True
+            if not improved:
+                break
+
+        return courts
+
+    def generate_batch_matchmaking(self, room_data, courts):
+        """
+        จัดแมชต์พร้อมกันหลายสนาม โดยไม่มีผู้เล่นซ้ำกันระหว่างสนาม
+        """
+        try:
+            queue = self.build_queue(room_data['players'])
+            history = room_data.get('pair_history')
+            court_count = min(courts, len(queue) // 4)
+            if court_count < 1:
+                raise Exception("Need at least 4 players for matchmaking")
+
+            # เลือกผู้เล่นทีละสนามตามคิว แล้วปรับสมดุลระหว่างสนามร่วมกัน
+            selected = []
+            remaining = queue
+            for _ in range(court_count):
+                quartet = self.select_quartet(remaining)
+                selected.append(quartet)
+                chosen = {p['id'] for p in quartet}
+                remaining = [p for p in remaining if p['id'] not in chosen]
+
+            selected = self.improve_courts(selected, history=history)
+
+            results = []
+            for number, quartet in enumerate(selected, start=1):
+                result = self.build_result(quartet, self.split_teams(quartet, history))
+                results.append({
+                    "court": number,
+                    "teams": result["teams"],
+                    "match": result["match"],
+                    "analysis": result["analysis"]
+                })
+
+            return {
+                "courts": results,
+                "waiting": [p['id'] for p in remaining],
+                "model_used": self.model
+            }
+
+        except Exception as e:
+            self.logger.error(f"Error in generate_batch_matchmaking: {str(e)}")
+            return {
+                "error": str(e),
+                "model_used": self.model
+            }
+
+    def generate_matchmaking(self, room_data):
+        try:
+            queue = self.build_queue(room_data['players'])
+            quartet = self.select_quartet(queue)
+            if quartet is None:
+                raise Exception("Need at least 4 players for matchmaking")
+
+            return self.build_result(quartet, self.split_teams(quartet, room_data.get('pair_history')))
+
+        except Exception as e:
+            self.logger.error(f"Error in generate_matchmaking: {str(e)}")
+            return {
+                "error": str(e),
+                "model_used": self.model
+            }
+
+    async def agenerate_matchmaking(self, room_data):
+        # คำนวณในโปรเซสใช้เวลาไม่ถึงมิลลิวินาที จึงเรียกตรงได้โดยไม่บล็อก event loop นาน
+        return self.generate_matchmaking(room_data)
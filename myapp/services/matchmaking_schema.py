@@ -0,0 +1,108 @@
+PLAYER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "id": {"type": "integer"},
+        "name": {"type": "string"},
+        "skill": {"type": "string"},
+    },
+    "required": ["id", "name", "skill"],
+    "additionalProperties": False,
+}
+
+TEAM_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "team_name": {"type": "string"},
+        "players": {"type": "array", "items": PLAYER_SCHEMA, "minItems": 2, "maxItems": 2},
+        "compatibility_score": {"type": "number", "minimum": 0, "maximum": 100},
+    },
+    "required": ["team_name", "players", "compatibility_score"],
+    "additionalProperties": False,
+}
+
+# โครงสร้างผลการจับคู่ที่ใช้ร่วมกันทุก provider: Claude (tool input_schema), Ollama (format)
+# และ Hugging Face (grammar) และใช้ตรวจผลลัพธ์ครั้งเดียวใน validate_matchmaking
+MATCHMAKING_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "teams": {"type": "array", "items": TEAM_SCHEMA, "minItems": 2, "maxItems": 2},
+        "match": {
+            "type": "object",
+            "properties": {
+                "team1": {"type": "string"},
+                "team2": {"type": "string"},
+                "balance_score": {"type": "number", "minimum": 0, "maximum": 100},
+            },
+            "required": ["team1", "team2", "balance_score"],
+            "additionalProperties": False,
+        },
+        "analysis": {"type": "string"},
+    },
+    "required": ["teams", "match", "analysis"],
+    "additionalProperties": False,
+}
+
+# phase แรกของการจับคู่แบบสองขั้น: เลือกทีมอย่างเดียว ไม่มีคำวิเคราะห์ คำตอบจึงสั้นและเร็ว
+TEAMS_SCHEMA = {
+    "type": "object",
+    "properties": {key: MATCHMAKING_SCHEMA["properties"][key] for key in ("teams", "match")},
+    "required": ["teams", "match"],
+    "additionalProperties": False,
+}
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+}
+
+
+class MatchmakingSchemaError(ValueError):
+    pass
+
+
+def _validate(value, schema, path):
+    expected = _TYPES[schema["type"]]
+    # bool เป็น subclass ของ int แต่ไม่ใช่ตัวเลขใน JSON Schema
+    if not isinstance(value, expected) or isinstance(value, bool):
+        raise MatchmakingSchemaError(f"{path}: expected {schema['type']}")
+
+    if schema["type"] == "object":
+        for key in schema.get("required", []):
+            if key not in value:
+                raise MatchmakingSchemaError(f"{path}.{key}: required")
+        if schema.get("additionalProperties") is False:
+            for key in value:
+                if key not in schema["properties"]:
+                    raise MatchmakingSchemaError(f"{path}.{key}: unexpected key")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                _validate(value[key], subschema, f"{path}.{key}")
+
+    elif schema["type"] == "array":
+        if len(value) < schema.get("minItems", 0) or len(value) > schema.get("maxItems", len(value)):
+            raise MatchmakingSchemaError(f"{path}: expected {schema.get('minItems')}-{schema.get('maxItems')} items")
+        for index, item in enumerate(value):
+            _validate(item, schema["items"], f"{path}[{index}]")
+
+    elif schema["type"] in ("integer", "number"):
+        if value < schema.get("minimum", value) or value > schema.get("maximum", value):
+            raise MatchmakingSchemaError(f"{path}: out of range")
+
+
+def validate_matchmaking(data):
+    """
+    ตรวจผลการจับคู่กับ MATCHMAKING_SCHEMA หากไม่ตรงจะ raise MatchmakingSchemaError
+    """
+    _validate(data, MATCHMAKING_SCHEMA, "$")
+    return data
+
+
+def validate_teams(data):
+    """
+    ตรวจผลการเลือกทีม (ไม่มี analysis) กับ TEAMS_SCHEMA
+    """
+    _validate(data, TEAMS_SCHEMA, "$")
+    return data
@@ -1,10 +1,14 @@
 import json
-import requests
-import re
 import logging
 
+from . import http_transport
+from .base_service import BaseMatchmakingService
+from .matchmaking_schema import MATCHMAKING_SCHEMA
+
+
+class OllamaService(BaseMatchmakingService):
+    name = "ollama"
 
-class OllamaService:
     def __init__(self):
         self.api_url = "http://localhost:11434/api/generate"
         self.model = "gemma3"
@@ -18,136 +22,109 @@ class OllamaService:
             handler.setFormatter(formatter)
             self.logger.addHandler(handler)
 
-    def clean_json_text(self, text):
-        """
-        พยายามแยกข้อความ JSON ออกมาจากข้อความที่ส่งกลับ
-        """
-        # วิธีที่ 1: หา JSON ที่ล้อมรอบด้วย ```json
-        if "```json" in text:
-            match = re.search(r"```json\s*([\s\S]*?)\s*```", text)
-            if match:
-                return match.group(1).strip()
-
-        # วิธีที่ 2: หา JSON ที่ล้อมรอบด้วย ```
-        if "```" in text:
-            match = re.search(r"```\s*([\s\S]*?)\s*```", text)
-            if match:
-                return match.group(1).strip()
-
-        # วิธีที่ 3: หา JSON ระหว่างวงเล็บปีกกา
-        match = re.search(r"(\{[\s\S]*\})", text)
-        if match:
-            return match.group(1).strip()
-
-        # ถ้าไม่พบ JSON ให้ตรวจสอบส่วนหลังของข้อความ
-        parts = text.split('\n')
-        for part in reversed(parts):
-            part = part.strip()
-            if part.startswith('{') and part.endswith('}'):
-                return part
-
-        # ถ้าไม่สามารถแยก JSON ได้ ส่งคืนข้อความเดิม
-        return text.strip()
-
-    def fix_json(self, text):
+    def build_payload(self, room_data):
+        # สำหรับ Gemma3 อาจต้องปรับ prompt ให้ชัดเจนขึ้น
+        system_prompt = """คุณเป็นผู้เชี่ยวชาญการจัดการแข่งขันแบดมินตัน โปรดตอบกลับในรูปแบบ JSON ที่ถูกต้อง"""
+
+        player_list = self.build_player_list(room_data)
+        player_info = self.format_player_info(player_list)
+
+        skill_levels = [p['skill'] for p in player_list]
+        skill_summary = ", ".join([f"{skill}: {skill_levels.count(skill)} คน" for skill in set(skill_levels)])
+
+        user_prompt = f"""จงจัดทีมแบดมินตันให้สมดุลที่สุด:
+
+        กฎการจัดทีม:
+        1. กระจายผู้เล่นทักษะต่างๆ อย่างเท่าเทียม
+        2. คำนึงถึงจำนวนแมตช์และเวลาที่เข้าร่วม
+        
+        รายชื่อผู้เล่น:
+        {player_info}
+        
+        
+        ตอบกลับเป็น JSON เท่านั้น ดังโครงสร้าง:
+        {{
+          "teams": [
+            {{
+              "team_name": "ทีมที่ 1",
+              "players": [
+                {{ "id": player_id, "name": "player_name", "skill": "skill_level" }},
+                {{ "id": player_id, "name": "player_name", "skill": "skill_level" }}
+              ],
+              "compatibility_score": 85
+            }},
+            {{
+              "team_name": "ทีมที่ 2",
+              "players": [
+                {{ "id": player_id, "name": "player_name", "skill": "skill_level" }},
+                {{ "id": player_id, "name": "player_name", "skill": "skill_level" }}
+              ],
+              "compatibility_score": 82
+            }}
+          ],
+          "match": {{
+            "team1": "ทีมที่ 1",
+            "team2": "ทีมที่ 2",
+            "balance_score": 90
+          }},
+          "analysis": "คำอธิบายการจับคู่และเหตุผล"
+        }}"""
+
+        # สำหรับ Gemma3 อาจใช้ prompt แบบง่ายขึ้น
+        payload = {
+            "model": self.model,
+            "prompt": user_prompt,
+            "stream": False,
+            # structured output: Ollama บังคับให้โมเดลสร้าง JSON ตาม schema
+            "format": MATCHMAKING_SCHEMA,
+            "options": {
+                "temperature": 0.2,
+                "top_p": 0.9,
+                "num_predict": 1024
+            }
+        }
+
+        return payload
+
+    def parse_generated_text(self, text, debug_info):
         """
-        พยายามแก้ไข JSON ที่ไม่ถูกต้อง
+        แปลงข้อความที่ Ollama สร้างเป็นผลลัพธ์การจับคู่
         """
-        # แก้ไขปัญหา single quotes แทน double quotes
-        text = re.sub(r"'([^']*)':\s*", r'"\1": ', text)
-        text = re.sub(r":\s*'([^']*)'", r': "\1"', text)
+        debug_info["raw_response"] = text[:200] + "..." if len(text) > 200 else text
 
-        # แก้ไขปัญหา trailing commas
-        text = re.sub(r",\s*}", "}", text)
-        text = re.sub(r",\s*\]", "]", text)
+        matchmaking_data = self.load_json(text, debug_info)
 
-        # แก้ไขปัญหา comments
-        text = re.sub(r"//.*?\n", "\n", text)
+        return self.to_result(matchmaking_data)
 
-        # เพิ่มการจัดการกรณี JSON ที่ไม่สมบูรณ์
-        text = text.replace('\n', '').replace('\r', '')
+    def parse_response_text(self, text):
+        return self.parse_generated_text(text, {})
+
+    def error_result(self, error, text, debug_info):
+        if isinstance(error, json.JSONDecodeError):
+            self.logger.error(f"JSON decode error: {str(error)}")
+            return {
+                "error": f"Could not parse AI response as JSON: {str(error)}",
+                "raw_response": text[:1000] if text else "No response",
+                "debug_info": debug_info,
+                "model_used": self.model
+            }
 
-        return text
+        self.logger.error(f"Error in generate_matchmaking: {str(error)}")
+        return {
+            "error": str(error),
+            "debug_info": debug_info,
+            "model_used": self.model
+        }
 
     def generate_matchmaking(self, room_data):
         text = ""
         debug_info = {}
 
         try:
-            # สำหรับ Gemma3 อาจต้องปรับ prompt ให้ชัดเจนขึ้น
-            system_prompt = """คุณเป็นผู้เชี่ยวชาญการจัดการแข่งขันแบดมินตัน โปรดตอบกลับในรูปแบบ JSON ที่ถูกต้อง"""
-
-            player_list = []
-            for p in room_data['players']:
-                player_list.append({
-                    'id': p['id'],
-                    'name': p['name'],
-                    'skill': p['skill'],
-                    'join_time': p.get('join_time', ''),
-                    'number_of_matches': p.get('number_of_matches', 0),
-                    'number_of_shuttlecock': p.get('number_of_shuttlecock', 0)
-                })
-
-            player_info = "\n".join([
-                f"Player {p['id']}: {p['name']} (Skill: {p['skill']}, Matches: {p['number_of_matches']}, Join Time: {p['join_time']})"
-                for p in player_list
-            ])
-
-            skill_levels = [p['skill'] for p in player_list]
-            skill_summary = ", ".join([f"{skill}: {skill_levels.count(skill)} คน" for skill in set(skill_levels)])
-
-            user_prompt = f"""จงจัดทีมแบดมินตันให้สมดุลที่สุด:
-
-            กฎการจัดทีม:
-            1. กระจายผู้เล่นทักษะต่างๆ อย่างเท่าเทียม
-            2. คำนึงถึงจำนวนแมตช์และเวลาที่เข้าร่วม
-            
-            รายชื่อผู้เล่น:
-            {player_info}
-            
-            
-            ตอบกลับเป็น JSON เท่านั้น ดังโครงสร้าง:
-            {{
-              "teams": [
-                {{
-                  "team_name": "ทีมที่ 1",
-                  "players": [
-                    {{ "id": player_id, "name": "player_name", "skill": "skill_level" }},
-                    {{ "id": player_id, "name": "player_name", "skill": "skill_level" }}
-                  ],
-                  "compatibility_score": 85
-                }},
-                {{
-                  "team_name": "ทีมที่ 2",
-                  "players": [
-                    {{ "id": player_id, "name": "player_name", "skill": "skill_level" }},
-                    {{ "id": player_id, "name": "player_name", "skill": "skill_level" }}
-                  ],
-                  "compatibility_score": 82
-                }}
-              ],
-              "match": {{
-                "team1": "ทีมที่ 1",
-                "team2": "ทีมที่ 2",
-                "balance_score": 90
-              }},
-              "analysis": "คำอธิบายการจับคู่และเหตุผล"
-            }}"""
-
-            # สำหรับ Gemma3 อาจใช้ prompt แบบง่ายขึ้น
-            payload = {
-                "model": self.model,
-                "prompt": user_prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.2,
-                    "top_p": 0.9,
-                    "num_predict": 1024
-                }
-            }
+            payload = self.build_payload(room_data)
 
             self.logger.info(f"Sending request to Ollama API for model: {self.model}")
-            response = requests.post(self.api_url, json=payload)
+            response = http_transport.post(self.api_url, json=payload)
 
             if response.status_code != 200:
                 self.logger.error(f"API request failed with status {response.status_code}: {response.text}")
@@ -155,55 +132,71 @@ class OllamaService:
 
             # Ollama API จะตอบกลับในรูปแบบ {"response": "text response here"}
             text = response.json().get("response", "")
-            debug_info["raw_response"] = text[:200] + "..." if len(text) > 200 else text
-
-            # ทำความสะอาดเพื่อให้ได้ JSON ที่ถูกต้อง
-            json_text = self.clean_json_text(text)
-            debug_info["cleaned_json"] = json_text[:200] + "..." if len(json_text) > 200 else json_text
-
-            # ถ้ายังไม่สามารถแปลงเป็น JSON ได้ ลองแก้ไข JSON
-            try:
-                matchmaking_data = json.loads(json_text)
-            except json.JSONDecodeError:
-                # สำหรับ Gemma3 อาจต้องมีการแก้ไข JSON ที่ละเอียดมากขึ้น
-                fixed_json = self.fix_json(json_text)
-                debug_info["fixed_json"] = fixed_json[:200] + "..." if len(fixed_json) > 200 else fixed_json
-
-                try:
-                    matchmaking_data = json.loads(fixed_json)
-                except json.JSONDecodeError:
-                    # หากยังไม่สำเร็จ ลองดึง JSON ที่สมบูรณ์ที่สุด
-                    alt_json = re.findall(r'\{.*\}', fixed_json, re.DOTALL)
-                    if alt_json:
-                        matchmaking_data = json.loads(alt_json[0])
-                    else:
-                        raise
-
-            result = {
-                "teams": matchmaking_data.get("teams", []),
-                "match": matchmaking_data.get("match", {}),
-                "analysis": matchmaking_data.get("analysis", ""),
-                "model_used": self.model
-            }
+            return self.parse_generated_text(text, debug_info)
 
-            # ตรวจสอบว่ามีข้อมูลครบถ้วนหรือไม่
-            if not result["teams"] or len(result["teams"]) < 2:
-                raise Exception("ไม่พบข้อมูลทีมในผลลัพธ์")
+        except Exception as e:
+            return self.error_result(e, text, debug_info)
 
-            return result
+    async def agenerate_matchmaking(self, room_data):
+        """
+        เหมือน generate_matchmaking แต่ใช้ httpx.AsyncClient ที่ใช้ร่วมกันจึงไม่บล็อก event loop
+        """
+        text = ""
+        debug_info = {}
+
+        try:
+            payload = self.build_payload(room_data)
+
+            self.logger.info(f"Sending async request to Ollama API for model: {self.model}")
+            response = await http_transport.apost(self.api_url, json=payload)
+
+            if response.status_code != 200:
+                self.logger.error(f"API request failed with status {response.status_code}: {response.text}")
+                raise Exception(f"API request failed with status {response.status_code}: {response.text}")
+
+            text = response.json().get("response", "")
+            return self.parse_generated_text(text, debug_info)
 
-        except json.JSONDecodeError as e:
-            self.logger.error(f"JSON decode error: {str(e)}")
-            return {
-                "error": f"Could not parse AI response as JSON: {str(e)}",
-                "raw_response": text[:1000] if 'text' in locals() and text else "No response",
-                "debug_info": debug_info,
-                "model_used": self.model
-            }
         except Exception as e:
-            self.logger.error(f"Error in generate_matchmaking: {str(e)}")
-            return {
-                "error": str(e),
-                "debug_info": debug_info,
-                "model_used": self.model
-            }
\ No newline at end of file
+            return self.error_result(e, text, debug_info)
+
+    def stream_matchmaking(self, room_data):
+        """
+        ส่งข้อความจาก Ollama ออกมาทีละ chunk (Ollama ตอบกลับเป็น JSON ทีละบรรทัด)
+        """
+        payload = self.build_payload(room_data)
+        payload["stream"] = True
+
+        self.logger.info(f"Sending streaming request to Ollama API for model: {self.model}")
+        with http_transport.post(self.api_url, json=payload, stream=True) as response:
+            if response.status_code != 200:
+                raise Exception(f"API request failed with status {response.status_code}: {response.text}")
+
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                yield chunk.get("response", "")
+                if chunk.get("done"):
+                    break
+
+    async def astream_matchmaking(self, room_data):
+        """
+        stream_matchmaking แบบ async ผ่าน httpx.AsyncClient ที่ใช้ร่วมกัน จึงไม่บล็อก event loop ระหว่างรอ token
+        """
+        payload = self.build_payload(room_data)
+        payload["stream"] = True
+
+        self.logger.info(f"Sending async streaming request to Ollama API for model: {self.model}")
+        async with http_transport.astream(self.api_url, json=payload) as response:
+            if response.status_code != 200:
+                await response.aread()
+                raise Exception(f"API request failed with status {response.status_code}: {response.text}")
+
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                yield chunk.get("response", "")
+                if chunk.get("done"):
+                    break
@@ -0,0 +1,24 @@
+class PairHistory:
+    """
+    จำนวนครั้งที่ผู้เล่นแต่ละคู่ในห้องเคยเป็นคู่หูหรือคู่แข่งกัน ค้นหาทีละคู่ด้วย dict (O(1))
+    """
+
+    def __init__(self, pairs=None):
+        # {(player_low, player_high): (partnered, opposed)}
+        self.pairs = pairs or {}
+
+    @classmethod
+    def from_rows(cls, rows):
+        return cls({(low, high): (partnered, opposed) for low, high, partnered, opposed in rows})
+
+    def counts(self, a, b):
+        return self.pairs.get((a, b) if a < b else (b, a), (0, 0))
+
+    def partnered(self, a, b):
+        return self.counts(a, b)[0]
+
+    def opposed(self, a, b):
+        return self.counts(a, b)[1]
+
+    def __bool__(self):
+        return bool(self.pairs)
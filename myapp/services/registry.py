@@ -0,0 +1,179 @@
+import logging
+import threading
+import time
+from collections import deque
+
+NO_PROVIDER = {"error": "No matchmaking provider available"}
+
+
+class ProviderStats:
+    """
+    สถิติแบบ rolling window ของ provider หนึ่งตัว: latency และอัตราการล้มเหลว
+    """
+
+    def __init__(self, window):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.last_failure = None
+
+    def record(self, latency, ok):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+        else:
+            self.last_failure = time.monotonic()
+
+    @property
+    def avg_latency(self):
+        if not self.latencies:
+            return None
+        return sum(self.latencies) / len(self.latencies)
+
+    @property
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def as_dict(self):
+        return {
+            "avg_latency_ms": round(self.avg_latency * 1000, 1) if self.avg_latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "samples": len(self.outcomes),
+        }
+
+
+class ProviderRegistry:
+    """
+    รวม provider ทุกตัวไว้ที่เดียว เลือก provider ที่เร็วที่สุดและยังปกติอยู่ให้แต่ละ request
+    และถ้า provider ล้มเหลวจะลองตัวถัดไปใน request เดียวกัน
+    provider ที่ลงทะเบียนแบบ fallback_only (เช่น local) จะถูกใช้เมื่อตัวอื่นล้มเหลวหมดแล้วเท่านั้น
+    """
+
+    def __init__(self, window=20, max_error_rate=0.5, min_samples=3, cooldown=30):
+        self.window = window
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.cooldown = cooldown
+        self.providers = {}
+        self.fallback_only = set()
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def register(self, name, service, fallback_only=False):
+        self.providers[name] = service
+        self.stats[name] = ProviderStats(self.window)
+        if fallback_only:
+            self.fallback_only.add(name)
+
+    def is_healthy(self, name):
+        stats = self.stats[name]
+        if len(stats.outcomes) < self.min_samples or stats.error_rate < self.max_error_rate:
+            return True
+        # ให้ provider ที่ล้มเหลวได้ลองใหม่เมื่อพ้นช่วง cooldown
+        return time.monotonic() - stats.last_failure >= self.cooldown
+
+    def candidates(self, preferred=None):
+        """
+        ลำดับ provider ที่จะลอง: preferred ก่อน, ตามด้วยตัวที่ปกติเรียงตาม latency เฉลี่ย
+        (ตัวที่ยังไม่มีข้อมูลเรียงตามลำดับการลงทะเบียน) และ fallback_only ท้ายสุด
+        ตัวที่ยังอยู่ในช่วง cooldown ถูกข้าม เว้นแต่ไม่เหลือตัวที่ปกติ (นอกจาก fallback_only) ให้ลองเลย
+        """
+        with self.lock:
+            order = list(self.providers)
+            routed = [name for name in order if name != preferred and name not in self.fallback_only]
+            healthy = [name for name in routed if self.is_healthy(name)]
+            unhealthy = [name for name in routed if name not in healthy]
+            healthy.sort(key=lambda name: (
+                self.stats[name].avg_latency is None,
+                self.stats[name].avg_latency or 0,
+                order.index(name),
+            ))
+            if healthy or (preferred in self.providers and preferred not in self.fallback_only
+                           and self.is_healthy(preferred)):
+                unhealthy = []
+
+        fallbacks = [name for name in order if name in self.fallback_only and name != preferred]
+        return ([preferred] if preferred else []) + healthy + unhealthy + fallbacks
+
+    def record(self, name, latency, ok):
+        with self.lock:
+            self.stats[name].record(latency, ok)
+
+    def _finish(self, name, result, attempts):
+        result = dict(result)
+        result["engine"] = name
+        result["attempts"] = attempts
+        return result
+
+    def generate_matchmaking(self, room_data, preferred=None, fallback=True):
+        """
+        เรียก provider ตามลำดับจาก candidates จนกว่าจะได้ผลลัพธ์ที่ไม่มี error
+        """
+        return self._run(lambda service: service.generate_matchmaking(room_data), preferred, fallback)
+
+    def generate_teams(self, room_data, preferred=None, fallback=True):
+        """
+        เหมือน generate_matchmaking แต่เรียก generate_teams (phase แรกของการจับคู่แบบสองขั้น)
+        """
+        return self._run(lambda service: service.generate_teams(room_data), preferred, fallback)
+
+    async def agenerate_matchmaking(self, room_data, preferred=None, fallback=True):
+        """
+        generate_matchmaking แบบ async ใช้ลำดับ provider และการบันทึกสถิติเดียวกัน
+        """
+        return await self._arun(lambda service: service.agenerate_matchmaking(room_data), preferred, fallback)
+
+    def _run(self, call, preferred, fallback):
+        names, attempts = self._plan(preferred, fallback)
+        result = NO_PROVIDER
+        for name in names:
+            started = time.monotonic()
+            try:
+                result = call(self.providers[name])
+            except Exception as e:
+                result = self._error(name, e)
+            if self._attempt(name, result, started, attempts):
+                return self._finish(name, result, attempts)
+        return self._finish(names[-1] if names else None, result, attempts)
+
+    async def _arun(self, call, preferred, fallback):
+        # เหมือน _run แต่ call คืน coroutine
+        names, attempts = self._plan(preferred, fallback)
+        result = NO_PROVIDER
+        for name in names:
+            started = time.monotonic()
+            try:
+                result = await call(self.providers[name])
+            except Exception as e:
+                result = self._error(name, e)
+            if self._attempt(name, result, started, attempts):
+                return self._finish(name, result, attempts)
+        return self._finish(names[-1] if names else None, result, attempts)
+
+    def _plan(self, preferred, fallback):
+        names = self.candidates(preferred)
+        return (names if fallback else names[:1]), []
+
+    def _error(self, name, error):
+        return {"error": str(error), "model_used": getattr(self.providers[name], "model", name)}
+
+    def _attempt(self, name, result, started, attempts):
+        """
+        บันทึกสถิติและ attempts ของการเรียก provider หนึ่งครั้ง คืน True ถ้าได้ผลลัพธ์ที่ไม่มี error
+        """
+        latency = time.monotonic() - started
+        ok = "error" not in result
+        self.record(name, latency, ok)
+        attempts.append({"engine": name, "latency_ms": round(latency * 1000, 1), "ok": ok})
+        if not ok:
+            self.logger.warning(f"Matchmaking provider {name} failed: {result['error']}")
+        return ok
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: dict(stats.as_dict(), healthy=self.is_healthy(name), fallback_only=name in self.fallback_only)
+                for name, stats in self.stats.items()
+            }
@@ -0,0 +1,48 @@
+import json
+
+from .json_scanner import ANY, DELTA, JsonScanner
+
+TEAM = ('teams', ANY)
+MATCH = ('match',)
+ANALYSIS = ('analysis',)
+
+
+class MatchmakingStreamParser:
+    """
+    อ่าน JSON ผลการจับคู่ทีละ chunk ระหว่างที่โมเดลกำลังสร้างข้อความด้วย JsonScanner (ซ่อมข้อความแบบเดียวกับ load_json)
+    และคืน event ทันทีที่แต่ละส่วนสมบูรณ์:
+    ("team", {...}) ต่อทีม, ("match", {...}), ("analysis_delta", "...") ระหว่างเขียน analysis
+    และ ("analysis", "...") เมื่อ analysis จบ
+    """
+
+    EVENTS = {TEAM: "team", MATCH: "match", ANALYSIS: "analysis"}
+
+    def __init__(self):
+        self.scanner = JsonScanner(watch=self.EVENTS, deltas=[ANALYSIS])
+        # JSON ทั้งก้อนที่ซ่อมแล้ว เมื่อ object ระดับบนสุดปิดครบ
+        self.document = None
+
+    def feed(self, chunk):
+        """
+        เพิ่มข้อความใหม่และคืนรายการ event ที่เกิดขึ้นจาก chunk นี้
+        """
+        events = []
+        for kind, path, data in self.scanner.feed(chunk):
+            if kind == DELTA:
+                events.append(("analysis_delta", data))
+            elif path == ():
+                self.document = data
+            else:
+                try:
+                    events.append((self.EVENTS[path], json.loads(data)))
+                except json.JSONDecodeError:
+                    # ส่วนนี้ซ่อมไม่ได้ (เช่น key ไม่มี quote) ให้ parse ทั้งก้อนตอนจบแทน
+                    pass
+        return events
+
+    def finish(self):
+        """
+        จบ stream และคืน JSON ทั้งก้อนที่ซ่อมแล้ว ถ้าข้อความถูกตัดกลางทางจะ raise TruncatedJsonError
+        """
+        self.scanner.finish()
+        return self.document
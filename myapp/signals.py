@@ -0,0 +1,147 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from . import matchmaking_cache, realtime, waiting_queue
+from .models import Player, Room
+from .serializers import PlayerSerializer
+
+# ส่งเมื่อผู้เล่นในห้องเปลี่ยนโดยไม่ผ่าน save() เช่น QuerySet.update() หรือ bulk_create()
+# ซึ่งไม่ส่ง post_save (argument: room_id และ player_ids ของผู้เล่นที่เปลี่ยน ถ้าทราบ)
+room_players_changed = Signal()
+
+
+@receiver([post_save, post_delete], sender=Player)
+def invalidate_player_room(sender, instance, **kwargs):
+    for room_id in instance.affected_room_ids():
+        matchmaking_cache.invalidate_room(room_id)
+
+
+@receiver([post_save, post_delete], sender=Player)
+def bump_player_room_version(sender, instance, **kwargs):
+    # อยู่ใน transaction เดียวกับการแก้ผู้เล่น ETag ของห้องจึงไม่ล้าหลังข้อมูล
+    # (QuerySet.update()/bulk_create() ต้องเรียก bump_version() เองเช่นกัน)
+    Room.objects.filter(pk__in=instance.affected_room_ids()).bump_version()
+
+
+@receiver([post_save, post_delete], sender=Room)
+def invalidate_room(sender, instance, **kwargs):
+    matchmaking_cache.invalidate_room(instance.pk)
+
+
+@receiver(room_players_changed)
+def invalidate_changed_room(sender, room_id, **kwargs):
+    matchmaking_cache.invalidate_room(room_id)
+
+
+@receiver(post_save, sender=Player)
+def broadcast_player_saved(sender, instance, **kwargs):
+    player_id = instance.id
+    previous_room_id = getattr(instance, '_loaded_room_id', None)
+    if previous_room_id and previous_room_id != instance.room_id:
+        # ผู้เล่นถูกย้ายออกจากห้องเดิม
+        realtime.broadcaster.publish_on_commit(previous_room_id, lambda: realtime.player_removed_event(player_id))
+
+    realtime.broadcaster.publish_on_commit(
+        instance.room_id, lambda: {"type": "players", "players": [PlayerSerializer(instance).data]}
+    )
+
+
+@receiver(post_delete, sender=Player)
+def broadcast_player_deleted(sender, instance, **kwargs):
+    player_id = instance.id
+    realtime.broadcaster.publish_on_commit(instance.room_id, lambda: realtime.player_removed_event(player_id))
+
+
+@receiver(post_save, sender=Room)
+def broadcast_room_saved(sender, instance, **kwargs):
+    realtime.broadcaster.publish_on_commit(instance.pk, lambda: realtime.room_event(instance))
+
+
+@receiver(post_delete, sender=Room)
+def broadcast_room_deleted(sender, instance, **kwargs):
+    room_id = instance.pk
+    realtime.broadcaster.publish_on_commit(room_id, lambda: realtime.room_deleted_event(room_id))
+
+
+@receiver(room_players_changed)
+def broadcast_changed_players(sender, room_id, player_ids=None, **kwargs):
+    if player_ids is None:
+        realtime.broadcaster.publish_on_commit(room_id, lambda: realtime.RESYNC)
+        return
+    realtime.broadcaster.publish_on_commit(
+        room_id, lambda: realtime.players_event(Player.objects.filter(id__in=player_ids).in_queue_order())
+    )
+
+
+def _has_waiting_queue(room_ids):
+    return any(waiting_queue.waiting_queues.has_room(room_id) for room_id in room_ids)
+
+
+@receiver(post_save, sender=Player)
+def queue_player_saved(sender, instance, **kwargs):
+    room_ids = instance.affected_room_ids()
+    if not _has_waiting_queue(room_ids):
+        return
+
+    queues = waiting_queue.waiting_queues
+    item = waiting_queue.instance_item(instance)
+    player_id, room_id = instance.id, instance.room_id
+
+    def apply():
+        for affected in room_ids:
+            if item is None:
+                queues.discard(affected)
+            elif affected == room_id:
+                queues.apply(affected, upserts=[item])
+            else:
+                queues.apply(affected, removals=[player_id])
+
+    transaction.on_commit(apply)
+
+
+@receiver(post_delete, sender=Player)
+def queue_player_deleted(sender, instance, **kwargs):
+    room_ids = instance.affected_room_ids()
+    if not _has_waiting_queue(room_ids):
+        return
+
+    player_id = instance.id
+    transaction.on_commit(
+        lambda: [waiting_queue.waiting_queues.apply(room_id, removals=[player_id]) for room_id in room_ids]
+    )
+
+
+@receiver(room_players_changed)
+def queue_changed_players(sender, room_id, player_ids=None, **kwargs):
+    # signal นี้ถูกส่งหลัง commit อยู่แล้ว
+    queues = waiting_queue.waiting_queues
+    if not queues.has_room(room_id):
+        return
+    if player_ids is None:
+        queues.discard(room_id)
+        return
+    queues.apply(room_id, upserts=waiting_queue.load_players(Player.objects.filter(id__in=player_ids)))
+
+
+@receiver(post_save, sender=Room)
+def queue_room_saved(sender, instance, created, **kwargs):
+    room_id = instance.pk
+    if created:
+        # id ของห้องที่ถูก rollback อาจถูกใช้ซ้ำ จึงล้างคิวเก่าที่อาจค้างอยู่
+        waiting_queue.waiting_queues.discard(room_id)
+    elif waiting_queue.waiting_queues.has_room(room_id):
+        # Room.save() เพิ่ม version หนึ่งขั้นโดยผู้เล่นไม่เปลี่ยน
+        transaction.on_commit(lambda: waiting_queue.waiting_queues.apply(room_id))
+
+
+@receiver(post_delete, sender=Room)
+def queue_room_deleted(sender, instance, **kwargs):
+    room_id = instance.pk
+    transaction.on_commit(lambda: waiting_queue.waiting_queues.discard(room_id))
+
+
+@receiver([post_save, post_delete], sender=Player)
+def remember_loaded_room(sender, instance, **kwargs):
+    # ต้องเป็น receiver สุดท้ายของ Player: receiver ก่อนหน้าใช้ห้องเดิมเพื่อรู้ว่าผู้เล่นถูกย้ายห้อง
+    instance._loaded_room_id = instance.room_id
@@ -0,0 +1,194 @@
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.renderers import BaseRenderer
+
+from . import match_results, matchmaking_cache
+from .services.candidates import trim_room_data
+from .services.engines import preferred_provider, provider_registry
+from .services.stream_parser import MatchmakingStreamParser
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    ให้ DRF ยอมรับ Accept: text/event-stream (EventSource ของเบราว์เซอร์)
+    Response ปกติ เช่น error 400 จะถูกส่งเป็น event ชื่อ error
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return sse_event("error", data).encode(self.charset)
+
+
+def result_events(result, engine):
+    """
+    แปลงผลลัพธ์ที่มีอยู่แล้ว (จาก cache หรือ provider ที่ไม่ stream) เป็น event ชุดเดียวกับตอน stream แล้วจบด้วย done
+    """
+    for team in result["teams"]:
+        yield sse_event("team", team)
+    yield sse_event("match", result["match"])
+    yield sse_event("analysis", result["analysis"])
+    yield sse_event("done", {"engine": result.get("engine", engine), "matchmaking": result})
+
+
+def room_event(room, room_data, candidates):
+    return sse_event("room", {
+        "id": room.id,
+        "name": room.name,
+        "player_count": len(room_data['players']),
+        "candidate_count": len(candidates['players']),
+    })
+
+
+class ProviderStream:
+    """
+    สถานะระหว่าง stream จาก provider หนึ่งตัว ใช้ร่วมกันทั้ง stream_matchmaking_events และเวอร์ชัน async
+    """
+
+    def __init__(self, name, service):
+        self.name = name
+        self.service = service
+        self.parser = MatchmakingStreamParser()
+        # ได้รับข้อความจาก provider แล้ว จึงสลับไป provider อื่นกลางทางไม่ได้
+        self.started = False
+        self.clock = time.monotonic()
+
+    def feed(self, chunk):
+        self.started = True
+        return [sse_event(event, data) for event, data in self.parser.feed(chunk)]
+
+    def finish(self):
+        """
+        ตรวจ JSON ทั้งก้อนที่ scanner ซ่อมไว้แล้วกับ schema ครั้งเดียว และบันทึกสถิติของ provider
+        """
+        document = self.parser.finish()
+        if document is None:
+            raise json.JSONDecodeError("No JSON object found", "", 0)
+        result = self.service.parse_response_text(document)
+        result["engine"] = self.name
+        provider_registry.record(self.name, time.monotonic() - self.clock, True)
+        return result
+
+    def failed(self):
+        provider_registry.record(self.name, time.monotonic() - self.clock, False)
+
+    def done(self, result):
+        return sse_event("done", {"engine": self.name, "matchmaking": result})
+
+
+def stream_matchmaking_events(room, engine, room_data, top_k=None):
+    """
+    สร้าง server-sent events ของการจับคู่: team ทีละทีมทันทีที่ JSON ของทีมนั้นครบ,
+    match, analysis_delta ระหว่างที่โมเดลเขียน analysis แล้วจบด้วย done
+    provider ที่ล้มเหลวก่อนส่ง event แรกจะถูกข้ามไปใช้ตัวถัดไปตามลำดับของ registry
+    ส่งให้ provider เฉพาะผู้เล่น top_k คนจาก trim_room_data (None = ค่าจาก settings)
+    ใช้กับ WSGI ส่วน ASGI ใช้ astream_matchmaking_events
+    """
+    if top_k is None:
+        top_k = settings.MATCHMAKING_PROMPT_TOP_K
+    candidates = trim_room_data(room_data, top_k)
+    yield room_event(room, room_data, candidates)
+
+    try:
+        cache_key = matchmaking_cache.cache_key(room.id, engine, candidates['players'])
+        result = matchmaking_cache.get_result(cache_key)
+        if result is not None:
+            yield from result_events(result, engine)
+            return
+
+        for name in provider_registry.candidates(preferred_provider(engine)):
+            service = provider_registry.providers[name]
+
+            if not hasattr(service, "stream_matchmaking"):
+                result = provider_registry.generate_matchmaking(candidates, preferred=name, fallback=False)
+                if "error" in result:
+                    continue
+                if matchmaking_cache.should_cache(engine, name):
+                    matchmaking_cache.set_result(cache_key, result)
+                yield from result_events(result, name)
+                return
+
+            stream = ProviderStream(name, service)
+            try:
+                for chunk in service.stream_matchmaking(candidates):
+                    yield from stream.feed(chunk)
+                result = stream.finish()
+            except Exception:
+                stream.failed()
+                if stream.started:
+                    raise
+                continue
+
+            if matchmaking_cache.should_cache(engine, name):
+                matchmaking_cache.set_result(cache_key, result)
+            yield stream.done(result)
+            return
+
+        yield sse_event("error", {"error": "All matchmaking providers failed"})
+
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
+
+
+async def astream_matchmaking_events(room, engine, room_data, top_k=None):
+    """
+    stream_matchmaking_events แบบ async generator สำหรับ ASGI: Django ส่งแต่ละ event ออกไปทันที
+    (generator ธรรมดาจะถูกอ่านจนจบก่อนส่ง) และยกเลิก stream ของ provider เมื่อ client ตัดการเชื่อมต่อ
+    """
+    if top_k is None:
+        top_k = settings.MATCHMAKING_PROMPT_TOP_K
+    candidates = trim_room_data(room_data, top_k)
+    yield room_event(room, room_data, candidates)
+
+    try:
+        cache_key = await matchmaking_cache.acache_key(room.id, engine, candidates['players'])
+        result = await matchmaking_cache.aget_result(cache_key)
+        if result is not None:
+            for event in result_events(result, engine):
+                yield event
+            return
+
+        for name in provider_registry.candidates(preferred_provider(engine)):
+            service = provider_registry.providers[name]
+
+            if not hasattr(service, "astream_matchmaking"):
+                # local engine ทำงานใน event loop จึงโหลดประวัติคู่ไว้ก่อนแทนการ query แบบ lazy
+                candidates['pair_history'] = await sync_to_async(match_results.load_pair_history)(room.id)
+                result = await provider_registry.agenerate_matchmaking(candidates, preferred=name, fallback=False)
+                if "error" in result:
+                    continue
+                if matchmaking_cache.should_cache(engine, name):
+                    await matchmaking_cache.aset_result(cache_key, result)
+                for event in result_events(result, name):
+                    yield event
+                return
+
+            stream = ProviderStream(name, service)
+            try:
+                async for chunk in service.astream_matchmaking(candidates):
+                    for event in stream.feed(chunk):
+                        yield event
+                result = stream.finish()
+            except Exception:
+                stream.failed()
+                if stream.started:
+                    raise
+                continue
+
+            if matchmaking_cache.should_cache(engine, name):
+                await matchmaking_cache.aset_result(cache_key, result)
+            yield stream.done(result)
+            return
+
+        yield sse_event("error", {"error": "All matchmaking providers failed"})
+
+    except Exception as e:
+        yield sse_event("error", {"error": str(e)})
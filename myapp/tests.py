@@ -1,3 +1,1454 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time as time_module
+from base64 import b64encode
+from datetime import time, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlencode, urlparse
 
-# Create your tests here.
+import httpx
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from myproject.asgi import application
+
+from . import check_in, jobs, matchmaking_cache, realtime
+from .models import Room,Player,MatchmakingJob,Match,PairStat
+from .serializers import PlayerSerializer, RoomSerializer
+from .signals import room_players_changed
+from .waiting_queue import waiting_queues
+from .management.commands._synthetic import synthetic_players
+from .services import http_transport
+from .services.candidates import queue_key, select_candidates
+from .services.engines import claude_service, huggingface_service, ollama_service, provider_registry
+from .services.json_scanner import DELTA, VALUE, JsonScanner, TruncatedJsonError, extract_json
+from .services.local_matchmaking_service import LocalMatchmakingService, skill_rank
+from .services.matchmaking_schema import MatchmakingSchemaError, validate_matchmaking
+from .services.pair_history import PairHistory
+from .services.registry import ProviderRegistry
+from .services.stream_parser import MatchmakingStreamParser
+
+# จำนวน query สูงสุดของแต่ละ endpoint ต้องคงที่ไม่ว่าจะมีกี่ห้องหรือผู้เล่นกี่คน
+QUERY_BUDGETS = {
+    'room_list': 2,
+    # SELECT version ของห้อง (ETag) แล้วจึงโหลดห้องพร้อมผู้เล่น
+    'room_detail': 3,
+    # If-None-Match ตรงกัน: อ่านแค่ version ไม่แตะตารางผู้เล่น
+    'room_detail_not_modified': 1,
+    'player_list': 1,
+    'player_list_filtered': 2,
+    'player_list_not_modified': 1,
+    'job_list': 1,
+    # ห้องพร้อมผู้เล่น และ PairStat ของห้องเมื่อ local engine ต้องจับคู่ใหม่
+    'ai_matchmaking': 3,
+    'ai_matchmaking_stream': 3,
+    'batch_matchmaking': 3,
+    'matchmaking_jobs': 2,
+    # SELECT version ของห้อง และผู้เล่นทั้งห้องครั้งแรกที่สร้าง heap (ครั้งต่อไปเหลือ query เดียว)
+    'queue': 2,
+    'queue_warm': 1,
+    # SELECT ห้อง, UPDATE ผู้เล่นและ version ของห้อง, INSERT Match/MatchParticipant,
+    # INSERT/UPDATE PairStat ใน atomic (SAVEPOINT/RELEASE ภายใน TestCase) และ SELECT คิว
+    'record_match': 10,
+    # SELECT ห้อง, INSERT เดียวจาก bulk_create และ UPDATE version ของห้องใน atomic
+    'check_in': 5,
+    'admin_player_changelist': 6,
+}
+
+
+class QueryBudgetTests(TestCase):
+    """
+    ตรวจว่าแต่ละ endpoint ใช้ query ตาม QUERY_BUDGETS ทั้งกับห้องเล็กและห้องใหญ่
+    ถ้า test นี้ล้มเหลว แปลว่ามี N+1 query เกิดขึ้นใหม่
+    """
+
+    # (จำนวนห้องที่เพิ่ม, จำนวนผู้เล่นต่อห้อง)
+    SIZES = [(1, 4), (5, 20)]
+
+    def setUp(self):
+        self.client = APIClient()
+        caches['matchmaking'].clear()
+        waiting_queues.clear()
+
+    def create_rooms(self, rooms, players):
+        skills = ['N', 'S', 'P-']
+        for index in range(rooms):
+            room = Room.objects.create(name=f"room {index}", open_time=time(18), close_time=time(22))
+            Player.objects.bulk_create([
+                Player(room=room, name=f"p{n}", skill=skills[n % len(skills)], number_of_matches=n % 3)
+                for n in range(players)
+            ])
+            MatchmakingJob.objects.create(room=room, engine='local')
+        return room
+
+    def assertQueryBudget(self, endpoint, request, prepare=None):
+        # prepare เตรียมข้อมูลที่ request ต้องใช้ โดยไม่นับรวมใน budget
+        for rooms, players in self.SIZES:
+            with self.subTest(endpoint=endpoint, rooms=rooms, players=players):
+                room = self.create_rooms(rooms, players)
+                args = prepare(room) if prepare else ()
+                with self.assertNumQueries(QUERY_BUDGETS[endpoint]):
+                    response = request(room, *args)
+                    # StreamingHttpResponse ต้องอ่านให้จบจึงจะนับ query ครบ
+                    if getattr(response, 'streaming', False):
+                        b''.join(response.streaming_content)
+                # 304 ของ conditional GET ถือว่าสำเร็จเช่นกัน
+                self.assertLess(response.status_code, 400)
+
+    def test_room_list(self):
+        self.assertQueryBudget('room_list', lambda room: self.client.get('/rooms/'))
+
+    def test_room_detail(self):
+        self.assertQueryBudget('room_detail', lambda room: self.client.get(f'/rooms/{room.id}/'))
+
+    def test_room_detail_not_modified(self):
+        self.assertQueryBudget(
+            'room_detail_not_modified',
+            lambda room, etag: self.client.get(f'/rooms/{room.id}/', HTTP_IF_NONE_MATCH=etag),
+            prepare=lambda room: (self.client.get(f'/rooms/{room.id}/')['ETag'],)
+        )
+
+    def test_player_list(self):
+        self.assertQueryBudget('player_list', lambda room: self.client.get('/players/'))
+
+    def test_player_list_filtered(self):
+        self.assertQueryBudget(
+            'player_list_filtered',
+            lambda room: self.client.get(
+                f'/players/?room={room.id}&skill=S,P-&min_matches=1&max_matches=2&ordering=-number_of_matches'
+            )
+        )
+
+    def test_player_list_not_modified(self):
+        self.assertQueryBudget(
+            'player_list_not_modified',
+            lambda room, etag: self.client.get(f'/players/?room={room.id}', HTTP_IF_NONE_MATCH=etag),
+            prepare=lambda room: (self.client.get(f'/players/?room={room.id}')['ETag'],)
+        )
+
+    def test_job_list(self):
+        self.assertQueryBudget('job_list', lambda room: self.client.get('/matchmaking_jobs/'))
+
+    def test_ai_matchmaking(self):
+        self.assertQueryBudget(
+            'ai_matchmaking', lambda room: self.client.get(f'/rooms/{room.id}/ai_matchmaking/?engine=local')
+        )
+
+    def test_ai_matchmaking_stream(self):
+        self.assertQueryBudget(
+            'ai_matchmaking_stream',
+            lambda room: self.client.get(
+                f'/rooms/{room.id}/ai_matchmaking_stream/?engine=local', HTTP_ACCEPT='text/event-stream'
+            )
+        )
+
+    def test_batch_matchmaking(self):
+        self.assertQueryBudget(
+            'batch_matchmaking', lambda room: self.client.get(f'/rooms/{room.id}/batch_matchmaking/?courts=2')
+        )
+
+    def test_matchmaking_jobs(self):
+        self.assertQueryBudget(
+            'matchmaking_jobs', lambda room: self.client.post(f'/rooms/{room.id}/matchmaking_jobs/?engine=local')
+        )
+
+    def test_queue(self):
+        self.assertQueryBudget('queue', lambda room: self.client.get(f'/rooms/{room.id}/queue/'))
+
+    def test_queue_warm(self):
+        self.assertQueryBudget(
+            'queue_warm',
+            lambda room: self.client.get(f'/rooms/{room.id}/queue/?limit=4&skill=S'),
+            prepare=self.warm_queue
+        )
+
+    def warm_queue(self, room):
+        self.client.get(f'/rooms/{room.id}/queue/')
+        return ()
+
+    def test_record_match(self):
+        self.assertQueryBudget(
+            'record_match',
+            lambda room, player_ids: self.client.post(
+                f'/rooms/{room.id}/record_match/', {'players': player_ids}, format='json'
+            ),
+            prepare=lambda room: (list(room.players.values_list('id', flat=True)[:4]),)
+        )
+
+    def test_check_in(self):
+        self.assertQueryBudget(
+            'check_in',
+            lambda room, body: self.client.post(f'/rooms/{room.id}/check_in/', body, content_type='text/csv'),
+            prepare=lambda room: ("name,skill\n" + "".join(f"guest {n},S\n" for n in room.players.all()),)
+        )
+
+    def test_admin_player_changelist(self):
+        admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.force_login(admin)
+        self.assertQueryBudget('admin_player_changelist', lambda room: self.client.get('/admin/myapp/player/'))
+
+
+class ConditionalGetTests(TestCase):
+    """
+    ETag ของห้องต้องเปลี่ยนทุกครั้งที่ห้องหรือผู้เล่นในห้องเปลี่ยน ไม่ว่าจะผ่าน save() หรือ update()
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.room = Room.objects.create(name="room", open_time=time(18), close_time=time(22))
+        self.other_room = Room.objects.create(name="other", open_time=time(18), close_time=time(22))
+        self.players = [Player.objects.create(room=self.room, name=f"p{n}", skill='S') for n in range(4)]
+
+    def assertChangesETag(self, url, change):
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_player_save(self):
+        player = self.players[0]
+        player.name = "renamed"
+        self.assertChangesETag(f'/rooms/{self.room.id}/', player.save)
+
+    def test_player_moved_to_other_room(self):
+        player = Player.objects.get(pk=self.players[0].pk)
+        player.room = self.other_room
+        self.assertChangesETag(f'/rooms/{self.room.id}/', player.save)
+
+    def test_player_delete(self):
+        self.assertChangesETag(f'/players/?room={self.room.id}', self.players[0].delete)
+
+    def test_record_match(self):
+        player_ids = [player.id for player in self.players]
+        self.assertChangesETag(
+            f'/players/{player_ids[0]}/',
+            lambda: self.client.post(f'/rooms/{self.room.id}/record_match/', {'players': player_ids}, format='json')
+        )
+
+    def test_room_update(self):
+        self.assertChangesETag(
+            f'/rooms/{self.room.id}/',
+            lambda: self.client.patch(f'/rooms/{self.room.id}/', {'name': 'renamed'}, format='json')
+        )
+
+    def test_version_is_read_only(self):
+        self.room.refresh_from_db()
+        response = self.client.patch(f'/rooms/{self.room.id}/', {'version': 1}, format='json')
+        self.assertEqual(response.data['version'], self.room.version + 1)
+
+
+class FastReadPathTests(TestCase):
+    """
+    list/retrieve ที่อ่านจาก values() ต้องได้ JSON เดียวกับ RoomSerializer/PlayerSerializer ทุก byte
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.rooms = []
+        for index in range(3):
+            room = Room.objects.create(name=f"สนาม {index}", open_time=time(18, 30), close_time=time(22))
+            Player.objects.bulk_create([
+                Player(room=room, name=f"ผู้เล่น {n}\u2028", skill='S', number_of_matches=(n * 7) % 4)
+                for n in range(5)
+            ])
+            self.rooms.append(room)
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def test_room_detail(self):
+        room = Room.objects.with_players().get(pk=self.rooms[0].pk)
+        response = self.client.get(f'/rooms/{room.id}/')
+        self.assertEqual(response.content, self.render(RoomSerializer(room).data))
+
+    def test_room_list(self):
+        rooms = Room.objects.with_players().order_by('id')
+        response = self.client.get('/rooms/')
+        self.assertEqual(self.render(response.data['results']), self.render(RoomSerializer(rooms, many=True).data))
+        self.assertIn(self.render(response.data['results']), response.content)
+
+    def test_player_detail(self):
+        player = Player.objects.first()
+        response = self.client.get(f'/players/{player.id}/')
+        self.assertEqual(response.content, self.render(PlayerSerializer(player).data))
+
+    def test_player_list_ordering_and_cursor(self):
+        players = list(Player.objects.order_by('-number_of_matches', '-id'))
+        first = self.client.get('/players/?ordering=-number_of_matches&page_size=4')
+        second = self.client.get(first.data['next'])
+        results = first.data['results'] + second.data['results']
+        self.assertEqual(self.render(results), self.render(PlayerSerializer(players[:8], many=True).data))
+
+    def test_player_cursor_across_equal_values(self):
+        # number_of_matches ซ้ำกันหลายแถวต่อค่า page_size=2 จึงตัดกลางกลุ่มที่ค่าเท่ากันเสมอ
+        expected = list(Player.objects.order_by('number_of_matches', 'id').values_list('id', flat=True))
+        seen, pages, url = [], [], '/players/?ordering=number_of_matches&page_size=2'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertFalse(any('OFFSET' in query['sql'] for query in queries.captured_queries))
+            seen += [player['id'] for player in response.data['results']]
+            pages.append(response.data)
+            url = response.data['next']
+        self.assertEqual(seen, expected)
+
+        back, url = [], pages[-1]['previous']
+        while url:
+            response = self.client.get(url)
+            back = [player['id'] for player in response.data['results']] + back
+            url = response.data['previous']
+        self.assertEqual(back, expected[:len(expected) - len(pages[-1]['results'])])
+
+    def test_player_cursor_rejects_tampered_position(self):
+        response = self.client.get('/players/?ordering=number_of_matches&page_size=2')
+        cursor = parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+        position = b64encode(urlencode({'p': json.dumps(['x', 'y'])}).encode()).decode()
+        self.assertEqual(self.client.get('/players/', {'ordering': 'number_of_matches', 'cursor': position}).status_code, 404)
+        self.assertEqual(self.client.get('/players/', {'cursor': cursor}).status_code, 404)
+
+
+class MatchHistoryTests(TestCase):
+    """
+    record_match บันทึกแมชต์และนับคู่หู/คู่แข่งทีละคู่ ซึ่ง local engine ใช้เลี่ยงการจับคู่ซ้ำ
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        caches['matchmaking'].clear()
+        self.room = Room.objects.create(name="room", open_time=time(18), close_time=time(22))
+        self.players = [Player.objects.create(room=self.room, name=f"p{n}", skill='S') for n in range(4)]
+        self.ids = [player.id for player in self.players]
+
+    def record(self, player_ids):
+        response = self.client.post(f'/rooms/{self.room.id}/record_match/', {'players': player_ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def pair(self, a, b):
+        return PairStat.objects.get(room=self.room, player_low_id=min(a, b), player_high_id=max(a, b))
+
+    def test_records_match_and_pair_counts(self):
+        a, b, c, d = self.ids
+        self.record([a, b, c, d])
+        self.record([a, b, d, c])
+
+        match = Match.objects.filter(room=self.room).latest('pk')
+        self.assertEqual(
+            sorted(match.participants.values_list('team', 'player_id')), sorted([(1, a), (1, b), (2, d), (2, c)])
+        )
+        self.assertEqual((self.pair(a, b).partnered, self.pair(a, b).opposed), (2, 0))
+        self.assertEqual((self.pair(c, d).partnered, self.pair(c, d).opposed), (2, 0))
+        self.assertEqual((self.pair(a, c).partnered, self.pair(a, c).opposed), (0, 2))
+        self.assertEqual(PairStat.objects.filter(room=self.room).count(), 6)
+
+    def test_singles(self):
+        a, b = self.ids[:2]
+        self.record([a, b])
+        self.assertEqual((self.pair(a, b).partnered, self.pair(a, b).opposed), (0, 1))
+
+    def test_unknown_player_rolls_back_history(self):
+        response = self.client.post(
+            f'/rooms/{self.room.id}/record_match/', {'players': self.ids[:3] + [0]}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Match.objects.exists())
+        self.assertFalse(PairStat.objects.exists())
+
+    def team_ids(self):
+        response = self.client.get(f'/rooms/{self.room.id}/ai_matchmaking/?engine=local')
+        self.assertEqual(response.status_code, 200)
+        return [sorted(p['id'] for p in team['players']) for team in response.data['matchmaking']['teams']]
+
+    def test_local_engine_avoids_repeated_partners(self):
+        # ทักษะเท่ากันทุกคน การแบ่งทีมทุกแบบสมดุลเท่ากัน ประวัติจึงเป็นตัวตัดสิน
+        first = self.team_ids()
+        self.record(first[0] + first[1])
+        second = self.team_ids()
+        self.assertNotIn(first[0], second)
+        self.assertNotIn(first[1], second)
+
+    def test_history_never_outweighs_skill_balance(self):
+        service = LocalMatchmakingService()
+        quartet = service.build_queue([
+            {'id': 1, 'name': 'a', 'skill': 'BG'}, {'id': 2, 'name': 'b', 'skill': 'N'},
+            {'id': 3, 'name': 'c', 'skill': 'P-'}, {'id': 4, 'name': 'd', 'skill': 'P/P+'},
+        ])
+        balanced = service.split_teams(quartet)
+        self.assertEqual(service.split_cost(balanced), 0)
+
+        # คู่หูของการแบ่งทีมที่สมดุลที่สุดเคยจับคู่กันมาแล้วหลายครั้ง ก็ยังต้องเลือกแบบเดิม
+        history = PairHistory({(1, 4): (100, 0), (2, 3): (100, 0)})
+        self.assertEqual(service.split_teams(quartet, history), balanced)
+
+
+class WaitingQueueTests(TestCase):
+    """
+    heap ของคิวต้องตรงกับ Player.objects.in_queue_order() หลังทุกเหตุการณ์ โดยอัปเดตทีละผู้เล่นไม่ต้องสร้างใหม่
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        waiting_queues.clear()
+        self.room = Room.objects.create(name="room", open_time=time(18), close_time=time(22))
+        self.other_room = Room.objects.create(name="other", open_time=time(18), close_time=time(22))
+        skills = ['N', 'S', 'P-']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.players = [
+                Player.objects.create(room=self.room, name=f"p{n}", skill=skills[n % 3], number_of_matches=n % 4)
+                for n in range(12)
+            ]
+
+    def queue_ids(self, **params):
+        response = self.client.get(f'/rooms/{self.room.id}/queue/', {'limit': 200, **params})
+        self.assertEqual(response.status_code, 200)
+        return [player['id'] for player in response.data['players']]
+
+    def expected_ids(self, **filters):
+        return list(Player.objects.filter(room=self.room, **filters).in_queue_order().values_list('id', flat=True))
+
+    def assertIncremental(self, change):
+        # อ่านครั้งแรกเพื่อสร้าง heap แล้วเปลี่ยนข้อมูล การอ่านครั้งถัดไปต้องใช้ query เดียว (ไม่สร้างใหม่)
+        self.assertEqual(self.queue_ids(), self.expected_ids())
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        with self.assertNumQueries(1):
+            ids = self.queue_ids()
+        self.assertEqual(ids, self.expected_ids())
+
+    def test_initial_order_and_limit(self):
+        self.assertEqual(self.queue_ids(), self.expected_ids())
+        self.assertEqual(self.queue_ids(limit=3), self.expected_ids()[:3])
+
+    def test_skill_bucket(self):
+        self.assertEqual(self.queue_ids(skill='S'), self.expected_ids(skill='S'))
+        self.assertEqual(self.queue_ids(skill='p-'), self.expected_ids(skill='P-'))
+
+    def test_record_match(self):
+        player_ids = self.expected_ids()[:4]
+        self.assertIncremental(
+            lambda: self.client.post(f'/rooms/{self.room.id}/record_match/', {'players': player_ids}, format='json')
+        )
+
+    def test_player_join_and_update(self):
+        def change():
+            Player.objects.create(room=self.room, name="late", skill='S')
+            self.players[5].number_of_matches = 0
+            self.players[5].save()
+        self.assertIncremental(change)
+
+    def test_player_leave_and_move(self):
+        def change():
+            self.players[0].delete()
+            moved = Player.objects.get(pk=self.players[1].pk)
+            moved.room = self.other_room
+            moved.save()
+        self.assertIncremental(change)
+
+    def test_check_in(self):
+        self.assertIncremental(
+            lambda: self.client.post(
+                f'/rooms/{self.room.id}/check_in/', "name,skill\nguest 1,S\nguest 2,N\n", content_type='text/csv'
+            )
+        )
+
+    def test_rebuilds_when_changed_elsewhere(self):
+        # เหมือน worker อื่นแก้ผู้เล่น: ไม่มี signal ในโปรเซสนี้ แต่ version ของห้องเปลี่ยน
+        self.assertEqual(self.queue_ids(), self.expected_ids())
+        Player.objects.filter(pk=self.players[-1].pk).update(number_of_matches=-1)
+        Room.objects.filter(pk=self.room.pk).bump_version()
+        self.assertEqual(self.queue_ids()[0], self.players[-1].pk)
+
+    def test_invalid_limit(self):
+        response = self.client.get(f'/rooms/{self.room.id}/queue/?limit=0')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.data)
+
+
+class CandidateSelectionTests(SimpleTestCase):
+    """
+    ผู้เล่นที่ส่งให้ provider ต้องเป็นคิวต้นๆ และครอบคลุมทุกระดับทักษะที่มีในห้อง
+    """
+
+    def test_small_room_is_unchanged(self):
+        players = synthetic_players(10)
+        self.assertEqual(select_candidates(players, 16), players)
+        self.assertEqual(select_candidates(synthetic_players(150), 0), synthetic_players(150))
+
+    def test_top_k_of_large_room(self):
+        players = synthetic_players(150)
+        candidates = select_candidates(players, 16)
+        queue = sorted(players, key=queue_key)
+
+        self.assertEqual(len(candidates), 16)
+        self.assertEqual(candidates, sorted(candidates, key=queue_key))
+        # คนแรกในคิวได้เสมอ และทุกระดับทักษะมีอย่างน้อยสองคน
+        self.assertIn(queue[0], candidates)
+        for rank in {skill_rank(p['skill']) for p in players}:
+            self.assertGreaterEqual(sum(skill_rank(p['skill']) == rank for p in candidates), 2)
+
+    def test_reserved_bands_are_capped_by_top_k(self):
+        players = synthetic_players(150)
+        candidates = select_candidates(players, 4)
+        self.assertEqual(len(candidates), 4)
+
+
+class TopKMatchmakingTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        caches['matchmaking'].clear()
+        self.room = Room.objects.create(name="room", open_time=time(18), close_time=time(22))
+        Player.objects.bulk_create([
+            Player(room=self.room, name=f"p{n}", skill=['N', 'S', 'P-'][n % 3], number_of_matches=n % 5)
+            for n in range(30)
+        ])
+
+    def test_only_candidates_reach_the_provider(self):
+        response = self.client.get(f'/rooms/{self.room.id}/ai_matchmaking/?engine=local&top_k=8')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['room']['player_count'], 30)
+        self.assertEqual(response.data['room']['candidate_count'], 8)
+
+        # local engine เลือกผู้เล่นที่มีจำนวนแมชต์น้อยที่สุดจากผู้เล่นที่ส่งไปเท่านั้น
+        chosen = [p['id'] for team in response.data['matchmaking']['teams'] for p in team['players']]
+        matches = Player.objects.filter(id__in=chosen).values_list('number_of_matches', flat=True)
+        self.assertEqual(set(matches), {0})
+
+    def test_invalid_top_k(self):
+        response = self.client.get(f'/rooms/{self.room.id}/ai_matchmaking/?engine=local&top_k=2')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("error", response.data)
+
+
+class TwoPhaseMatchmakingTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        caches['matchmaking'].clear()
+        self.room = Room.objects.create(name="room", open_time=time(18), close_time=time(22))
+        Player.objects.bulk_create([
+            Player(room=self.room, name=f"p{n}", skill=['S', 'P-'][n % 2]) for n in range(6)
+        ])
+
+    def fake_teams(self, room_data):
+        result = LocalMatchmakingService().generate_matchmaking(room_data)
+        return {"teams": result["teams"], "match": result["match"], "model_used": "fake"}
+
+    def test_teams_first_then_analysis(self):
+        url = f'/rooms/{self.room.id}/ai_matchmaking/?engine=claude&fallback=0&analysis=deferred'
+        with mock.patch.object(claude_service, 'generate_teams', side_effect=self.fake_teams), \
+                self.captureOnCommitCallbacks():
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['matchmaking']['teams']), 2)
+        self.assertIsNone(response.data['matchmaking']['analysis'])
+        job_id = response.data['analysis_job']['id']
+        self.assertEqual(response.data['analysis_job']['status'], MatchmakingJob.STATUS_QUEUED)
+
+        subscription = realtime.Subscription(self.room.id)
+        realtime.broadcaster.subscribe(subscription)
+        self.addCleanup(realtime.broadcaster.unsubscribe, subscription)
+
+        analysis = {"analysis": "ทีมสมดุล", "model_used": "fake"}
+        # run_job ปกติรันใน worker thread ที่ปิด connection ของตัวเองเมื่อจบ
+        with mock.patch.object(claude_service, 'generate_analysis', return_value=analysis) as generate, \
+                mock.patch.object(jobs, 'close_old_connections'), \
+                self.captureOnCommitCallbacks(execute=True):
+            jobs.run_job(job_id)
+
+        # phase ที่สองส่งเฉพาะผู้เล่น 4 คนที่ถูกเลือก
+        self.assertEqual(len(generate.call_args.args[0]), 4)
+        event = subscription.get(0)
+        self.assertEqual(event['type'], 'analysis')
+        self.assertEqual(event['job']['status'], MatchmakingJob.STATUS_SUCCEEDED)
+        self.assertEqual(event['job']['result']['analysis'], "ทีมสมดุล")
+
+        # ผลทีมมาจาก cache ส่วนคำวิเคราะห์อ่านจาก job ที่เสร็จแล้ว
+        response = self.client.get(url)
+        self.assertEqual(response.data['cache'], 'hit')
+        self.assertEqual(response.data['matchmaking']['analysis'], "ทีมสมดุล")
+        self.assertEqual(response.data['analysis_job']['status'], MatchmakingJob.STATUS_SUCCEEDED)
+
+    def test_local_engine_answers_in_one_phase(self):
+        response = self.client.get(f'/rooms/{self.room.id}/ai_matchmaking/?engine=local&analysis=deferred')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['matchmaking']['analysis'])
+        self.assertIsNone(response.data['analysis_job'])
+        self.assertFalse(MatchmakingJob.objects.exists())
+
+
+class CheckInTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        self.room = Room.objects.create(name="room", open_time=time(18), close_time=time(22))
+        self.url = f'/rooms/{self.room.id}/check_in/'
+
+    def post_json(self, body):
+        return self.client.post(self.url, body, content_type='application/json')
+
+    def test_json_rows_across_chunks(self):
+        rows = [{"name": f"ผู้เล่น {n}", "skill": "S", "number_of_matches": 10 * n} for n in range(5)]
+        # chunk เล็กจนตัดกลางชื่อภาษาไทยและกลางตัวเลข
+        with mock.patch.object(check_in, 'CHUNK_SIZE', 7):
+            response = self.post_json(json.dumps(rows, ensure_ascii=False))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            list(self.room.players.order_by('id').values_list('name', 'number_of_matches')),
+            [(row["name"], row["number_of_matches"]) for row in rows]
+        )
+
+    def test_malformed_json(self):
+        for body in ["[{'name':'c','skill':'S'},]", '[{"name":"c","skill":"S"},]', '[{"name":"c","skill":"S"}', '[{"name":"c"} {"name":"d"}]']:
+            with self.subTest(body=body):
+                response = self.post_json(body)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("error", response.data)
+        self.assertFalse(self.room.players.exists())
+
+    def test_non_array(self):
+        for body in ['{"name":"c","skill":"S"}', '', '[]']:
+            with self.subTest(body=body):
+                self.assertEqual(self.post_json(body).status_code, 400)
+
+    def test_row_errors(self):
+        response = self.post_json(json.dumps([{"name": "a", "skill": "S"}, {"name": "b"}, "c"]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([row["row"] for row in response.data["rows"]], [2, 3])
+        self.assertIn("skill", response.data["rows"][0]["errors"])
+        # แถวที่ถูกต้องก็ไม่ถูกสร้างเมื่อมีแถวที่ผิด
+        self.assertFalse(self.room.players.exists())
+
+    def test_csv(self):
+        body = "name,skill,number_of_matches\r\nสมชาย,S,2\r\nมานี,P-,\r\n"
+        response = self.client.post(self.url, body, content_type='text/csv')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(
+            set(self.room.players.values_list('name', 'skill', 'number_of_matches')),
+            {("สมชาย", "S", 2), ("มานี", "P-", 0)}
+        )
+
+    def test_unsupported_media_type(self):
+        response = self.client.post(self.url, "name,skill\na,S\n", content_type='text/plain')
+        self.assertEqual(response.status_code, 415)
+
+
+class JsonScannerTests(SimpleTestCase):
+    RESULT = {
+        "teams": [
+            {"team_name": "ทีมที่ 1", "players": [{"id": 1, "name": "a", "skill": "S"}, {"id": 2, "name": "b", "skill": "N"}],
+             "compatibility_score": 80},
+            {"team_name": "ทีมที่ 2", "players": [{"id": 3, "name": "c", "skill": "S"}, {"id": 4, "name": "d", "skill": "N"}],
+             "compatibility_score": 82},
+        ],
+        "match": {"team1": "ทีมที่ 1", "team2": "ทีมที่ 2", "balance_score": 90},
+        "analysis": 'ทีมสมดุล "ดีมาก"\né 😀 {ปีกกา} จบ',
+    }
+
+    def extract(self, text):
+        return json.loads(extract_json(text))
+
+    def test_repairs(self):
+        cases = {
+            "comments": ('{"a": 1, // หนึ่ง\n /* สอง */ "b": 2}', {"a": 1, "b": 2}),
+            "trailing commas": ('{"a": [1, 2,], "b": {"c": 3,},}', {"a": [1, 2], "b": {"c": 3}}),
+            "single quotes": ("{'a': 'it\\'s \"x\"'}", {"a": 'it\'s "x"'}),
+            "control characters": ('{"a": "line\nnext\ttab"}', {"a": "line\nnext\ttab"}),
+            "code fence and prose": ('ผลลัพธ์:\n```json\n{"a": "}"}\n```\nหมายเหตุ {x}', {"a": "}"}),
+            "slash inside string": ('{"url": "http://x/*y*/"}', {"url": "http://x/*y*/"}),
+        }
+        for name, (text, expected) in cases.items():
+            with self.subTest(name):
+                self.assertEqual(self.extract(text), expected)
+
+    def test_no_json(self):
+        self.assertIsNone(extract_json("ไม่มี JSON"))
+
+    def test_truncated_output_is_an_error(self):
+        text = json.dumps(self.RESULT, ensure_ascii=False)
+        for cut in (text[:-1], text[:text.index('"analysis"') + 20], text[:text.index('"match"')]):
+            with self.subTest(cut=cut[-20:]):
+                with self.assertRaises(TruncatedJsonError):
+                    extract_json(cut)
+                # provider ได้ error แทนผลลัพธ์ที่ถูกปิดวงเล็บให้
+                with self.assertRaises(json.JSONDecodeError):
+                    LocalMatchmakingService().load_json(cut, {})
+
+    def test_chunked_feed_matches_whole_text(self):
+        text = "```json\n{'teams': [1, 2,], // x\n 'analysis': 'ไทย\n'}\n```"
+        scanner = JsonScanner()
+        events = [event for char in text for event in scanner.feed(char)]
+        self.assertEqual(events, [(VALUE, (), extract_json(text))])
+
+    def test_stream_parser_events(self):
+        # ensure_ascii ทำให้มี \uXXXX และคู่ surrogate ที่ถูกตัดกลางเมื่อส่งทีละตัวอักษร
+        text = "นี่คือผลลัพธ์\n```json\n" + json.dumps(self.RESULT, indent=1) + "\n```"
+        parser = MatchmakingStreamParser()
+        events = [event for char in text for event in parser.feed(char)]
+
+        names = [name for name, _ in events if name != "analysis_delta"]
+        self.assertEqual(names, ["team", "team", "match", "analysis"])
+        self.assertEqual([data for name, data in events if name == "team"], self.RESULT["teams"])
+        self.assertEqual([data for name, data in events if name == "match"], [self.RESULT["match"]])
+        deltas = [data for name, data in events if name == "analysis_delta"]
+        self.assertGreater(len(deltas), 1)
+        self.assertEqual("".join(deltas), self.RESULT["analysis"])
+        self.assertEqual(json.loads(parser.finish()), self.RESULT)
+
+    def test_analysis_delta_work_is_linear(self):
+        # นับจำนวนตัวอักษรที่ส่งให้ json.loads แทนการจับเวลา: ถ้าถอดรหัสทั้ง string ซ้ำทุก chunk จะโตแบบกำลังสอง
+        analysis = self.RESULT["analysis"] * 1000
+        text = json.dumps(dict(self.RESULT, analysis=analysis), indent=1)
+        scanner = JsonScanner(deltas=[("analysis",)])
+        loads = json.loads
+        decoded = []
+
+        def counting_loads(value, *args, **kwargs):
+            decoded.append(len(value))
+            return loads(value, *args, **kwargs)
+
+        with mock.patch('myapp.services.json_scanner.json.loads', counting_loads):
+            events = [event for start in range(0, len(text), 16) for event in scanner.feed(text[start:start + 16])]
+        self.assertEqual("".join(data for kind, _, data in events if kind == DELTA), analysis)
+        self.assertLess(sum(decoded), 2 * len(text))
+
+    def test_stream_parser_repairs_and_truncation(self):
+        text = "{'teams': [{'team_name': 'x', 'players': [],}, // ทีม\n], 'analysis': 'ตัดกลาง"
+        parser = MatchmakingStreamParser()
+        events = parser.feed(text)
+        self.assertEqual(events[0], ("team", {"team_name": "x", "players": []}))
+        self.assertEqual(events[-1], ("analysis_delta", "ตัดกลาง"))
+        with self.assertRaises(TruncatedJsonError):
+            parser.finish()
+
+
+class MatchmakingSchemaTests(SimpleTestCase):
+    """
+    ผลลัพธ์จาก provider ที่ไม่ตรงกับ MATCHMAKING_SCHEMA ต้องกลายเป็น error ไม่ใช่ผลการจับคู่
+    """
+
+    def valid(self):
+        players = [local_player(n, 'S') for n in range(1, 5)]
+        result = LocalMatchmakingService().generate_matchmaking({'players': players})
+        return {key: result[key] for key in ("teams", "match", "analysis")}
+
+    def test_valid_result(self):
+        data = self.valid()
+        self.assertIs(validate_matchmaking(data), data)
+
+    def test_invalid_results_are_rejected(self):
+        def remove_teams(data):
+            del data['teams']
+
+        def teams_object(data):
+            data['teams'] = {"team1": data['teams'][0]}
+
+        def string_id(data):
+            data['teams'][0]['players'][0]['id'] = "1"
+
+        def bool_score(data):
+            data['match']['balance_score'] = True
+
+        def score_out_of_range(data):
+            data['teams'][1]['compatibility_score'] = 150
+
+        def three_players(data):
+            data['teams'][0]['players'].append(data['teams'][1]['players'][0])
+
+        def extra_key(data):
+            data['confidence'] = 0.9
+
+        def extra_player_key(data):
+            data['teams'][1]['players'][1]['rank'] = 3
+
+        cases = {
+            remove_teams: "$.teams: required",
+            teams_object: "$.teams: expected array",
+            string_id: "$.teams[0].players[0].id: expected integer",
+            bool_score: "$.match.balance_score: expected number",
+            score_out_of_range: "$.teams[1].compatibility_score: out of range",
+            three_players: "$.teams[0].players: expected 2-2 items",
+            extra_key: "$.confidence: unexpected key",
+            extra_player_key: "$.teams[1].players[1].rank: unexpected key",
+        }
+        for change, message in cases.items():
+            with self.subTest(change.__name__):
+                data = self.valid()
+                change(data)
+                with self.assertRaisesMessage(MatchmakingSchemaError, message):
+                    validate_matchmaking(data)
+
+    def test_provider_returns_schema_error(self):
+        data = self.valid()
+        del data['teams']
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {"response": json.dumps(data)}
+
+        with mock.patch.object(http_transport, 'post', return_value=response):
+            result = ollama_service.generate_matchmaking({'players': [local_player(n) for n in range(1, 5)]})
+        self.assertEqual(result['error'], "$.teams: required")
+        self.assertNotIn("teams", result)
+
+        # ข้อความจาก stream ตรวจกับ schema เดียวกัน
+        with self.assertRaises(MatchmakingSchemaError):
+            claude_service.parse_response_text(json.dumps(dict(self.valid(), teams=[])))
+
+
+async def asgi_get(path, until=lambda body: False, timeout=5):
+    """
+    ส่ง GET ผ่าน myproject.asgi.application แบบที่ server ASGI ทำ อ่าน body ทีละข้อความ
+    และตัดการเชื่อมต่อเมื่อ until(body) เป็นจริง คืน (status, body)
+    ถ้า response ถูก buffer จน until ไม่เคยเป็นจริงภายใน timeout จะ raise TimeoutError
+    """
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+        'root_path': '', 'headers': [(b'host', b'testserver'), (b'accept', b'text/event-stream')],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    disconnected = asyncio.Event()
+    request_sent = False
+    start = {}
+    body = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            start.update(message)
+            return
+        body.append(message.get('body', b''))
+        if not message.get('more_body') or until(b''.join(body).decode()):
+            disconnected.set()
+
+    # เหมือน test client ของ Django: ไม่ให้ signal ของ request ปิด connection ที่ TestCase ใช้อยู่
+    request_started.disconnect(close_old_connections)
+    request_finished.disconnect(close_old_connections)
+    try:
+        await asyncio.wait_for(application(scope, receive, send), timeout)
+    finally:
+        request_started.connect(close_old_connections)
+        request_finished.connect(close_old_connections)
+    return start['status'], b''.join(body).decode()
+
+
+def sse_events(body):
+    # [(ชื่อ event, data)] จาก body ของ text/event-stream
+    events = []
+    for block in body.split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line)
+        if 'event' in lines:
+            events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+class MatchmakingStreamTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        caches['matchmaking'].clear()
+        self.room = Room.objects.create(name="room", open_time=time(18), close_time=time(22))
+        Player.objects.bulk_create([
+            Player(room=self.room, name=f"p{n}", skill=['S', 'P-'][n % 2]) for n in range(6)
+        ])
+        self.url = f'/rooms/{self.room.id}/ai_matchmaking_stream/?engine=claude'
+        self.first_team = asyncio.Event()
+
+    async def fake_stream(self, room_data):
+        result = LocalMatchmakingService().generate_matchmaking(dict(room_data, pair_history=PairHistory()))
+        text = json.dumps({key: result[key] for key in ("teams", "match", "analysis")}, ensure_ascii=False)
+        second_team = text.index('"team_name"', text.index('"team_name"') + 1)
+        for index in range(0, len(text), 16):
+            if index >= second_team:
+                # ส่งต่อเมื่อ client ได้รับทีมแรกแล้วเท่านั้น ถ้า response ถูก buffer ไว้ test จะ timeout
+                await self.first_team.wait()
+            yield text[index:index + 16]
+
+    def wsgi_stream(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='text/event-stream')
+        return b''.join(response.streaming_content).decode()
+
+    def received(self, body):
+        if 'event: team' in body:
+            self.first_team.set()
+        return False
+
+    async def test_events_arrive_while_the_provider_streams(self):
+        with mock.patch.object(claude_service, 'astream_matchmaking', self.fake_stream):
+            status, body = await asgi_get(self.url, self.received)
+        self.assertEqual(status, 200)
+
+        events = sse_events(body)
+        names = [name for name, _ in events if name != 'analysis_delta']
+        self.assertEqual(names, ['room', 'team', 'team', 'match', 'analysis', 'done'])
+        self.assertEqual(events[0][1]['candidate_count'], 6)
+        analysis = ''.join(data for name, data in events if name == 'analysis_delta')
+        done = events[-1][1]
+        self.assertEqual(done['engine'], 'claude')
+        self.assertEqual(analysis, done['matchmaking']['analysis'])
+
+        # ครั้งที่สองได้จาก cache เป็น event ชุดเดียวกันโดยไม่เรียก provider (ผ่าน WSGI ด้วย generator ธรรมดา)
+        with mock.patch.object(claude_service, 'stream_matchmaking') as stream:
+            cached = sse_events(await sync_to_async(self.wsgi_stream)())
+        stream.assert_not_called()
+        self.assertEqual([name for name, _ in cached], ['room', 'team', 'team', 'match', 'analysis', 'done'])
+        self.assertEqual(cached[-1][1]['matchmaking'], done['matchmaking'])
+
+    async def test_failed_provider_falls_back_before_the_first_event(self):
+        async def unavailable(room_data):
+            raise ConnectionError("unavailable")
+            yield
+
+        with mock.patch.object(claude_service, 'astream_matchmaking', unavailable), \
+                mock.patch.object(ollama_service, 'astream_matchmaking', unavailable), \
+                mock.patch.object(huggingface_service, 'astream_matchmaking', unavailable):
+            status, body = await asgi_get(self.url)
+        events = sse_events(body)
+        self.assertEqual([name for name, _ in events], ['room', 'team', 'team', 'match', 'analysis', 'done'])
+        self.assertEqual(events[-1][1]['engine'], 'local')
+
+
+class RoomEventsTests(TestCase):
+
+    def setUp(self):
+        self.room = Room.objects.create(name="room", open_time=time(18), close_time=time(22))
+        Player.objects.bulk_create([Player(room=self.room, name=f"p{n}", skill='S') for n in range(3)])
+
+    async def test_snapshot_then_events_over_asgi(self):
+        def received(body):
+            if 'event: snapshot' in body and 'event: player_removed' not in body:
+                realtime.broadcaster.publish(self.room.id, realtime.player_removed_event(42))
+            return 'event: player_removed' in body
+
+        # generator ที่ถูก buffer หรือบล็อกจะไม่ส่งอะไรออกมาเลย และ asgi_get จะ timeout
+        status, body = await asgi_get(f'/rooms/{self.room.id}/events/', received)
+        self.assertEqual(status, 200)
+        events = sse_events(body)
+        self.assertEqual([name for name, _ in events], ['snapshot', 'player_removed'])
+        self.assertEqual(len(events[0][1]['room']['players']), 3)
+        self.assertEqual(events[1][1]['id'], 42)
+        # ตัดการเชื่อมต่อแล้ว generator ต้องจบและยกเลิกการติดตาม
+        self.assertFalse(realtime.broadcaster.has_subscribers(self.room.id))
+
+    async def test_resync_and_deleted_room(self):
+        def received(body):
+            if body.count('event: snapshot') == 1 and 'event: room_deleted' not in body:
+                realtime.broadcaster.publish(self.room.id, realtime.RESYNC)
+            elif body.count('event: snapshot') == 2:
+                realtime.broadcaster.publish(self.room.id, realtime.room_deleted_event(self.room.id))
+            return False
+
+        status, body = await asgi_get(f'/rooms/{self.room.id}/events/', received)
+        # room_deleted ปิด stream เองโดยไม่ต้องรอ client
+        self.assertEqual([name for name, _ in sse_events(body)], ['snapshot', 'snapshot', 'room_deleted'])
+        self.assertFalse(realtime.broadcaster.has_subscribers(self.room.id))
+
+
+def local_player(id, skill='S', matches=0, join_time='2025-01-01T18:00:00Z'):
+    return {'id': id, 'name': f"p{id}", 'skill': skill, 'number_of_matches': matches, 'join_time': join_time}
+
+
+def team_ids(result):
+    return [{p['id'] for p in team['players']} for team in result['teams']]
+
+
+class LocalMatchmakingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.service = LocalMatchmakingService()
+
+    def chosen(self, result):
+        return set().union(*team_ids(result))
+
+    def test_players_are_taken_in_queue_order(self):
+        players = [
+            local_player(1, matches=1),
+            local_player(2, join_time='2025-01-01T18:30:00Z'),
+            local_player(3, join_time='2025-01-01T18:10:00Z'),
+            local_player(4, matches=2),
+            local_player(5, join_time='2025-01-01T18:10:00Z'),
+            local_player(6, join_time='2025-01-01T18:05:00Z'),
+        ]
+        # แมชต์น้อยก่อน แล้วจึงเวลาเข้าร่วมและ id ตามลำดับ
+        queue = self.service.build_queue(players)
+        self.assertEqual([p['id'] for p in queue], [6, 3, 5, 2, 1, 4])
+        self.assertEqual(self.chosen(self.service.generate_matchmaking({'players': players})), {2, 3, 5, 6})
+
+    def test_skill_spread_stays_within_one_level(self):
+        # 4 คนแรกในคิวทักษะห่างกันมาก จึงเลือกคนที่รอนานกว่าแต่ทักษะใกล้กันแทน
+        players = [
+            local_player(1, 'BG'), local_player(2, 'BG'), local_player(3, 'C'), local_player(4, 'C'),
+            local_player(5, 'N', matches=1), local_player(6, 'N', matches=1),
+        ]
+        result = self.service.generate_matchmaking({'players': players})
+        self.assertEqual(self.chosen(result), {1, 2, 5, 6})
+        ranks = [skill_rank(p['skill']) for team in result['teams'] for p in team['players']]
+        self.assertLessEqual(max(ranks) - min(ranks), 1)
+
+    def test_skill_spread_widens_when_needed(self):
+        players = [local_player(1, 'BG'), local_player(2, 'S'), local_player(3, 'C'), local_player(4, 'B/A')]
+        result = self.service.generate_matchmaking({'players': players})
+        self.assertEqual(self.chosen(result), {1, 2, 3, 4})
+        self.assertIn("ต่างกัน 6 ขั้น", result['analysis'])
+        self.assertLess(result['match']['balance_score'], 100)
+
+    def test_cross_split(self):
+        players = [local_player(1, 'N'), local_player(2, 'S'), local_player(3, 'P-'), local_player(4, 'P/P+')]
+        result = self.service.generate_matchmaking({'players': players})
+        # เก่งสุดคู่กับอ่อนสุด ผลรวมทักษะสองทีมเท่ากัน
+        self.assertCountEqual(team_ids(result), [{4, 1}, {3, 2}])
+
+        # การแบ่งแบบอื่นที่สมดุลเท่ากันไม่ถูกเลือกแทนแบบไขว้ (คนแรกในคิวของแต่ละระดับอยู่คนละทีม)
+        players = [local_player(1, 'S'), local_player(2, 'S'), local_player(3, 'P-'), local_player(4, 'P-')]
+        result = self.service.generate_matchmaking({'players': players})
+        self.assertCountEqual(team_ids(result), [{3, 2}, {4, 1}])
+        self.assertEqual(result['match']['balance_score'], 100)
+
+    def test_not_enough_players(self):
+        result = self.service.generate_matchmaking({'players': [local_player(n) for n in range(3)]})
+        self.assertIn("error", result)
+
+    def test_batch_courts_never_share_a_player(self):
+        skills = ['N', 'S', 'P-']
+        players = [local_player(n, skills[n % 3], matches=n % 4) for n in range(1, 15)]
+        result = self.service.generate_batch_matchmaking({'players': players}, 3)
+
+        courts = [set().union(*team_ids(court)) for court in result['courts']]
+        self.assertEqual([court['court'] for court in result['courts']], [1, 2, 3])
+        self.assertEqual([len(court) for court in courts], [4, 4, 4])
+        self.assertEqual(len(set().union(*courts)), 12)
+        for court in result['courts']:
+            ranks = [skill_rank(p['skill']) for team in court['teams'] for p in team['players']]
+            self.assertLessEqual(max(ranks) - min(ranks), 1)
+
+        # ผู้ที่ไม่ได้ลงสนามคือคนท้ายคิว เรียงตามคิว
+        queue = [p['id'] for p in self.service.build_queue(players)]
+        self.assertEqual(result['waiting'], [player_id for player_id in queue if player_id not in set().union(*courts)])
+        self.assertEqual([players[player_id - 1]['number_of_matches'] for player_id in result['waiting']], [3, 3])
+
+    def test_batch_courts_are_capped_by_players(self):
+        players = [local_player(n) for n in range(1, 10)]
+        result = self.service.generate_batch_matchmaking({'players': players}, 5)
+        self.assertEqual(len(result['courts']), 2)
+        self.assertEqual(result['waiting'], [9])
+
+        self.assertIn("error", self.service.generate_batch_matchmaking({'players': players[:3]}, 2))
+
+
+class StubProvider:
+
+    def __init__(self, name, result=None, error=None):
+        self.name = name
+        self.model = f"{name}-model"
+        self.result = result if result is not None else {"teams": [], "match": {}, "analysis": name}
+        self.error = error
+        self.calls = 0
+
+    def generate_matchmaking(self, room_data):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.result
+
+    async def agenerate_matchmaking(self, room_data):
+        return self.generate_matchmaking(room_data)
+
+
+class ProviderRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        self.registry = ProviderRegistry(min_samples=3, cooldown=30)
+        self.providers = {
+            'slow': StubProvider('slow'),
+            'fast': StubProvider('fast'),
+            'new': StubProvider('new'),
+            'local': StubProvider('local'),
+        }
+        for name, provider in self.providers.items():
+            self.registry.register(name, provider, fallback_only=name == 'local')
+
+    def test_candidates_are_ordered_by_latency(self):
+        self.registry.record('slow', 2.0, True)
+        self.registry.record('fast', 0.1, True)
+        # ตัวที่ยังไม่มีสถิติอยู่หลังตัวที่มี และ local อยู่ท้ายสุดเสมอ
+        self.assertEqual(self.registry.candidates(), ['fast', 'slow', 'new', 'local'])
+        self.assertEqual(self.registry.candidates('slow'), ['slow', 'fast', 'new', 'local'])
+
+    def test_failing_provider_is_unhealthy_until_cooldown(self):
+        with mock.patch('myapp.services.registry.time.monotonic', return_value=1000):
+            for _ in range(3):
+                self.registry.record('fast', 0.1, False)
+        self.registry.record('slow', 2.0, True)
+
+        with mock.patch('myapp.services.registry.time.monotonic', return_value=1010):
+            self.assertFalse(self.registry.is_healthy('fast'))
+            self.assertEqual(self.registry.candidates(), ['slow', 'new', 'local'])
+        with mock.patch('myapp.services.registry.time.monotonic', return_value=1030):
+            self.assertTrue(self.registry.is_healthy('fast'))
+            self.assertEqual(self.registry.candidates(), ['slow', 'fast', 'new', 'local'])
+
+    def test_provider_in_cooldown_is_not_called(self):
+        with mock.patch('myapp.services.registry.time.monotonic', return_value=1000):
+            for _ in range(3):
+                self.registry.record('fast', 0.1, False)
+        self.providers['slow'].error = ConnectionError("down")
+
+        with mock.patch('myapp.services.registry.time.monotonic', return_value=1010):
+            result = self.registry.generate_matchmaking({'players': []})
+        self.assertEqual(result['engine'], 'new')
+        self.assertEqual(self.providers['fast'].calls, 0)
+
+    def test_providers_in_cooldown_are_tried_when_none_is_healthy(self):
+        with mock.patch('myapp.services.registry.time.monotonic', return_value=1000):
+            for name in ('slow', 'fast', 'new'):
+                for _ in range(3):
+                    self.registry.record(name, 0.1, False)
+
+        with mock.patch('myapp.services.registry.time.monotonic', return_value=1010):
+            self.assertEqual(self.registry.candidates(), ['slow', 'fast', 'new', 'local'])
+            self.assertEqual(self.registry.candidates('local'), ['local', 'slow', 'fast', 'new'])
+
+    def test_falls_back_to_local(self):
+        self.providers['slow'].result = {"error": "bad output"}
+        self.providers['fast'].error = ConnectionError("down")
+        self.providers['new'].error = ConnectionError("down")
+
+        result = self.registry.generate_matchmaking({'players': []}, preferred='slow')
+        self.assertEqual(result['engine'], 'local')
+        self.assertEqual([attempt['engine'] for attempt in result['attempts']], ['slow', 'fast', 'new', 'local'])
+        self.assertEqual([attempt['ok'] for attempt in result['attempts']], [False, False, False, True])
+        self.assertEqual(self.registry.stats['fast'].outcomes[-1], False)
+
+    def test_without_fallback_only_preferred_is_tried(self):
+        self.providers['fast'].error = ConnectionError("down")
+        result = self.registry.generate_matchmaking({'players': []}, preferred='fast', fallback=False)
+        self.assertEqual(result['error'], "down")
+        self.assertEqual(result['engine'], 'fast')
+        self.assertEqual(self.providers['slow'].calls, 0)
+
+    async def test_async_path_uses_the_same_routing(self):
+        self.providers['slow'].error = ConnectionError("down")
+        result = await self.registry.agenerate_matchmaking({'players': []}, preferred='slow')
+        self.assertEqual(result['engine'], 'fast')
+        self.assertEqual([attempt['ok'] for attempt in result['attempts']], [False, True])
+        self.assertEqual(self.registry.stats['slow'].error_rate, 1.0)
+
+
+class InlineExecutor:
+    # รัน job ใน thread ของ test เพื่อให้เห็นข้อมูลใน transaction ของ TestCase
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+class MatchmakingJobTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        caches['matchmaking'].clear()
+        self.room = Room.objects.create(name="room", open_time=time(18), close_time=time(22))
+        Player.objects.bulk_create([Player(room=self.room, name=f"p{n}", skill='S') for n in range(5)])
+        patcher = mock.patch.object(jobs, 'close_old_connections')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def poll(self, job_id):
+        response = self.client.get(f'/matchmaking_jobs/{job_id}/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_submit_poll_result(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(f'/rooms/{self.room.id}/matchmaking_jobs/', {'engine': 'local'})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.data['id']
+        self.assertEqual(self.poll(job_id)['status'], MatchmakingJob.STATUS_QUEUED)
+
+        # job ถูกส่งเข้า worker pool หลัง commit เท่านั้น
+        self.assertEqual(len(callbacks), 1)
+        with mock.patch.object(jobs, 'get_executor', return_value=InlineExecutor()):
+            callbacks[0]()
+
+        job = self.poll(job_id)
+        self.assertEqual(job['status'], MatchmakingJob.STATUS_SUCCEEDED)
+        self.assertEqual(job['result']['engine'], 'local')
+        self.assertEqual(len(job['result']['teams']), 2)
+        self.assertIsNotNone(job['finished_at'])
+
+    def test_stale_running_job_is_claimed_again(self):
+        stale = MatchmakingJob.objects.create(room=self.room, engine='local', status=MatchmakingJob.STATUS_RUNNING)
+        running = MatchmakingJob.objects.create(room=self.room, engine='local', status=MatchmakingJob.STATUS_RUNNING)
+        queued = MatchmakingJob.objects.create(room=self.room, engine='local')
+        MatchmakingJob.objects.filter(pk=stale.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        MatchmakingJob.objects.filter(pk=running.pk).update(started_at=timezone.now())
+
+        self.assertEqual(jobs.pending_job_ids(), [stale.id, queued.id])
+
+        output = StringIO()
+        call_command('run_matchmaking_jobs', stdout=output)
+        self.assertIn("Processed 2 job(s)", output.getvalue())
+        statuses = dict(MatchmakingJob.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[stale.id], MatchmakingJob.STATUS_SUCCEEDED)
+        self.assertEqual(statuses[queued.id], MatchmakingJob.STATUS_SUCCEEDED)
+        # job ที่ worker อื่นเพิ่งเริ่มรันจะไม่ถูกจองซ้ำ
+        jobs.run_job(running.id)
+        self.assertEqual(MatchmakingJob.objects.get(pk=running.pk).status, MatchmakingJob.STATUS_RUNNING)
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    # ตอบ 503 พร้อม Retry-After นานมากตามจำนวนใน failures แล้วจึงตอบ 200
+    failures = 0
+    requests = 0
+
+    def do_POST(self):
+        type(self).requests += 1
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        failed = type(self).requests <= self.failures
+        body = b'{"ok": false}' if failed else b'{"ok": true}'
+        self.send_response(503 if failed else 200)
+        if failed:
+            self.send_header('Retry-After', '3600')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HttpTransportTests(SimpleTestCase):
+
+    def serve(self, failures):
+        handler = type('Handler', (FlakyHandler,), {'failures': failures, 'requests': 0})
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f'http://127.0.0.1:{server.server_port}/', handler
+
+    def test_session_is_reused_per_process(self):
+        session = http_transport.get_session()
+        self.assertIs(http_transport.get_session(), session)
+        # โปรเซสลูกหลัง fork ต้องได้ connection pool ของตัวเอง
+        with mock.patch.object(http_transport.os, 'getpid', return_value=-1):
+            self.assertIsNot(http_transport.get_session(), session)
+        http_transport._sessions.pop(-1, None)
+
+    async def test_async_client_is_reused_per_loop(self):
+        client = http_transport.get_async_client()
+        self.assertIs(http_transport.get_async_client(), client)
+        await client.aclose()
+        self.assertIsNot(http_transport.get_async_client(), client)
+        await http_transport.get_async_client().aclose()
+
+    def test_retry_delay_is_bounded(self):
+        response = httpx.Response(503, headers={'Retry-After': '3600'})
+        self.assertEqual(http_transport.retry_delay(0, response), http_transport.MAX_RETRY_DELAY)
+        self.assertEqual(http_transport.retry_delay(0, httpx.Response(503, headers={'Retry-After': '1'})), 1)
+        self.assertEqual(http_transport.retry_delay(1, httpx.Response(503)), http_transport.BACKOFF_FACTOR * 2)
+        self.assertEqual(http_transport.retry_delay(30, httpx.Response(503)), http_transport.MAX_RETRY_DELAY)
+
+    def test_sync_post_retries_status_with_bounded_retry_after(self):
+        url, handler = self.serve(failures=1)
+        session = http_transport._build_session()
+        self.addCleanup(session.close)
+        with mock.patch.object(http_transport, 'MAX_RETRY_DELAY', 0.01):
+            started = time_module.monotonic()
+            response = session.post(url, json={}, timeout=5)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(handler.requests, 2)
+        self.assertLess(time_module.monotonic() - started, 5)
+
+    def test_sync_post_returns_last_response_when_retries_run_out(self):
+        url, handler = self.serve(failures=10)
+        session = http_transport._build_session()
+        self.addCleanup(session.close)
+        with mock.patch.object(http_transport, 'MAX_RETRY_DELAY', 0.01):
+            response = session.post(url, json={}, timeout=5)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(handler.requests, http_transport.MAX_RETRIES + 1)
+
+    async def test_apost_retries_status(self):
+        statuses = [503, 429, 200]
+        requests = []
+
+        def respond(request):
+            requests.append(request)
+            return httpx.Response(statuses[len(requests) - 1], headers={'Retry-After': '3600'})
+
+        client = httpx.AsyncClient(transport=httpx.MockTransport(respond))
+        sleep = mock.AsyncMock()
+        with mock.patch.object(http_transport, 'get_async_client', return_value=client), \
+                mock.patch.object(http_transport, 'MAX_RETRIES', 2), \
+                mock.patch.object(http_transport.asyncio, 'sleep', sleep):
+            response = await http_transport.apost('http://provider/', json={})
+        await client.aclose()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(requests), 3)
+        # รอตาม Retry-After ได้ไม่เกิน MAX_RETRY_DELAY
+        self.assertEqual([call.args[0] for call in sleep.await_args_list], [http_transport.MAX_RETRY_DELAY] * 2)
+
+
+class MatchmakingCacheTests(TestCase):
+
+    def setUp(self):
+        self.client = APIClient()
+        caches['matchmaking'].clear()
+        self.room = Room.objects.create(name="room", open_time=time(18), close_time=time(22))
+        Player.objects.bulk_create([
+            Player(room=self.room, name=f"p{n}", skill=['S', 'P-'][n % 2]) for n in range(6)
+        ])
+        self.url = f'/rooms/{self.room.id}/ai_matchmaking/?engine=claude&fallback=0'
+        patcher = mock.patch.object(claude_service, 'generate_matchmaking', side_effect=self.fake_matchmaking)
+        self.generate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fake_matchmaking(self, room_data):
+        return LocalMatchmakingService().generate_matchmaking(dict(room_data, pair_history=PairHistory()))
+
+    def get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Matchmaking-Cache'], response.data['cache'])
+        return response.data
+
+    def test_hit_after_miss(self):
+        first = self.get()
+        self.assertEqual(first['cache'], 'miss')
+        second = self.get()
+        self.assertEqual(second['cache'], 'hit')
+        self.assertEqual(second['matchmaking'], first['matchmaking'])
+        self.assertEqual(self.generate.call_count, 1)
+
+        # engine อื่นใช้ key แยกกัน
+        self.assertEqual(self.client.get(f'/rooms/{self.room.id}/ai_matchmaking/?engine=local').data['cache'], 'miss')
+
+    def test_player_change_invalidates(self):
+        self.get()
+        # จำนวนลูกแบดไม่อยู่ใน fingerprint ของรายชื่อ จึงเป็น miss ได้เพราะ generation ของห้องเปลี่ยนเท่านั้น
+        player = Player.objects.filter(room=self.room).first()
+        player.number_of_shuttlecock += 1
+        player.save()
+        self.assertEqual(self.get()['cache'], 'miss')
+
+    def test_room_change_invalidates(self):
+        self.get()
+        self.room.name = "renamed"
+        self.room.save()
+        self.assertEqual(self.get()['cache'], 'miss')
+
+    def test_bulk_change_bumps_generation(self):
+        self.get()
+        generation = matchmaking_cache.room_generation(self.room.id)
+        # update() ไม่ส่ง post_save โค้ดที่แก้ผู้เล่นแบบกลุ่มจึงส่ง room_players_changed เอง
+        room_players_changed.send(sender=Room, room_id=self.room.id)
+        self.assertEqual(matchmaking_cache.room_generation(self.room.id), generation + 1)
+        self.assertEqual(self.get()['cache'], 'miss')
+
+    def test_key_depends_on_roster_not_order(self):
+        players = [local_player(n) for n in range(1, 5)]
+        key = matchmaking_cache.cache_key(self.room.id, 'local', players)
+        self.assertEqual(matchmaking_cache.cache_key(self.room.id, 'local', players[::-1]), key)
+        changed = [dict(players[0], number_of_matches=1)] + players[1:]
+        self.assertNotEqual(matchmaking_cache.cache_key(self.room.id, 'local', changed), key)
+
+    def test_fallback_result_is_not_cached(self):
+        players = [local_player(n) for n in range(1, 5)]
+        result = dict(self.fake_matchmaking({'players': players}), attempts=[])
+        self.url = f'/rooms/{self.room.id}/ai_matchmaking/?engine=auto'
+        with mock.patch.object(provider_registry, 'generate_matchmaking') as generate:
+            # auto ที่ตกไปใช้ local ต้องได้ลอง provider หลักใหม่ในครั้งถัดไป
+            generate.return_value = dict(result, engine='local')
+            self.assertEqual([self.get()['cache'], self.get()['cache']], ['miss', 'miss'])
+
+            generate.return_value = dict(result, engine='claude')
+            self.assertEqual([self.get()['cache'], self.get()['cache']], ['miss', 'hit'])
+
+        self.assertTrue(matchmaking_cache.should_cache('local', 'local'))
+        self.assertFalse(matchmaking_cache.should_cache('claude', 'ollama'))
+
+
+class AsyncMatchmakingViewTests(TestCase):
+
+    def setUp(self):
+        caches['matchmaking'].clear()
+        self.room = Room.objects.create(name="room", open_time=time(18), close_time=time(22))
+        Player.objects.bulk_create([
+            Player(room=self.room, name=f"p{n}", skill=['S', 'P-'][n % 2]) for n in range(6)
+        ])
+        self.url = f'/rooms/{self.room.id}/ai_matchmaking_async/'
+
+    async def fake_matchmaking(self, room_data):
+        return LocalMatchmakingService().generate_matchmaking(dict(room_data, pair_history=PairHistory()))
+
+    async def test_response_matches_sync_view(self):
+        with mock.patch.object(claude_service, 'agenerate_matchmaking', side_effect=self.fake_matchmaking) as generate:
+            response = await self.async_client.get(self.url, {'engine': 'claude', 'fallback': '0'})
+            cached = await self.async_client.get(self.url, {'engine': 'claude', 'fallback': '0'})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['room'], {'id': self.room.id, 'name': "room", 'player_count': 6, 'candidate_count': 6})
+        self.assertEqual(data['engine'], 'claude')
+        self.assertEqual(data['cache'], 'miss')
+        self.assertEqual(response['X-Matchmaking-Cache'], 'miss')
+        self.assertEqual(len(data['matchmaking']['teams']), 2)
+        self.assertEqual(set(data['matchmaking']), {'teams', 'match', 'analysis'})
+
+        self.assertEqual(cached.json()['cache'], 'hit')
+        self.assertEqual(cached.json()['matchmaking'], data['matchmaking'])
+        self.assertEqual(generate.call_count, 1)
+
+    async def test_local_engine_runs_in_the_event_loop(self):
+        # ประวัติคู่ถูกโหลดก่อนเรียก local engine จึงไม่ query แบบ lazy ใน event loop
+        response = await self.async_client.get(self.url, {'engine': 'local'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['engine'], 'local')
+
+    async def test_provider_error(self):
+        failure = {"error": "bad output", "raw_response": "{", "model_used": "claude"}
+        with mock.patch.object(claude_service, 'agenerate_matchmaking', return_value=failure):
+            response = await self.async_client.get(self.url, {'engine': 'claude', 'fallback': '0'})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response.json()['error'], "bad output")
+        self.assertEqual(response.json()['attempts'][0]['engine'], 'claude')
+
+    async def test_bad_requests(self):
+        self.assertEqual((await self.async_client.get(self.url, {'engine': 'nope'})).status_code, 400)
+        self.assertEqual((await self.async_client.get(self.url, {'top_k': '2'})).status_code, 400)
+        self.assertEqual((await self.async_client.get('/rooms/999999/ai_matchmaking_async/')).status_code, 404)
+
+        # error ทุกแบบใช้ json_dumps_params เดียวกับผลลัพธ์ ข้อความภาษาไทยจึงไม่ถูก escape
+        with mock.patch('myapp.views.trim_room_data', side_effect=ValueError("ผู้เล่นไม่พอ")):
+            response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 500)
+        self.assertIn("ผู้เล่นไม่พอ".encode(), response.content)
+
+        await Player.objects.filter(room=self.room).exclude(
+            pk__in=Player.objects.filter(room=self.room).values('pk')[:3]
+        ).adelete()
+        response = await self.async_client.get(self.url, {'engine': 'local'})
+        self.assertEqual(response.status_code, 400)
@@ -1,12 +1,19 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import PlayerViewSet,RoomViewSet
+from .views import PlayerViewSet,RoomViewSet,MatchmakingJobViewSet,ai_matchmaking_async
 
 router = DefaultRouter()
 router.register(r'players', PlayerViewSet)
 router.register(r'rooms', RoomViewSet)
+router.register(r'matchmaking_jobs', MatchmakingJobViewSet)
 
 urlpatterns = router.urls
 
+# endpoint แบบ async (ต้องรันผ่าน ASGI เช่น uvicorn myproject.asgi:application)
+urlpatterns += [
+    path('rooms/<int:pk>/ai_matchmaking_async/', ai_matchmaking_async, name='room-ai-matchmaking-async'),
+]
+
 # ถ้าต้องการเพิ่ม URL แบบปกติที่ไม่ใช่ API endpoints:
 # from .views import some_view_function
 # urlpatterns += [
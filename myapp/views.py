@@ -1,22 +1,129 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework import viewsets
-from .models import Room,Player
-from .serializers import RoomSerializer,PlayerSerializer
-from .services.claude_service import ClaudeService
+from rest_framework.generics import get_object_or_404
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from . import (
+    check_in, conditional, fast_read, jobs, match_results, matchmaking_cache, realtime, waiting_queue
+)
+from .filters import PlayerFilterBackend, StableOrderingFilter
+from .pagination import KeysetPagination
+from .streaming import EventStreamRenderer, astream_matchmaking_events, stream_matchmaking_events
+from .models import Room,Player,MatchmakingJob
+from .serializers import RoomSerializer,PlayerSerializer,MatchmakingJobSerializer
+from .services.candidates import trim_room_data
+from .services.local_matchmaking_service import SKILL_ORDER, skill_rank
+from .services.engines import (
+    DEFAULT_MATCHMAKING_ENGINE,
+    ENGINE_CHOICES,
+    local_matchmaking_service,
+    preferred_provider,
+    provider_registry,
+)
+
+MAX_BATCH_COURTS = 16
+
+
+def is_asgi(request):
+    """
+    request มาจาก ASGI หรือไม่ ใช้เลือก async generator ให้ StreamingHttpResponse
+    (บน ASGI generator ธรรมดาจะถูกอ่านจนจบก่อนส่ง ส่วน WSGI อ่าน async generator ไม่ได้)
+    """
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+def parse_top_k(params):
+    """
+    จำนวนผู้เล่นที่ส่งให้ provider จาก ?top_k= (0 = ส่งทุกคน) คืน None ถ้าค่าไม่ถูกต้อง
+    """
+    value = params.get('top_k')
+    if value is None:
+        return settings.MATCHMAKING_PROMPT_TOP_K
+    try:
+        top_k = int(value)
+    except ValueError:
+        return None
+    return top_k if top_k == 0 or top_k >= 4 else None
+
+
+TOP_K_ERROR = "top_k must be 0 (all players) or an integer of at least 4"
+
+# ?analysis=deferred: ตอบทีมทันที แล้วสร้างคำวิเคราะห์ใน worker (การจับคู่แบบสองขั้น)
+ANALYSIS_DEFERRED = 'deferred'
+
+def analysis_text(result, job):
+    # provider ที่ไม่มีโหมดเลือกทีมอย่างเดียว (เช่น local) ส่ง analysis มาพร้อมทีมแล้ว
+    if "analysis" in result:
+        return result["analysis"]
+    return (job.result or {}).get("analysis") if job is not None else None
+
+
+def analysis_job_data(job):
+    if job is None:
+        return None
+    return {"id": job.id, "status": job.status, "error": job.error}
+
 
-claude_service = ClaudeService()
 class RoomViewSet(viewsets.ModelViewSet):
     queryset = Room.objects.all()
     serializer_class = RoomSerializer
+    pagination_class = KeysetPagination
+    renderer_classes = [fast_read.FastJSONRenderer, BrowsableAPIRenderer]
+
+    def get_queryset(self):
+        # การสร้าง job และบันทึกผลแมชต์ใช้แค่ข้อมูลของห้อง ส่วน action อื่น serialize ผู้เล่นด้วยจึง prefetch ไว้
+        if self.action in ('matchmaking_jobs', 'record_match', 'check_in', 'events'):
+            return Room.objects.only('id', 'name')
+        if self.action == 'queue':
+            # คิวอ่านจาก heap ในหน่วยความจำ ใช้แค่ version ไว้ตรวจว่าคิวยังตรงกับฐานข้อมูล
+            return Room.objects.only('id', 'version')
+        return Room.objects.with_players()
+
+    def retrieve(self, request, *args, **kwargs):
+        # ตรวจ If-None-Match จาก version ของห้องด้วย query เดียว ก่อนแตะตารางผู้เล่นหรือ serializer
+        room = get_object_or_404(Room.objects.only('id', 'version'), pk=kwargs['pk'])
+        response = conditional.not_modified(request, conditional.room_etag(room.id, room.version))
+        if response is not None:
+            return response
+
+        rows = list(fast_read.room_values(Room.objects.filter(pk=room.id)))
+        if not rows:
+            raise Http404
+        data = fast_read.rooms_data(rows)[0]
+        # ใช้ version ของข้อมูลที่ส่งจริง เผื่อห้องเปลี่ยนระหว่าง query
+        return conditional.with_etag(Response(data), conditional.room_etag(room.id, data['version']))
+
+    def list(self, request, *args, **kwargs):
+        # อ่านด้วย values() แทนการสร้าง serializer ทีละห้องและทีละผู้เล่น ได้ JSON เดียวกัน
+        rows = fast_read.room_values(self.filter_queryset(Room.objects.all()))
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(fast_read.rooms_data(list(rows)))
+        return self.get_paginated_response(fast_read.rooms_data(page))
 
     @action(detail=True, methods=['get'])
     def ai_matchmaking(self, request, pk=None):
+        engine = request.query_params.get('engine', DEFAULT_MATCHMAKING_ENGINE)
+        if engine not in ENGINE_CHOICES:
+            return Response(
+                {"error": f"Unknown matchmaking engine: {engine}",
+                 "engines": ENGINE_CHOICES},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        top_k = parse_top_k(request.query_params)
+        if top_k is None:
+            return Response({"error": TOP_K_ERROR}, status=status.HTTP_400_BAD_REQUEST)
+        deferred = request.query_params.get('analysis') == ANALYSIS_DEFERRED
+
         room = self.get_object()
         serializer = self.get_serializer(room)
-        room_data = serializer.data
+        room_data = match_results.attach_pair_history(serializer.data)
 
         if len(room_data['players']) < 4:
             return Response(
@@ -25,34 +132,417 @@ class RoomViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            matchmaking_result = claude_service.generate_matchmaking(room_data)
+            # ผลการจับคู่ขึ้นกับผู้เล่นที่ส่งให้ provider เท่านั้น จึงใช้รายชื่อที่ตัดแล้วเป็น key ของ cache
+            # ผลแบบสองขั้นไม่มี analysis จึงแยก key ไม่ให้ปนกับผลเต็ม
+            candidates = trim_room_data(room_data, top_k)
+            cache_key = matchmaking_cache.cache_key(
+                room.id, f"{engine}:teams" if deferred else engine, candidates['players']
+            )
+            matchmaking_result = matchmaking_cache.get_result(cache_key)
+            cache_status = "hit" if matchmaking_result is not None else "miss"
+            analysis_job = None
+
+            if matchmaking_result is None:
+                generate = provider_registry.generate_teams if deferred else provider_registry.generate_matchmaking
+                matchmaking_result = generate(
+                    candidates,
+                    preferred=preferred_provider(engine),
+                    fallback=request.query_params.get('fallback', '1') != '0'
+                )
+                if "error" not in matchmaking_result and "analysis" not in matchmaking_result:
+                    # phase ที่สอง: ดึงผลได้ที่ /matchmaking_jobs/{id}/ และส่งเป็น event "analysis" ของห้อง
+                    analysis_job = MatchmakingJob.objects.create(
+                        room=room,
+                        engine=matchmaking_result["engine"],
+                        kind=MatchmakingJob.KIND_ANALYSIS,
+                        result=matchmaking_result
+                    )
+                    jobs.submit_job(analysis_job.id)
+                    matchmaking_result = {**matchmaking_result, "analysis_job": analysis_job.id}
+                if "error" not in matchmaking_result and matchmaking_cache.should_cache(
+                    engine, matchmaking_result["engine"]
+                ):
+                    matchmaking_cache.set_result(cache_key, matchmaking_result)
+            elif "analysis_job" in matchmaking_result:
+                analysis_job = MatchmakingJob.objects.filter(pk=matchmaking_result["analysis_job"]).first()
 
             if "error" in matchmaking_result:
                 return Response({
                     "room": {"id": room.id, "name": room.name},
                     "error": matchmaking_result["error"],
-                    "raw_response": matchmaking_result.get("raw_response", "")
+                    "raw_response": matchmaking_result.get("raw_response", ""),
+                    "attempts": matchmaking_result.get("attempts", [])
                 }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
             return Response({
                 "room": {
                     "id": room.id,
                     "name": room.name,
-                    "player_count": len(room_data['players'])
+                    "player_count": len(room_data['players']),
+                    "candidate_count": len(candidates['players'])
                 },
+                "engine": matchmaking_result.get("engine", engine),
+                "attempts": matchmaking_result.get("attempts", []),
+                "cache": cache_status,
                 "matchmaking": {
                     "teams": matchmaking_result["teams"],
                     "match": matchmaking_result["match"],
-                    "analysis": matchmaking_result["analysis"]
-                }
-            })
+                    "analysis": analysis_text(matchmaking_result, analysis_job)
+                },
+                **({"analysis_job": analysis_job_data(analysis_job)} if deferred else {})
+            }, headers={"X-Matchmaking-Cache": cache_status})
 
         except Exception as e:
             return Response(
                 {"error": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+    @action(detail=True, methods=['get'], renderer_classes=[JSONRenderer, EventStreamRenderer])
+    def ai_matchmaking_stream(self, request, pk=None):
+        # ส่งผลการจับคู่แบบ server-sent events ทีละทีม แทนการรอคำตอบทั้งก้อน
+        engine = request.query_params.get('engine', DEFAULT_MATCHMAKING_ENGINE)
+        if engine not in ENGINE_CHOICES:
+            return Response(
+                {"error": f"Unknown matchmaking engine: {engine}",
+                 "engines": ENGINE_CHOICES},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        top_k = parse_top_k(request.query_params)
+        if top_k is None:
+            return Response({"error": TOP_K_ERROR}, status=status.HTTP_400_BAD_REQUEST)
+
+        room = self.get_object()
+        serializer = self.get_serializer(room)
+        room_data = match_results.attach_pair_history(serializer.data)
+
+        if len(room_data['players']) < 4:
+            return Response(
+                {"error": "Need at least 4 players for matchmaking"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        stream_events = astream_matchmaking_events if is_asgi(request) else stream_matchmaking_events
+        response = StreamingHttpResponse(
+            stream_events(room, engine, room_data, top_k),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @action(detail=True, methods=['get'], renderer_classes=[JSONRenderer, EventStreamRenderer])
+    def events(self, request, pk=None):
+        # push สถานะห้องแบบ server-sent events: snapshot ครั้งแรกแล้วตามด้วย diff แทนการ poll GET /rooms/{id}/
+        # (บน ASGI ใช้ WebSocket ที่ /ws/rooms/{id}/ ได้ด้วย)
+        room = self.get_object()
+        room_events = realtime.aroom_event_stream if is_asgi(request) else realtime.room_event_stream
+        response = StreamingHttpResponse(room_events(room.id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    @action(detail=False, methods=['get'])
+    def matchmaking_providers(self, request):
+        # สถิติ latency/error ของ provider แต่ละตัวที่ registry ใช้เลือกเส้นทาง
+        return Response({
+            "order": provider_registry.candidates(),
+            "providers": provider_registry.snapshot()
+        })
+
+    @action(detail=True, methods=['get'])
+    def batch_matchmaking(self, request, pk=None):
+        # จัดหลายสนามพร้อมกันด้วย local solver ครั้งเดียว แทนการเรียก LLM ทีละสนาม
+        try:
+            courts = int(request.query_params.get('courts', 1))
+        except ValueError:
+            courts = 0
+        if not 1 <= courts <= MAX_BATCH_COURTS:
+            return Response(
+                {"error": f"courts must be an integer between 1 and {MAX_BATCH_COURTS}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        room = self.get_object()
+        serializer = self.get_serializer(room)
+        room_data = match_results.attach_pair_history(serializer.data)
+
+        if len(room_data['players']) < 4:
+            return Response(
+                {"error": "Need at least 4 players for matchmaking"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        batch_result = local_matchmaking_service.generate_batch_matchmaking(room_data, courts)
+
+        if "error" in batch_result:
+            return Response({
+                "room": {"id": room.id, "name": room.name},
+                "error": batch_result["error"]
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return Response({
+            "room": {
+                "id": room.id,
+                "name": room.name,
+                "player_count": len(room_data['players'])
+            },
+            "engine": local_matchmaking_service.model,
+            "requested_courts": courts,
+            "courts": batch_result["courts"],
+            "waiting": batch_result["waiting"]
+        })
+
+    @action(detail=True, methods=['get'])
+    def queue(self, request, pk=None):
+        # ผู้เล่นที่จะได้ลงสนามถัดไปจาก heap ของห้อง โดยไม่ต้องอ่านและเรียงผู้เล่นทั้งห้องทุกครั้ง
+        try:
+            limit = int(request.query_params.get('limit', waiting_queue.DEFAULT_QUEUE_LIMIT))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= waiting_queue.MAX_QUEUE_LIMIT:
+            return Response(
+                {"error": f"limit must be an integer between 1 and {waiting_queue.MAX_QUEUE_LIMIT}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        skill = request.query_params.get('skill')
+        bucket = skill_rank(skill) if skill else waiting_queue.ALL_SKILLS
+
+        room = self.get_object()
+        players = waiting_queue.waiting_queues.next_up(room.id, room.version, limit, bucket)
+        return Response({
+            "room": {"id": room.id, "version": room.version},
+            "skill": SKILL_ORDER[bucket] if skill else None,
+            "players": [{**player, "position": position} for position, player in enumerate(players)]
+        })
+
+    @action(detail=True, methods=['post'])
+    def record_match(self, request, pk=None):
+        # บันทึกผลแมชต์ของผู้เล่นทุกคนใน request เดียว แทนการ PATCH ผู้เล่นทีละคน
+        # ลำดับใน players: ครึ่งแรกคือทีมที่ 1 ครึ่งหลังคือทีมที่ 2 (ใช้บันทึกประวัติคู่หู/คู่แข่ง)
+        player_ids = request.data.get('players')
+        if (
+            not isinstance(player_ids, list)
+            or not 2 <= len(player_ids) <= 4
+            or not all(isinstance(i, int) and not isinstance(i, bool) for i in player_ids)
+            or len(set(player_ids)) != len(player_ids)
+        ):
+            return Response(
+                {"error": "players must be a list of 2-4 distinct player ids"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        shuttlecocks = request.data.get('shuttlecocks', 1)
+        if not isinstance(shuttlecocks, int) or isinstance(shuttlecocks, bool) or shuttlecocks < 0:
+            return Response(
+                {"error": "shuttlecocks must be a non-negative integer"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        room = self.get_object()
+        try:
+            queue = match_results.record_match(room.id, player_ids, shuttlecocks)
+        except match_results.UnknownPlayersError as e:
+            return Response(
+                {"error": str(e), "players": e.player_ids},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response({
+            "room": {"id": room.id, "name": room.name},
+            "recorded": player_ids,
+            "queue": PlayerSerializer(queue, many=True).data
+        })
+
+    @action(detail=True, methods=['post'])
+    def check_in(self, request, pk=None):
+        # เช็คอินผู้เล่นหลายคนใน request เดียว body เป็น JSON array หรือ CSV ที่มี header name,skill
+        # อ่าน request.stream โดยตรงทีละ chunk จึงไม่ต้องโหลดและ parse body ทั้งก้อนผ่าน request.data
+        content_type = (request.content_type or '').split(';')[0].strip()
+        if content_type == 'text/csv':
+            parse_rows = check_in.iter_csv_rows
+        elif content_type == 'application/json':
+            parse_rows = check_in.iter_json_rows
+        else:
+            return Response(
+                {"error": "Content-Type must be application/json or text/csv"},
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+
+        room = self.get_object()
+        if request.stream is None:
+            return Response({"error": "No players in request body"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            players, errors = check_in.check_in_players(room.id, parse_rows(request.stream))
+        except check_in.CheckInParseError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if errors:
+            return Response({
+                "error": "Some rows are invalid, no players were created",
+                "rows": errors
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            "room": {"id": room.id, "name": room.name},
+            "created": len(players),
+            "players": PlayerSerializer(players, many=True).data
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def matchmaking_jobs(self, request, pk=None):
+        # สร้าง job แล้วตอบกลับทันที ให้ client poll ผลที่ /matchmaking_jobs/{id}/
+        engine = request.data.get('engine') or request.query_params.get('engine', DEFAULT_MATCHMAKING_ENGINE)
+        if engine not in ENGINE_CHOICES:
+            return Response(
+                {"error": f"Unknown matchmaking engine: {engine}",
+                 "engines": ENGINE_CHOICES},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        room = self.get_object()
+        job = MatchmakingJob.objects.create(room=room, engine=engine)
+        jobs.submit_job(job.id)
+
+        return Response(MatchmakingJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
 class PlayerViewSet(viewsets.ModelViewSet):
     queryset = Player.objects.all()
     serializer_class = PlayerSerializer
+    pagination_class = KeysetPagination
+    renderer_classes = [fast_read.FastJSONRenderer, BrowsableAPIRenderer]
+    filter_backends = [PlayerFilterBackend, StableOrderingFilter]
+    ordering_fields = ['number_of_matches', 'join_time', 'id']
+    ordering = ['id']
+
+    def retrieve(self, request, *args, **kwargs):
+        room_id, version = get_object_or_404(
+            Player.objects.values_list('room_id', 'room__version'), pk=kwargs['pk']
+        )
+        etag = conditional.room_etag(room_id, version, f"player-{kwargs['pk']}")
+        response = conditional.not_modified(request, etag)
+        if response is not None:
+            return response
+
+        row = fast_read.player_values(Player.objects.filter(pk=kwargs['pk'])).first()
+        if row is None:
+            raise Http404
+        return conditional.with_etag(Response(fast_read.PLAYER_MAPPER.to_data(row)), etag)
+
+    def list_players(self, request):
+        rows = fast_read.player_values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is None:
+            return Response(fast_read.players_data(rows))
+        return self.get_paginated_response(fast_read.players_data(page))
+
+    def list(self, request, *args, **kwargs):
+        # รายการผู้เล่นของห้องเดียว (?room=) ใช้ version ของห้องเป็น ETag ได้ รายการข้ามห้องไม่มี ETag
+        if 'room' not in request.query_params:
+            return self.list_players(request)
+
+        room_id = PlayerFilterBackend().integer(request.query_params, 'room')
+        version = Room.objects.filter(pk=room_id).values_list('version', flat=True).first()
+        if version is None:
+            return self.list_players(request)
+
+        etag = conditional.room_etag(room_id, version, conditional.query_variant(request))
+        return conditional.not_modified(request, etag) or conditional.with_etag(self.list_players(request), etag)
+
+class MatchmakingJobViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = MatchmakingJob.objects.all()
+    serializer_class = MatchmakingJobSerializer
+
+
+async def ai_matchmaking_async(request, pk):
+    """
+    ai_matchmaking แบบ async สำหรับรันบน ASGI ระหว่างรอ LLM จะไม่กิน worker thread
+    ผลลัพธ์มีรูปแบบเดียวกับ RoomViewSet.ai_matchmaking
+    """
+    json_params = {"ensure_ascii": False}
+
+    engine = request.GET.get('engine', DEFAULT_MATCHMAKING_ENGINE)
+    if engine not in ENGINE_CHOICES:
+        return JsonResponse(
+            {"error": f"Unknown matchmaking engine: {engine}",
+             "engines": ENGINE_CHOICES},
+            status=status.HTTP_400_BAD_REQUEST,
+            json_dumps_params=json_params
+        )
+    top_k = parse_top_k(request.GET)
+    if top_k is None:
+        return JsonResponse({"error": TOP_K_ERROR}, status=status.HTTP_400_BAD_REQUEST, json_dumps_params=json_params)
+
+    try:
+        room = await Room.objects.with_players().aget(pk=pk)
+    except Room.DoesNotExist:
+        return JsonResponse(
+            {"detail": "No Room matches the given query."},
+            status=status.HTTP_404_NOT_FOUND,
+            json_dumps_params=json_params
+        )
+
+    # players ถูก prefetch มาแล้ว การ serialize จึงไม่ query ฐานข้อมูลเพิ่ม
+    room_data = RoomSerializer(room).data
+
+    if len(room_data['players']) < 4:
+        return JsonResponse(
+            {"error": "Need at least 4 players for matchmaking"},
+            status=status.HTTP_400_BAD_REQUEST,
+            json_dumps_params=json_params
+        )
+
+    try:
+        candidates = trim_room_data(room_data, top_k)
+        cache_key = await matchmaking_cache.acache_key(room.id, engine, candidates['players'])
+        matchmaking_result = await matchmaking_cache.aget_result(cache_key)
+        cache_status = "hit" if matchmaking_result is not None else "miss"
+
+        if matchmaking_result is None:
+            # local engine ทำงานใน event loop จึงโหลดประวัติคู่ไว้ก่อนแทนการ query แบบ lazy
+            candidates['pair_history'] = await sync_to_async(match_results.load_pair_history)(room.id)
+            matchmaking_result = await provider_registry.agenerate_matchmaking(
+                candidates,
+                preferred=preferred_provider(engine),
+                fallback=request.GET.get('fallback', '1') != '0'
+            )
+            if "error" not in matchmaking_result and matchmaking_cache.should_cache(
+                engine, matchmaking_result["engine"]
+            ):
+                await matchmaking_cache.aset_result(cache_key, matchmaking_result)
+
+        if "error" in matchmaking_result:
+            return JsonResponse({
+                "room": {"id": room.id, "name": room.name},
+                "error": matchmaking_result["error"],
+                "raw_response": matchmaking_result.get("raw_response", ""),
+                "attempts": matchmaking_result.get("attempts", [])
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR, json_dumps_params=json_params)
+
+        response = JsonResponse({
+            "room": {
+                "id": room.id,
+                "name": room.name,
+                "player_count": len(room_data['players']),
+                "candidate_count": len(candidates['players'])
+            },
+            "engine": matchmaking_result.get("engine", engine),
+            "attempts": matchmaking_result.get("attempts", []),
+            "cache": cache_status,
+            "matchmaking": {
+                "teams": matchmaking_result["teams"],
+                "match": matchmaking_result["match"],
+                "analysis": matchmaking_result["analysis"]
+            }
+        }, json_dumps_params=json_params)
+        response["X-Matchmaking-Cache"] = cache_status
+        return response
 
+    except Exception as e:
+        return JsonResponse(
+            {"error": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            json_dumps_params=json_params
+        )
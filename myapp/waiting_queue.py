@@ -0,0 +1,147 @@
+import heapq
+import threading
+
+from django.db.models import Expression
+
+from . import fast_read
+from .models import Player
+from .services.local_matchmaking_service import skill_rank
+
+# ค่าเริ่มต้นพอสำหรับสองสนาม
+DEFAULT_QUEUE_LIMIT = 8
+MAX_QUEUE_LIMIT = 200
+# สร้าง heap ใหม่เมื่อมีรายการที่ถูกลบ/เลื่อนค้างอยู่มากกว่าผู้เล่นจริง
+COMPACT_FACTOR = 2
+MIN_COMPACT_SIZE = 32
+ALL_SKILLS = None
+
+
+class RoomQueue:
+    """
+    คิวรอลงสนามของห้องเดียว: heap ของทั้งห้องและ heap แยกตามระดับทักษะ
+    เรียงตาม (จำนวนแมชต์, เวลาเข้าร่วม, id) แบบเดียวกับ Player.objects.in_queue_order()
+    การแก้ไขเป็นแบบ lazy: push รายการใหม่แล้วทิ้งรายการเก่าเมื่อถูก pop ออกมา
+    """
+
+    def __init__(self, version):
+        self.version = version
+        # player_id -> (key, bucket, data)
+        self.entries = {}
+        self.heaps = {ALL_SKILLS: []}
+
+    def upsert(self, data, join_time):
+        # join_time เป็น datetime จริงจากฐานข้อมูล (ใน data เป็นข้อความที่ serialize แล้ว)
+        key = (data['number_of_matches'], join_time, data['id'])
+        bucket = skill_rank(data['skill'])
+        current = self.entries.get(data['id'])
+        self.entries[data['id']] = (key, bucket, data)
+        if current is not None and current[0] == key and current[1] == bucket:
+            return
+        heapq.heappush(self.heaps[ALL_SKILLS], (key, data['id']))
+        heapq.heappush(self.heaps.setdefault(bucket, []), (key, data['id']))
+
+    def remove(self, player_id):
+        self.entries.pop(player_id, None)
+
+    def _is_current(self, item, bucket):
+        entry = self.entries.get(item[1])
+        return entry is not None and entry[0] == item[0] and (bucket is ALL_SKILLS or entry[1] == bucket)
+
+    def next_up(self, limit, bucket=ALL_SKILLS):
+        """
+        ผู้เล่น limit คนแรกในคิว: pop รายการที่ยังใช้ได้แล้ว push กลับ O((limit + รายการเก่า) log n)
+        """
+        heap = self.heaps.get(bucket, [])
+        taken = []
+        while heap and len(taken) < limit:
+            item = heapq.heappop(heap)
+            if self._is_current(item, bucket):
+                taken.append(item)
+        for item in taken:
+            heapq.heappush(heap, item)
+        return [self.entries[player_id][2] for _, player_id in taken]
+
+    def compact(self):
+        # O(n) ต่อครั้ง แต่เกิดเมื่อรายการเก่าสะสมเกินจำนวนผู้เล่นเท่านั้น จึงเฉลี่ยแล้วไม่เพิ่มต้นทุนต่อการแก้ไข
+        for bucket, heap in self.heaps.items():
+            if len(heap) > COMPACT_FACTOR * len(self.entries) + MIN_COMPACT_SIZE:
+                heap = [item for item in heap if self._is_current(item, bucket)]
+                heapq.heapify(heap)
+                self.heaps[bucket] = heap
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class WaitingQueues:
+    """
+    คิวของทุกห้องในโปรเซสนี้ อัปเดตทีละผู้เล่นจาก signal หลัง commit
+    version ของห้องบอกว่าคิวตรงกับฐานข้อมูลหรือไม่ ถ้าไม่ตรง (เช่น worker อื่นแก้ผู้เล่น) จะสร้างใหม่จากฐานข้อมูล
+    """
+
+    def __init__(self):
+        self.rooms = {}
+        self.lock = threading.Lock()
+
+    def next_up(self, room_id, version, limit, bucket=ALL_SKILLS):
+        with self.lock:
+            queue = self.rooms.get(room_id)
+            if queue is not None and queue.version == version:
+                return queue.next_up(limit, bucket)
+
+        # อ่าน version มาก่อนแถวผู้เล่นแล้ว ผู้เล่นที่โหลดจึงใหม่เท่ากับหรือใหม่กว่า version นี้เสมอ
+        queue = RoomQueue(version)
+        for data, join_time in load_players(Player.objects.filter(room_id=room_id)):
+            queue.upsert(data, join_time)
+        with self.lock:
+            self.rooms[room_id] = queue
+            return queue.next_up(limit, bucket)
+
+    def apply(self, room_id, upserts=(), removals=()):
+        """
+        ใช้การเปลี่ยนแปลงของผู้เล่นหนึ่งครั้ง ซึ่งเพิ่ม version ของห้องหนึ่งขั้นเสมอ
+        upserts เป็นรายการ (data, join_time) จาก queue_item()
+        ถ้ายังไม่มีคิวของห้องในโปรเซสนี้จะไม่ทำอะไร (สร้างเมื่อมีคนอ่าน)
+        """
+        with self.lock:
+            queue = self.rooms.get(room_id)
+            if queue is None:
+                return
+            for player_id in removals:
+                queue.remove(player_id)
+            for data, join_time in upserts:
+                queue.upsert(data, join_time)
+            queue.compact()
+            queue.version += 1
+
+    def has_room(self, room_id):
+        return room_id in self.rooms
+
+    def discard(self, room_id):
+        with self.lock:
+            self.rooms.pop(room_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.rooms.clear()
+
+
+waiting_queues = WaitingQueues()
+
+
+def queue_item(row):
+    return fast_read.PLAYER_MAPPER.to_data(row), row['join_time']
+
+
+def instance_item(player):
+    """
+    ข้อมูลคิวจาก Player ที่เพิ่ง save ถ้าค่าใดเป็น F() (ยังไม่รู้ค่าจริง) คืน None
+    """
+    row = {column: getattr(player, column) for column in fast_read.PLAYER_MAPPER.columns}
+    if any(isinstance(value, Expression) for value in row.values()):
+        return None
+    return queue_item(row)
+
+
+def load_players(queryset):
+    return [queue_item(row) for row in fast_read.player_values(queryset)]
@@ -13,4 +13,15 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# import หลัง setup ของ Django เพราะ realtime ใช้ models
+from myapp.realtime import websocket_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # Django รองรับเฉพาะ HTTP ส่วน WebSocket ของห้อง (/ws/rooms/<id>/) ส่งต่อให้ realtime
+    if scope['type'] == 'websocket':
+        await websocket_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
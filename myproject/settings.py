@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -85,12 +87,107 @@ WSGI_APPLICATION = 'myproject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# เลือก backend ด้วย DATABASE_ENGINE=sqlite (ค่าเริ่มต้น) หรือ postgres
+
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'sqlite')
+
+# SQLite: WAL ให้อ่านระหว่างเขียนได้, busy timeout ให้รอ lock แทนการ error ทันที
+# และ IMMEDIATE ให้ transaction จอง write lock ตั้งแต่เริ่ม จึงไม่ติด "database is locked"
+# ตอนเปลี่ยนจากอ่านเป็นเขียนเมื่อหลายสนามบันทึกผลพร้อมกัน
+SQLITE_BUSY_TIMEOUT = float(os.environ.get('SQLITE_BUSY_TIMEOUT', 20))
+SQLITE_OPTIONS = {
+    'init_command': ';'.join([
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f'PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT * 1000)}',
+        f"PRAGMA cache_size=-{int(os.environ.get('SQLITE_CACHE_SIZE_KB', 20000))}",
+        'PRAGMA temp_store=MEMORY',
+    ]),
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': SQLITE_BUSY_TIMEOUT,
+}
+
+if DATABASE_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+            # ใช้ connection เดิมซ้ำระหว่าง request แทนการเปิดใหม่ทุกครั้ง
+            'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': SQLITE_OPTIONS,
+        }
     }
+elif DATABASE_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DATABASE_NAME', 'kuanbad'),
+            'USER': os.environ.get('DATABASE_USER', 'postgres'),
+            'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+            'HOST': os.environ.get('DATABASE_HOST', 'localhost'),
+            'PORT': os.environ.get('DATABASE_PORT', '5432'),
+            'CONN_HEALTH_CHECKS': True,
+        }
+    }
+    if os.environ.get('DATABASE_POOL', '1') != '0':
+        # connection pool ของ psycopg 3 (ต้องติดตั้ง psycopg[pool]) ใช้ร่วมกับ CONN_MAX_AGE ไม่ได้
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.environ.get('DATABASE_POOL_MAX_SIZE', 20)),
+                'timeout': float(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
+            },
+        }
+    else:
+        DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DATABASE_CONN_MAX_AGE', 600))
+else:
+    raise ImproperlyConfigured(f"Unknown DATABASE_ENGINE: {DATABASE_ENGINE} (expected sqlite or postgres)")
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# ผลการจับคู่ถูก cache ตาม fingerprint ของรายชื่อผู้เล่นในห้อง
+# LocMemCache จะลบรายการที่ใช้ล่าสุดน้อยที่สุดออกเมื่อเกิน MAX_ENTRIES (LRU)
+# LocMemCache แยกกันในแต่ละโปรเซส รวมถึงตัวนับ generation ที่ใช้ล้าง cache เมื่อรายชื่อเปลี่ยน
+# จึงถูกต้องเฉพาะเมื่อรันโปรเซสเดียว ถ้ารันหลาย worker (gunicorn/uvicorn --workers > 1) ต้องตั้ง
+# MATCHMAKING_CACHE_BACKEND เป็น backend ที่ใช้ร่วมกัน เช่น django.core.cache.backends.redis.RedisCache
+# และ MATCHMAKING_CACHE_LOCATION=redis://... ไม่อย่างนั้นโปรเซสอื่นจะคืนผลเก่าจนกว่าจะหมด TTL
+MATCHMAKING_CACHE_ALIAS = 'matchmaking'
+MATCHMAKING_CACHE_BACKEND = os.environ.get(
+    'MATCHMAKING_CACHE_BACKEND',
+    'django.core.cache.backends.locmem.LocMemCache'
+)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    MATCHMAKING_CACHE_ALIAS: {
+        'BACKEND': MATCHMAKING_CACHE_BACKEND,
+        'LOCATION': os.environ.get('MATCHMAKING_CACHE_LOCATION', 'matchmaking'),
+        'TIMEOUT': int(os.environ.get('MATCHMAKING_CACHE_TTL', 300)),
+    },
 }
+if MATCHMAKING_CACHE_BACKEND.endswith('.LocMemCache'):
+    # OPTIONS ของ backend อื่น (เช่น redis) ถูกส่งต่อให้ client จึงใส่ MAX_ENTRIES เฉพาะ LocMemCache
+    CACHES[MATCHMAKING_CACHE_ALIAS]['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.environ.get('MATCHMAKING_CACHE_MAX_ENTRIES', 1000)),
+    }
+
+
+# จำนวน worker thread ที่รัน matchmaking job ต่อโปรเซส
+MATCHMAKING_JOB_WORKERS = int(os.environ.get('MATCHMAKING_JOB_WORKERS', 4))
+
+# job ที่อยู่ในสถานะ running นานเกินนี้ (วินาที) ถือว่า worker ตายระหว่างรัน เช่นโปรเซสถูกรีสตาร์ต
+# และจะถูกจองใหม่ได้ ควรนานกว่าเวลาที่ provider ใช้ตอบมาก
+MATCHMAKING_JOB_STALE_SECONDS = int(os.environ.get('MATCHMAKING_JOB_STALE_SECONDS', 600))
+
+# ส่งเฉพาะผู้เล่น K คนที่มีสิทธิ์ลงสนามมากที่สุดให้ provider ขนาด prompt จึงไม่โตตามจำนวนคนในห้อง
+# (0 = ส่งทุกคน) แต่ละ request เปลี่ยนได้ด้วย ?top_k=
+MATCHMAKING_PROMPT_TOP_K = int(os.environ.get('MATCHMAKING_PROMPT_TOP_K', 16))
 
 
 # Password validation